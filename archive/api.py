@@ -1,16 +1,264 @@
-from django.http.response import HttpResponseNotAllowed, HttpResponseBadRequest, JsonResponse
+import json
+from collections import namedtuple
 
-from archive.models import RecordTag
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http.response import HttpResponseNotAllowed, HttpResponseBadRequest, JsonResponse, \
+    StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
+
+from archive.jobs import get_pending
+from archive.models import Collection, DerivativeJob, Record, RecordFile, RecordTag
+from archive.pagination import KeysetPaginator
+from archive.tag_index import search_tags
+
+# value(request, obj) returns the JSON value of a field, the remaining members are what the queryset has to load for it
+ApiField = namedtuple('ApiField', ['value', 'only', 'select_related', 'prefetch_related'], defaults=[(), (), ()])
+
+
+def get_file_url(request, file):
+    return request.build_absolute_uri(file.url) if file else None
+
+
+def get_file_data(request, record_file):
+    return {
+        'id': record_file.pk,
+        'file': get_file_url(request, record_file.file),
+        'content_type': record_file.content_type,
+        'size_bytes': record_file.size_bytes,
+        'checksum': record_file.checksum or None,
+        'thumbnail': get_file_url(request, record_file.thumbnail),
+        'preview': get_file_url(request, record_file.preview),
+        'updated_at': record_file.updated_at,
+    }
+
+
+COLLECTION_FIELDS = {
+    'id': ApiField(lambda request, collection: collection.pk),
+    'url': ApiField(lambda request, collection: request.build_absolute_uri(collection.get_absolute_url())),
+    'name': ApiField(lambda request, collection: collection.name, ['name']),
+    'description': ApiField(lambda request, collection: collection.description, ['description']),
+    'public': ApiField(lambda request, collection: collection.public, ['public']),
+    'updated_at': ApiField(lambda request, collection: collection.updated_at, ['updated_at']),
+    # anonymous users only learn about public records, like on the collection list
+    'record_count': ApiField(lambda request, collection: collection.record_count if request.user.is_authenticated
+                             else collection.public_record_count, ['record_count', 'public_record_count']),
+}
+
+RECORD_FIELDS = {
+    'id': ApiField(lambda request, record: record.pk),
+    'url': ApiField(lambda request, record: request.build_absolute_uri(record.get_absolute_url()), ['collection']),
+    'title': ApiField(lambda request, record: record.title, ['title']),
+    'description': ApiField(lambda request, record: record.description, ['description']),
+    'category': ApiField(lambda request, record: {'id': record.category_id, 'name': record.category.name},
+                         ['category__name'], ['category']),
+    'collection': ApiField(lambda request, record: record.collection_id, ['collection']),
+    'physical_location': ApiField(lambda request, record: record.physical_location, ['physical_location']),
+    'physical_signature': ApiField(lambda request, record: record.physical_signature, ['physical_signature']),
+    'origin_date': ApiField(lambda request, record: record.origin_date, ['origin_date']),
+    'created_at': ApiField(lambda request, record: record.created_at, ['created_at']),
+    'updated_at': ApiField(lambda request, record: record.updated_at, ['updated_at']),
+    'public': ApiField(lambda request, record: record.public, ['public']),
+    'media_kind': ApiField(lambda request, record: record.media_kind or None, ['media_kind']),
+    'tags': ApiField(lambda request, record: [tag.name for tag in record.tags.all()], [], [],
+                     [Prefetch('tags', queryset=RecordTag.objects.order_by('name'))]),
+    'files': ApiField(lambda request, record: [get_file_data(request, record_file)
+                                               for record_file in record.recordfile_set.all()], [], [],
+                      [Prefetch('recordfile_set', queryset=RecordFile.objects.order_by('pk'))]),
+}
+
+FILE_FIELDS = {
+    'id': ApiField(lambda request, record_file: record_file.pk),
+    'file': ApiField(lambda request, record_file: get_file_url(request, record_file.file), ['file']),
+    'content_type': ApiField(lambda request, record_file: record_file.content_type, ['content_type']),
+    'size_bytes': ApiField(lambda request, record_file: record_file.size_bytes, ['size_bytes']),
+    'checksum': ApiField(lambda request, record_file: record_file.checksum or None, ['checksum']),
+    'thumbnail': ApiField(lambda request, record_file: get_file_url(request, record_file.thumbnail), ['thumbnail']),
+    'preview': ApiField(lambda request, record_file: get_file_url(request, record_file.preview), ['preview']),
+    'updated_at': ApiField(lambda request, record_file: record_file.updated_at, ['updated_at']),
+}
+
+TAG_FIELDS = {
+    'id': ApiField(lambda request, tag: tag.pk),
+    'name': ApiField(lambda request, tag: tag.name, ['name']),
+}
+
+
+class Resource:
+    def __init__(self, fields, ordering):
+        self.fields = fields
+        self.ordering = ordering
+
+    def get_field_names(self, request):
+        if not request.GET.get('fields'):
+            return list(self.fields)
+        names = [name.strip() for name in request.GET['fields'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise BadRequest(f'Unknown fields: {", ".join(unknown)}')
+        return names
+
+    def get_queryset(self, queryset, names):
+        # only load the columns and relations of the requested fields
+        fields = [self.fields[name] for name in names]
+        only = {'pk', self.ordering.lstrip('-')}.union(*(field.only for field in fields))
+        queryset = queryset.only(*only)
+        select_related = [name for field in fields for name in field.select_related]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        prefetch_related = [lookup for field in fields for lookup in field.prefetch_related]
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    def serialize(self, request, obj, names):
+        return {name: self.fields[name].value(request, obj) for name in names}
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET.get('limit', settings.API_PAGE_SIZE))
+        except ValueError:
+            raise BadRequest('Invalid limit')
+        return max(1, min(page_size, settings.API_MAX_PAGE_SIZE))
+
+    def list_response(self, request, queryset):
+        names = self.get_field_names(request)
+        queryset = self.get_queryset(queryset, names)
+        if request.GET.get('format') == 'ndjson':
+            return StreamingHttpResponse(self.stream(request, queryset, names), content_type='application/x-ndjson')
+
+        page = KeysetPaginator(queryset, self.ordering, self.get_page_size(request)).get_page(request.GET.get('cursor'))
+        next_url = None
+        if page.has_next():
+            query = request.GET.copy()
+            query['cursor'] = page.next_cursor
+            next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+        return JsonResponse({'results': [self.serialize(request, obj, names) for obj in page], 'next': next_url})
+
+    def stream(self, request, queryset, names):
+        # exports every object page by page, so memory is bounded by one page regardless of the result size
+        paginator = KeysetPaginator(queryset, self.ordering, settings.API_STREAM_CHUNK_SIZE)
+        page = paginator.get_page()
+        while True:
+            yield ''.join(json.dumps(self.serialize(request, obj, names), cls=DjangoJSONEncoder) + '\n'
+                          for obj in page)
+            if not page.has_next():
+                break
+            page = paginator.get_page(page.next_cursor)
+
+    def detail_response(self, request, queryset, **lookup):
+        names = self.get_field_names(request)
+        obj = get_object_or_404(self.get_queryset(queryset, names), **lookup)
+        return JsonResponse(self.serialize(request, obj, names))
+
+
+collections = Resource(COLLECTION_FIELDS, 'updated_at')
+records = Resource(RECORD_FIELDS, 'updated_at')
+files = Resource(FILE_FIELDS, 'updated_at')
+tags = Resource(TAG_FIELDS, 'name')
+
+
+# visibility follows the HTML views: anonymous users see public records of public collections only
+def get_collections(request):
+    if not request.user.is_authenticated:
+        return Collection.objects.filter(public=True)
+    return Collection.objects.all()
+
+
+def get_records(request, collection_id):
+    queryset = Record.objects.filter(collection_id=collection_id)
+    if not request.user.is_authenticated:
+        queryset = queryset.filter(collection__public=True, public=True)
+    return queryset
+
+
+@require_GET
+def collection_list(request):
+    return collections.list_response(request, get_collections(request))
+
+
+@require_GET
+def collection_detail(request, pk):
+    return collections.detail_response(request, get_collections(request), pk=pk)
+
+
+@require_GET
+def record_list(request, collection_id):
+    collection = get_object_or_404(get_collections(request).only('pk'), pk=collection_id)
+    return records.list_response(request, get_records(request, collection.pk))
+
+
+@require_GET
+def record_detail(request, collection_id, pk):
+    return records.detail_response(request, get_records(request, collection_id), pk=pk)
+
+
+@require_GET
+def file_list(request, collection_id, record_id):
+    record = get_object_or_404(get_records(request, collection_id).only('pk'), pk=record_id)
+    return files.list_response(request, RecordFile.objects.filter(record=record))
+
+
+@require_GET
+def tag_list(request):
+    return tags.list_response(request, RecordTag.objects.all())
+
+
+def get_job_data(request, job):
+    data = {
+        'kind': job.kind,
+        'state': job.state,
+        'attempts': job.attempts,
+        'queued_at': job.queued_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'duration': job.get_duration(),
+    }
+    if job.kind == DerivativeJob.Kind.TRANSCODE and job.state == DerivativeJob.State.RUNNING:
+        data['progress'] = job.progress
+    # error messages contain paths of the server
+    if request.user.is_authenticated:
+        data['error'] = job.error
+    return data
+
+
+@require_GET
+def record_derivatives(request, collection_id, pk):
+    # polled by the record page until all derivatives of its files are done
+    record = get_object_or_404(get_records(request, collection_id).only('pk'), pk=pk)
+    record_jobs = DerivativeJob.objects.filter(record_file__record=record)
+    files = {}
+    for job in record_jobs.order_by('record_file', 'kind'):
+        files.setdefault(job.record_file_id, []).append(get_job_data(request, job))
+    data = {
+        # lost jobs stay running until they are queued again, they aren't waited for
+        'pending': record_jobs.filter(get_pending()).exists(),
+        'files': [{'id': record_file_id, 'jobs': file_jobs} for record_file_id, file_jobs in files.items()],
+    }
+    response = JsonResponse(data, encoder=DjangoJSONEncoder)
+    patch_cache_control(response, no_cache=True, no_store=True, private=True)
+    return response
 
 
 def tag_autocomplete(request):
     if request.method != 'GET':
         return HttpResponseNotAllowed(['GET'])
 
-    q = request.GET.get('q')
+    q = request.GET.get('q', '').strip()
     if not q:
         return HttpResponseBadRequest()
 
-    tags = RecordTag.objects.filter(name__istartswith=q)
-    data = [{'name': tag.name} for tag in tags]
-    return JsonResponse(data, status=200, safe=False)
+    try:
+        limit = int(request.GET.get('limit', settings.TAG_AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest()
+    limit = max(1, min(limit, settings.TAG_AUTOCOMPLETE_LIMIT))
+
+    data = [{'name': name, 'count': count} for name, count in search_tags(q, limit)]
+    response = JsonResponse(data, status=200, safe=False)
+    patch_cache_control(response, public=True, max_age=settings.TAG_AUTOCOMPLETE_MAX_AGE)
+    return response
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+GLOBAL_GENERATION_KEY = 'archive:generation'
+TAG_GENERATION_KEY = 'archive:tags:generation'
+FACET_STATS_KEYS = {'hits': 'archive:facets:hits', 'misses': 'archive:facets:misses'}
+
+
+def _collection_generation_key(collection_id):
+    return f'archive:collection:{collection_id}:generation'
+
+
+def _increment(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def get_generation(key):
+    generation = cache.get(key)
+    if generation is None:
+        # start from the current time, so an evicted counter can't repeat a previous generation
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key):
+    get_generation(key)
+    return _increment(key)
+
+
+def get_collection_generation(collection_id):
+    return get_generation(_collection_generation_key(collection_id))
+
+
+def bump_collection_generation(collection_id):
+    return bump_generation(_collection_generation_key(collection_id))
+
+
+def get_global_generation():
+    return get_generation(GLOBAL_GENERATION_KEY)
+
+
+def bump_global_generation():
+    return bump_generation(GLOBAL_GENERATION_KEY)
+
+
+def get_tag_generation():
+    return get_generation(TAG_GENERATION_KEY)
+
+
+def bump_tag_generation():
+    return bump_generation(TAG_GENERATION_KEY)
+
+
+class FacetCache:
+    def __init__(self, collection_id, visibility):
+        self.collection_id = collection_id
+        self.visibility = visibility
+
+    def get_key(self, filter_data):
+        filter_hash = hashlib.md5(json.dumps(filter_data, sort_keys=True).encode()).hexdigest()
+        return f'archive:facets:{self.collection_id}:{get_collection_generation(self.collection_id)}:' \
+               f'{get_global_generation()}:{self.visibility}:{filter_hash}'
+
+    def get_or_compute(self, filter_data, compute):
+        key = self.get_key(filter_data)
+        facets = cache.get(key)
+        if facets is not None:
+            _increment(FACET_STATS_KEYS['hits'])
+            return facets
+
+        _increment(FACET_STATS_KEYS['misses'])
+        facets = compute()
+        cache.set(key, facets, settings.FACET_CACHE_TIMEOUT)
+        return facets
+
+
+def get_facet_cache_stats():
+    stats = {name: cache.get(key, 0) for name, key in FACET_STATS_KEYS.items()}
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+    return stats
+
+
+def reset_facet_cache_stats():
+    cache.delete_many(FACET_STATS_KEYS.values())
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+from archive.video import HLS_BITRATES
+
+# backends whose entries are only visible to the process that wrote them
+PROCESS_LOCAL_CACHES = ['django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache']
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # generations, tag index versions and OCR locks are written by the Celery workers and read by all web processes
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Error('The default cache is local to each process.',
+                  hint='Set CACHE_URL to a cache shared by the web and Celery processes, '
+                       'e.g. redis://localhost:6379/1.',
+                  id='archive.E001')]
+
+
+@register()
+def check_hls_heights(app_configs, **kwargs):
+    # steps without a bitrate are left out of the ladder
+    unknown = [height for height in settings.VIDEO_HLS_HEIGHTS if height not in HLS_BITRATES]
+    hint = f'VIDEO_HLS_HEIGHTS may contain {", ".join(str(height) for height in HLS_BITRATES)}.'
+    if len(unknown) == len(settings.VIDEO_HLS_HEIGHTS):
+        return [Error('VIDEO_HLS_HEIGHTS contains no height with a bitrate.', hint=hint, id='archive.E002')]
+    if unknown:
+        return [Warning(f'VIDEO_HLS_HEIGHTS contains heights without a bitrate: {unknown}.', hint=hint,
+                        id='archive.W001')]
+    return []
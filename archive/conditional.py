@@ -0,0 +1,105 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+
+from archive.cache import get_collection_generation, get_global_generation, get_tag_generation
+from archive.models import Collection, Record
+
+
+def get_visibility_class(request):
+    if not request.user.is_authenticated:
+        return 'public'
+    # pages of authenticated users contain their name, their permissions and a CSRF token
+    return f'user:{request.user.pk}:{request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")}'
+
+
+def conditional_page(get_state):
+    # get_state returns a dict of the change stamps of everything shown on the page, or None if the page doesn't
+    # exist for the user; it runs once per request and is shared by the ETag and Last-Modified functions
+    def state(request, *args, **kwargs):
+        if not hasattr(request, '_page_state'):
+            request._page_state = get_state(request, *args, **kwargs)
+        return request._page_state
+
+    def etag(request, *args, **kwargs):
+        page_state = state(request, *args, **kwargs)
+        if page_state is None:
+            return None
+        data = [sorted(page_state.items()), get_global_generation(), get_visibility_class(request),
+                sorted(request.GET.lists())]
+        return hashlib.md5(json.dumps(data, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        page_state = state(request, *args, **kwargs)
+        if page_state is None:
+            return None
+        return max((value for key, value in page_state.items() if key.endswith('updated_at') and value), default=None)
+
+    def decorator(view):
+        # deletions and visibility changes don't advance any timestamp, only the ETag covers them; so Last-Modified
+        # is sent for information but not validated, an If-Modified-Since without If-None-Match gets the full page
+        conditional_view = condition(etag_func=etag)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD') and not response.has_header('Last-Modified'):
+                modified = last_modified(request, *args, **kwargs)
+                if modified:
+                    response.headers['Last-Modified'] = http_date(modified.timestamp())
+            return response
+        return wrapper
+
+    return decorator
+
+
+def collection_list_state(request):
+    collections = Collection.objects.all()
+    if not request.user.is_authenticated:
+        collections = collections.filter(public=True)
+    return collections.aggregate(updated_at=Max('updated_at'), collection_count=Count('id'),
+                                 record_count=Sum('record_count'), public_record_count=Sum('public_record_count'),
+                                 file_count=Sum('file_count'), bytes_total=Sum('bytes_total'))
+
+
+def collection_detail_state(request, pk):
+    collections = Collection.objects.filter(pk=pk)
+    records = Q()
+    if not request.user.is_authenticated:
+        collections = collections.filter(public=True)
+        records = Q(record__public=True)
+    # the record counters catch deletions, which leave the newest timestamps unchanged
+    state = collections.annotate(
+        records_updated_at=Max('record__updated_at', filter=records),
+        files_updated_at=Max('record__files_updated_at', filter=records),
+    ).values('updated_at', 'records_updated_at', 'files_updated_at', 'record_count', 'public_record_count').first()
+    if state is not None:
+        # tag changes don't touch any timestamp, but bump the collection generation
+        state['generation'] = get_collection_generation(pk)
+    return state
+
+
+def record_detail_state(request, collection_id, pk):
+    records = Record.objects.filter(pk=pk, collection_id=collection_id)
+    if not request.user.is_authenticated:
+        records = records.filter(public=True, collection__public=True)
+    state = records.values('updated_at', 'files_updated_at', collection_updated_at=F('collection__updated_at')).first()
+    if state is not None:
+        state['tag_generation'] = get_tag_generation()
+    return state
+
+
+def search_state(request):
+    records = Record.objects.all()
+    if not request.user.is_authenticated:
+        records = records.filter(public=True, collection__public=True)
+    state = records.aggregate(updated_at=Max('updated_at'), files_updated_at=Max('files_updated_at'),
+                              collections_updated_at=Max('collection__updated_at'), record_count=Count('id'))
+    state['tag_generation'] = get_tag_generation()
+    return state
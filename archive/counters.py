@@ -0,0 +1,95 @@
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from archive.models import Collection, Record, RecordCategory, RecordFile, COUNTED_RECORD_FIELDS, COUNTED_FILE_FIELDS
+
+# models holding record counters and the record field pointing to them
+COUNTER_MODELS = [(Collection, 'collection_id'), (RecordCategory, 'category_id')]
+
+
+def adjust(model, pk, **deltas):
+    updates = {name: F(name) + delta for name, delta in deltas.items() if delta}
+    if pk is not None and updates:
+        model.objects.filter(pk=pk).update(**updates)
+
+
+def _get_counted(instance, fields, created):
+    current = {name: getattr(instance, name) for name in fields}
+    if created:
+        return None, current
+    previous = getattr(instance, '_counted', None)
+    if previous is None:
+        return current, current
+    # deferred fields weren't saved, so they still have their loaded value
+    return {**current, **previous}, current
+
+
+def _adjust_files(record_id, count, size):
+    targets = Record.objects.filter(pk=record_id).values_list('collection_id', 'category_id').first()
+    if targets:
+        for (model, _), pk in zip(COUNTER_MODELS, targets):
+            adjust(model, pk, file_count=count, bytes_total=size)
+
+
+def record_saved(record, created):
+    previous, current = _get_counted(record, COUNTED_RECORD_FIELDS, created)
+    record._counted = current
+    if previous == current:
+        return
+
+    files = None
+    for model, field in COUNTER_MODELS:
+        if previous and previous[field] == current[field]:
+            adjust(model, current[field], public_record_count=int(current['public']) - int(previous['public']))
+            continue
+        if previous:
+            # the files of a moved record move with it
+            if files is None:
+                files = RecordFile.objects.filter(record=record).aggregate(count=Count('pk'), size=Sum('size_bytes'))
+            adjust(model, previous[field], record_count=-1, public_record_count=-int(previous['public']),
+                   file_count=-files['count'], bytes_total=-(files['size'] or 0))
+            adjust(model, current[field], record_count=1, public_record_count=int(current['public']),
+                   file_count=files['count'], bytes_total=files['size'] or 0)
+        else:
+            adjust(model, current[field], record_count=1, public_record_count=int(current['public']))
+
+
+def record_deleted(record):
+    # files are deleted before their record and subtract themselves
+    for model, field in COUNTER_MODELS:
+        adjust(model, getattr(record, field), record_count=-1, public_record_count=-int(record.public))
+
+
+def file_saved(record_file, created):
+    previous, current = _get_counted(record_file, COUNTED_FILE_FIELDS, created)
+    record_file._counted = current
+    if previous == current:
+        return
+
+    size = current['size_bytes'] or 0
+    if previous is None:
+        _adjust_files(current['record_id'], 1, size)
+    elif previous['record_id'] == current['record_id']:
+        _adjust_files(current['record_id'], 0, size - (previous['size_bytes'] or 0))
+    else:
+        _adjust_files(previous['record_id'], -1, -(previous['size_bytes'] or 0))
+        _adjust_files(current['record_id'], 1, size)
+
+
+def file_deleted(record_file):
+    _adjust_files(record_file.record_id, -1, -(record_file.size_bytes or 0))
+
+
+def reconcile_counters():
+    for model, field in COUNTER_MODELS:
+        lookup = field[:-len('_id')]
+        records = Record.objects.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup)
+        files = RecordFile.objects.filter(**{f'record__{lookup}': OuterRef('pk')}).order_by() \
+            .values(f'record__{lookup}')
+        model.objects.update(
+            record_count=Coalesce(Subquery(records.annotate(count=Count('pk')).values('count')), 0),
+            public_record_count=Coalesce(Subquery(records.filter(public=True).annotate(count=Count('pk'))
+                                                  .values('count')), 0),
+            file_count=Coalesce(Subquery(files.annotate(count=Count('pk')).values('count')), 0),
+            bytes_total=Coalesce(Subquery(files.annotate(size=Sum('size_bytes')).values('size')), 0),
+        )
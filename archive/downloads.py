@@ -0,0 +1,123 @@
+import csv
+import io
+import logging
+import os
+import zipfile
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import slugify
+
+
+READ_SIZE = 1024 * 1024
+RECORD_CHUNK_SIZE = 500
+# formats which are compressed already and only get bigger when deflated again
+STORED_CONTENT_TYPES = ['application/pdf', 'application/wacz', 'application/zip', 'image/jpeg', 'image/png',
+                        'image/gif', 'image/webp', 'image/avif']
+STORED_CONTENT_TYPE_PREFIXES = ['video/', 'audio/']
+METADATA_FIELDS = ['id', 'title', 'category', 'collection', 'description', 'physical_location', 'physical_signature',
+                   'origin_date', 'created_at', 'updated_at', 'public', 'tags', 'files']
+
+logger = logging.getLogger(__name__)
+
+
+class ZipBuffer(io.RawIOBase):
+    # write-only, unseekable target for zipfile; whatever was written is handed out by pop()
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def get_compress_type(content_type):
+    if content_type in STORED_CONTENT_TYPES or content_type.startswith(tuple(STORED_CONTENT_TYPE_PREFIXES)):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def get_date_time(value):
+    value = timezone.localtime(value) if value and timezone.is_aware(value) else value or datetime.now()
+    return max(value, datetime(1980, 1, 1, tzinfo=value.tzinfo)).timetuple()[:6]
+
+
+def get_record_directory(record):
+    return f'{record.pk}-{slugify(record.title)[:50]}'.rstrip('-')
+
+
+def get_file_names(record):
+    names = {}
+    for record_file in record.recordfile_set.all():
+        name = os.path.basename(record_file.file.name)
+        if name in names.values():
+            name = f'{record_file.pk}-{name}'
+        names[record_file] = f'{get_record_directory(record)}/{name}'
+    return names
+
+
+def iter_records(queryset):
+    return queryset.select_related('category', 'collection').prefetch_related('tags', 'recordfile_set') \
+        .order_by('pk').iterator(chunk_size=RECORD_CHUNK_SIZE)
+
+
+def get_metadata_row(record):
+    return [record.pk, record.title, record.category.name, record.collection.name, record.description or '',
+            record.physical_location or '', record.physical_signature or '', record.origin_date or '',
+            record.created_at.isoformat(), record.updated_at.isoformat(), record.public,
+            ';'.join(tag.name for tag in record.tags.all()), ';'.join(get_file_names(record).values())]
+
+
+def stream_zip(queryset):
+    # the records are read twice, first for metadata.csv at the start of the archive, then for the files, so only one
+    # chunk of records and one block of a file are held in memory at a time
+    buffer = ZipBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        metadata = zipfile.ZipInfo('metadata.csv', date_time=get_date_time(None))
+        metadata.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(metadata, mode='w') as entry:
+            text = io.StringIO()
+            writer = csv.writer(text)
+            writer.writerow(METADATA_FIELDS)
+            for record in iter_records(queryset):
+                writer.writerow(get_metadata_row(record))
+                entry.write(text.getvalue().encode())
+                text.seek(0)
+                text.truncate()
+                yield buffer.pop()
+            entry.write(text.getvalue().encode())
+
+        for record in iter_records(queryset):
+            for record_file, name in get_file_names(record).items():
+                path = os.path.join(settings.MEDIA_ROOT, record_file.file.name)
+                try:
+                    source = open(path, 'rb')
+                except OSError as error:
+                    logger.warning('Skipping %s in ZIP download: %s', path, error)
+                    continue
+                with source:
+                    info = zipfile.ZipInfo(name, date_time=get_date_time(record_file.updated_at))
+                    info.compress_type = get_compress_type(record_file.content_type)
+                    # a known size lets zipfile decide on ZIP64 for large files up front
+                    info.file_size = os.fstat(source.fileno()).st_size
+                    with archive.open(info, mode='w') as entry:
+                        for block in iter(lambda: source.read(READ_SIZE), b''):
+                            entry.write(block)
+                            yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def get_archive_name(name):
+    return f'{slugify(name) or "archive"}.zip'
@@ -0,0 +1,35 @@
+from collections import namedtuple
+
+from django.db.models import Count
+from django.db.models.functions import ExtractYear
+
+from archive.models import RecordTag
+
+FacetValue = namedtuple('FacetValue', ['value', 'label', 'count'])
+
+
+def year_facet(queryset):
+    rows = queryset.order_by() \
+        .filter(origin_date__isnull=False) \
+        .annotate(year=ExtractYear('origin_date')) \
+        .values('year') \
+        .annotate(count=Count('pk', distinct=True)) \
+        .order_by('-year')
+    return [FacetValue(row['year'], str(row['year']), row['count']) for row in rows]
+
+
+def category_facet(queryset):
+    rows = queryset.order_by() \
+        .values('category_id', 'category__name') \
+        .annotate(count=Count('pk', distinct=True)) \
+        .order_by('category__name')
+    return [FacetValue(row['category_id'], row['category__name'], row['count']) for row in rows]
+
+
+def tag_facet(queryset):
+    # filtering and counting through the same relation restricts the count to the matching records
+    rows = RecordTag.objects.filter(record__in=queryset.order_by().values('pk')) \
+        .values('pk', 'name') \
+        .annotate(count=Count('record')) \
+        .order_by('-count', 'name')
+    return [FacetValue(row['pk'], row['name'], row['count']) for row in rows]
@@ -1,37 +1,97 @@
+from django import forms
 from django.utils.translation import gettext as _
 from django.forms.widgets import CheckboxSelectMultiple
 import django_filters
+from archive.facets import year_facet, category_facet, tag_facet
 from archive.models import Record, RecordTag, RecordCategory
 
 
+class YearMultipleChoiceField(forms.MultipleChoiceField):
+    # choices are the facet values, which depend on the cleaned data, so validation can't rely on them
+    def valid_value(self, value):
+        return str(value).isdigit()
+
+
+class YearMultipleChoiceFilter(django_filters.MultipleChoiceFilter):
+    field_class = YearMultipleChoiceField
+
+
+class FacetChoices:
+    def __init__(self, record_filter, name):
+        self.record_filter = record_filter
+        self.name = name
+
+    def __iter__(self):
+        return iter(self.record_filter.get_facet_choices(self.name))
+
+
 class RecordFilter(django_filters.FilterSet):
     title_contains = django_filters.CharFilter('title', 'icontains', label=_('Title'))
     physical_location = django_filters.CharFilter('physical_location', 'icontains', label=_('Physical location'))
     physical_signature = django_filters.CharFilter('physical_signature', 'icontains', label=_('Physical signature'))
     tags = django_filters.ModelMultipleChoiceFilter(queryset=RecordTag.objects.all(), widget=CheckboxSelectMultiple)
+    origin_date__year = YearMultipleChoiceFilter('origin_date__year', label=_('Year of origin'),
+                                                 widget=CheckboxSelectMultiple)
+    category = django_filters.ModelMultipleChoiceFilter(field_name='category', label=_('Category'),
+                                                        queryset=RecordCategory.objects.all(),
+                                                        widget=CheckboxSelectMultiple)
+
+    facets = {
+        'origin_date__year': year_facet,
+        'category': category_facet,
+        'tags': tag_facet,
+    }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, facet_cache=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.filters['origin_date__year'] = django_filters.MultipleChoiceFilter('origin_date__year',
-                                                                                label=_('Year of origin'),
-                                                                                widget=CheckboxSelectMultiple,
-                                                                                choices=self._get_collection_years())
-        self.filters['category'] = \
-            django_filters.ModelMultipleChoiceFilter(field_name='category', label=_('Category'),
-                                                     queryset=self._get_category_queryset(),
-                                                     widget=CheckboxSelectMultiple)
-
-    def _get_collection_years(self):
-        values = self.queryset.values()
-        years = [value['origin_date'].year for value in values if 'origin_date' in value and value['origin_date']]
-        years = list(set(years))
-        years = sorted(years, reverse=True)
-        years = [(year, str(year)) for year in years]
-
-        return years
-
-    def _get_category_queryset(self):
-        return RecordCategory.objects.filter(records__in=self.queryset)
+        self.facet_cache = facet_cache
+        self._facets = None
+
+    @property
+    def form(self):
+        if not hasattr(self, '_form'):
+            form = super().form
+            for name in self.facets:
+                form.fields[name].widget.choices = FacetChoices(self, name)
+        return self._form
+
+    def get_facets(self):
+        if self._facets is None:
+            if self.facet_cache:
+                self._facets = self.facet_cache.get_or_compute(self.get_filter_data(), self._compute_facets)
+            else:
+                self._facets = self._compute_facets()
+        return self._facets
+
+    def get_filter_data(self):
+        if not self.is_bound or not self.data:
+            return {}
+        return {name: sorted(self.data.getlist(name)) for name in self.filters if self.data.getlist(name)}
+
+    def _compute_facets(self):
+        return {name: facet(self._filter_queryset_excluding(name)) for name, facet in self.facets.items()}
+
+    def get_facet_choices(self, name):
+        facet = self.get_facets()[name]
+        choices = [(value.value, f'{value.label} ({value.count})') for value in facet]
+
+        # keep active selections visible even if the other filters leave no matching records
+        facet_values = {str(value.value) for value in facet}
+        for selected in getattr(self.form, 'cleaned_data', {}).get(name, []):
+            selected_value = getattr(selected, 'pk', selected)
+            if str(selected_value) not in facet_values:
+                choices.append((selected_value, f'{selected} (0)'))
+        return choices
+
+    def _filter_queryset_excluding(self, excluded):
+        # counts of a facet reflect all active filters except its own
+        queryset = self.queryset.all()
+        if self.is_bound:
+            self.errors
+            for name, value in self.form.cleaned_data.items():
+                if name != excluded:
+                    queryset = self.filters[name].filter(queryset, value)
+        return queryset
 
     class Meta:
         model = Record
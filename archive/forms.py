@@ -10,7 +10,7 @@ class RecordTagForm(Form):
     def clean_tag(self):
         tag_name = self.data['tag']
         tag_name = tag_name.strip().lower()
-        return RecordTag.objects.get_or_create(name=tag_name)[0]
+        return RecordTag.objects.get_or_create(name__iexact=tag_name, defaults={'name': tag_name})[0]
 
 
 class RecordFileForm(ModelForm):
@@ -0,0 +1,342 @@
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
+from PIL import Image, ImageOps
+
+from archive.models import RecordFile
+
+IIIF_CONTEXT = 'http://iiif.io/api/image/3/context.json'
+FORMATS = {'jpg': ('JPEG', 'image/jpeg'), 'png': ('PNG', 'image/png'), 'webp': ('WEBP', 'image/webp')}
+QUALITIES = ['default', 'color', 'gray', 'bitonal']
+# every n-th rendered image trims the cache back to IIIF_CACHE_MAX_BYTES
+CACHE_EVICT_INTERVAL = 50
+# seconds after which a viewer asks again for an image whose tiles are being generated
+RETRY_AFTER = 60
+
+_cache_writes = 0
+
+
+class IIIFError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def is_iiif_candidate(record_file):
+    return record_file.is_image() and record_file.width is not None and record_file.height is not None
+
+
+def get_scale_factors(width, height):
+    factors = [1]
+    while math.ceil(max(width, height) / factors[-1]) > settings.IIIF_TILE_SIZE:
+        factors.append(factors[-1] * 2)
+    return factors
+
+
+def get_tile_dir(record_file_id):
+    return os.path.join(settings.IIIF_ROOT, 'tiles', str(record_file_id))
+
+
+def get_tile_path(record_file_id, scale, column, row):
+    return os.path.join(get_tile_dir(record_file_id), str(scale), f'{column}_{row}.jpg')
+
+
+def get_cache_dir(record_file_id):
+    return os.path.join(settings.IIIF_ROOT, 'cache', str(record_file_id))
+
+
+def delete_tiles(record_file_id):
+    shutil.rmtree(get_tile_dir(record_file_id), ignore_errors=True)
+    shutil.rmtree(get_cache_dir(record_file_id), ignore_errors=True)
+
+
+def build_tiles(record_file):
+    # every level of the pyramid is reduced from the one above, so the original is decoded only once
+    tile_size = settings.IIIF_TILE_SIZE
+    os.makedirs(os.path.join(settings.IIIF_ROOT, 'tiles'), exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=os.path.join(settings.IIIF_ROOT, 'tiles'))
+    try:
+        with Image.open(os.path.join(settings.MEDIA_ROOT, record_file.file.name)) as source:
+            image = source.convert('RGB')
+        for scale in get_scale_factors(*image.size):
+            if scale > 1:
+                image = image.reduce(2)
+            os.makedirs(os.path.join(build_dir, str(scale)))
+            for row, y in enumerate(range(0, image.height, tile_size)):
+                for column, x in enumerate(range(0, image.width, tile_size)):
+                    tile = image.crop((x, y, min(x + tile_size, image.width), min(y + tile_size, image.height)))
+                    tile.save(os.path.join(build_dir, str(scale), f'{column}_{row}.jpg'), 'JPEG')
+        delete_tiles(record_file.pk)
+        os.rename(build_dir, get_tile_dir(record_file.pk))
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    record_file.tiles_generated_at = timezone.now()
+    record_file.save(update_fields=['tiles_generated_at'])
+
+
+def get_info(record_file, base_url):
+    info = {
+        '@context': IIIF_CONTEXT,
+        'id': base_url,
+        'type': 'ImageService3',
+        'protocol': 'http://iiif.io/api/image',
+        'profile': 'level2',
+        'width': record_file.width,
+        'height': record_file.height,
+        'maxArea': settings.IIIF_MAX_AREA,
+        'extraFormats': ['webp'],
+        'extraQualities': ['color', 'gray', 'bitonal'],
+        'extraFeatures': ['mirroring', 'regionSquare', 'sizeUpscaling'],
+    }
+    if record_file.tiles_generated_at:
+        info['tiles'] = [{'width': settings.IIIF_TILE_SIZE,
+                          'scaleFactors': get_scale_factors(record_file.width, record_file.height)}]
+    return info
+
+
+def parse_region(region, width, height):
+    if region == 'full':
+        return 0, 0, width, height
+    if region == 'square':
+        side = min(width, height)
+        return (width - side) // 2, (height - side) // 2, side, side
+    try:
+        if region.startswith('pct:'):
+            x, y, w, h = (float(value) for value in region[4:].split(','))
+            x, y, w, h = round(x * width / 100), round(y * height / 100), round(w * width / 100), \
+                round(h * height / 100)
+        else:
+            x, y, w, h = (int(value) for value in region.split(','))
+    except ValueError:
+        raise IIIFError(f'Invalid region: {region}')
+    if w <= 0 or h <= 0 or x < 0 or y < 0 or x >= width or y >= height:
+        raise IIIFError(f'Invalid region: {region}')
+    return x, y, min(w, width - x), min(h, height - y)
+
+
+def parse_size(size, region_width, region_height):
+    upscale = size.startswith('^')
+    size = size.lstrip('^')
+    max_area = settings.IIIF_MAX_AREA
+    try:
+        if size == 'max':
+            scale = min(1.0 if not upscale else math.inf, math.sqrt(max_area / (region_width * region_height)))
+            w, h = round(region_width * scale), round(region_height * scale)
+        elif size.startswith('pct:'):
+            scale = float(size[4:]) / 100
+            w, h = round(region_width * scale), round(region_height * scale)
+        elif size.startswith('!'):
+            box_width, box_height = (int(value) for value in size[1:].split(','))
+            scale = min(box_width / region_width, box_height / region_height)
+            w, h = round(region_width * scale), round(region_height * scale)
+        else:
+            w, h = size.split(',')
+            if w and h:
+                w, h = int(w), int(h)
+            elif w:
+                w = int(w)
+                h = round(region_height * w / region_width)
+            else:
+                h = int(h)
+                w = round(region_width * h / region_height)
+    except ValueError:
+        raise IIIFError(f'Invalid size: {size}')
+    if w <= 0 or h <= 0:
+        raise IIIFError(f'Invalid size: {size}')
+    if not upscale and (w > region_width or h > region_height):
+        raise IIIFError(f'Size larger than region without ^: {size}')
+    if w * h > max_area:
+        raise IIIFError(f'Size exceeds maxArea: {size}')
+    return w, h
+
+
+def parse_rotation(rotation):
+    mirror = rotation.startswith('!')
+    try:
+        degrees = float(rotation.lstrip('!'))
+    except ValueError:
+        raise IIIFError(f'Invalid rotation: {rotation}')
+    if degrees % 90:
+        raise IIIFError('Only rotation by multiples of 90 degrees is supported', status=501)
+    return mirror, int(degrees) % 360
+
+
+def get_tile(record_file, x, y, w, h, size, scale_factors):
+    # a request for exactly one tile of the pyramid, as sent by deep zoom viewers
+    tile_size = settings.IIIF_TILE_SIZE
+    for scale in scale_factors:
+        span = tile_size * scale
+        if x % span or y % span or w != min(span, record_file.width - x) or h != min(span, record_file.height - y):
+            continue
+        if size == (math.ceil(w / scale), math.ceil(h / scale)):
+            return get_tile_path(record_file.pk, scale, x // span, y // span)
+    return None
+
+
+def compose_region(record_file, x, y, w, h, scale):
+    # the region at the given pyramid level, pasted together from the tiles it covers
+    tile_size = settings.IIIF_TILE_SIZE
+    left, top = x // scale, y // scale
+    right, bottom = math.ceil((x + w) / scale), math.ceil((y + h) / scale)
+    canvas = Image.new('RGB', (right - left, bottom - top))
+    for row in range(top // tile_size, (bottom - 1) // tile_size + 1):
+        for column in range(left // tile_size, (right - 1) // tile_size + 1):
+            with Image.open(get_tile_path(record_file.pk, scale, column, row)) as tile:
+                canvas.paste(tile, (column * tile_size - left, row * tile_size - top))
+    return canvas
+
+
+def get_source_name(record_file, w, size):
+    # until the pyramid exists, requests are rendered from the smallest rendition with the requested resolution;
+    # large originals are too expensive to decode per request, so those requests are refused until the tiles exist
+    width = math.ceil(record_file.width * size[0] / w)
+    for rendition in sorted(record_file.renditions, key=lambda rendition: rendition['width']):
+        if rendition['width'] >= width:
+            return rendition['name']
+    if max(record_file.width, record_file.height) > settings.IIIF_TILE_MIN_SIZE:
+        raise IIIFError('Tiles of this image are not generated yet', status=503)
+    return record_file.file.name
+
+
+def render(record_file, x, y, w, h, size):
+    if record_file.tiles_generated_at:
+        # the smallest level that still has at least the requested resolution
+        scale = max(factor for factor in get_scale_factors(record_file.width, record_file.height)
+                    if factor == 1 or w / factor >= size[0])
+        image = compose_region(record_file, x, y, w, h, scale)
+    else:
+        with Image.open(os.path.join(settings.MEDIA_ROOT, get_source_name(record_file, w, size))) as source:
+            source.draft('RGB', (math.ceil(record_file.width * size[0] / w),
+                                 math.ceil(record_file.height * size[1] / h)))
+            ratio = source.width / record_file.width
+            image = source.convert('RGB').crop((round(x * ratio), round(y * ratio), round((x + w) * ratio),
+                                                round((y + h) * ratio)))
+    return image.resize(size, Image.LANCZOS) if image.size != size else image
+
+
+def get_image_path(record_file, region, size, rotation, quality, image_format):
+    # returns the path of a file with the requested image, either a tile of the pyramid or a cached rendering
+    if quality not in QUALITIES:
+        raise IIIFError(f'Invalid quality: {quality}')
+    if image_format not in FORMATS:
+        raise IIIFError(f'Unsupported format: {image_format}', status=415)
+    x, y, w, h = parse_region(region, record_file.width, record_file.height)
+    size = parse_size(size, w, h)
+    mirror, degrees = parse_rotation(rotation)
+
+    if record_file.tiles_generated_at and not mirror and not degrees and quality in ['default', 'color'] \
+            and image_format == 'jpg':
+        tile_path = get_tile(record_file, x, y, w, h, size,
+                             get_scale_factors(record_file.width, record_file.height))
+        if tile_path and os.path.exists(tile_path):
+            return tile_path
+
+    key = hashlib.md5(f'{x},{y},{w},{h}/{size}/{mirror},{degrees}/{quality}/{record_file.tiles_generated_at}'
+                      .encode()).hexdigest()
+    cache_path = os.path.join(get_cache_dir(record_file.pk), f'{key}.{image_format}')
+    if os.path.exists(cache_path):
+        # the modification time is the last use for the LRU eviction
+        os.utime(cache_path)
+        return cache_path
+
+    image = render(record_file, x, y, w, h, size)
+    if mirror:
+        image = ImageOps.mirror(image)
+    if degrees:
+        image = image.rotate(-degrees, expand=True)
+    if quality == 'gray':
+        image = image.convert('L')
+    elif quality == 'bitonal':
+        image = image.convert('1')
+    write_cache(cache_path, image, FORMATS[image_format][0])
+    return cache_path
+
+
+def write_cache(path, image, pil_format):
+    global _cache_writes
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    file, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(file, 'wb') as out:
+        image.save(out, pil_format)
+    os.replace(tmp_path, path)
+    _cache_writes += 1
+    if _cache_writes % CACHE_EVICT_INTERVAL == 0:
+        evict_cache()
+
+
+def evict_cache():
+    entries = []
+    cache_root = os.path.join(settings.IIIF_ROOT, 'cache')
+    for directory in os.scandir(cache_root) if os.path.isdir(cache_root) else []:
+        for entry in os.scandir(directory.path):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= settings.IIIF_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def get_record_file(request, pk):
+    # same visibility as RecordDetailView
+    record_files = RecordFile.objects.filter(pk=pk).select_related('record__collection')
+    if not request.user.is_authenticated:
+        record_files = record_files.filter(record__public=True, record__collection__public=True)
+    record_file = get_object_or_404(record_files)
+    if not is_iiif_candidate(record_file):
+        raise Http404()
+    return record_file
+
+
+def add_headers(response, record_file):
+    # IIIF viewers are usually served from other origins
+    response['Access-Control-Allow-Origin'] = '*'
+    if record_file.record.public and record_file.record.collection.public:
+        patch_cache_control(response, public=True, max_age=settings.IIIF_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, max_age=settings.IIIF_MAX_AGE)
+    return response
+
+
+@require_GET
+def base_view(request, pk):
+    return HttpResponseRedirect(reverse('iiif-info', kwargs={'pk': pk}), status=303)
+
+
+@require_GET
+def info_view(request, pk):
+    record_file = get_record_file(request, pk)
+    base_url = request.build_absolute_uri(reverse('iiif-base', kwargs={'pk': pk}))
+    response = JsonResponse(get_info(record_file, base_url),
+                            content_type=f'application/ld+json;profile="{IIIF_CONTEXT}"')
+    return add_headers(response, record_file)
+
+
+@require_GET
+def image_view(request, pk, region, size, rotation, quality, image_format):
+    record_file = get_record_file(request, pk)
+    try:
+        path = get_image_path(record_file, region, size, rotation, quality, image_format)
+    except IIIFError as error:
+        response = HttpResponse(str(error), status=error.status, content_type='text/plain')
+        if error.status == 503:
+            response['Retry-After'] = RETRY_AFTER
+        return response
+    response = FileResponse(open(path, 'rb'), content_type=FORMATS[image_format][1])
+    return add_headers(response, record_file)
@@ -0,0 +1,97 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from archive.models import DerivativeJob
+
+PENDING_STATES = [DerivativeJob.State.QUEUED, DerivativeJob.State.RUNNING]
+# hard time limit of the tasks working on a kind of job, the others have CELERY_TASK_TIME_LIMIT
+TIME_LIMITS = {
+    DerivativeJob.Kind.TRANSCODE: settings.VIDEO_TIMEOUT + 5 * 60,
+    DerivativeJob.Kind.STORYBOARD: settings.VIDEO_TIMEOUT + 5 * 60,
+}
+# time between a job being claimed and its task being killed at the time limit
+RUNNING_GRACE = 5 * 60
+
+
+def get_jobs(record_file_id, kind):
+    return DerivativeJob.objects.filter(record_file_id=record_file_id, kind=kind)
+
+
+def get_time_limit(kind):
+    return TIME_LIMITS.get(kind, settings.CELERY_TASK_TIME_LIMIT)
+
+
+def get_stale():
+    # a job queued for longer than DERIVATIVE_JOB_STALE_AFTER lost its message, one running for longer than the time
+    # limit of its task lost its worker without the failure being reported, e.g. because the whole node died
+    now = timezone.now()
+    queued = Q(state=DerivativeJob.State.QUEUED,
+               queued_at__lt=now - timedelta(seconds=settings.DERIVATIVE_JOB_STALE_AFTER))
+    return reduce(or_, [queued] + [
+        Q(kind=kind, state=DerivativeJob.State.RUNNING,
+          started_at__lt=now - timedelta(seconds=get_time_limit(kind) + RUNNING_GRACE))
+        for kind in DerivativeJob.Kind.values
+    ])
+
+
+def get_pending():
+    return Q(state__in=PENDING_STATES) & ~get_stale()
+
+
+def queue_job(record_file_id, kind):
+    # single flight: of concurrent enqueues only the one which creates the job or moves it out of a finished (or
+    # stale) state gets to send a message, the others collapse into the queued or running job
+    job, created = DerivativeJob.objects.get_or_create(record_file_id=record_file_id, kind=kind)
+    if created:
+        return True
+    return get_jobs(record_file_id, kind).filter(Q(state__in=[DerivativeJob.State.DONE, DerivativeJob.State.FAILED])
+                                                  | get_stale()) \
+        .update(state=DerivativeJob.State.QUEUED, attempts=0, error='', queued_at=timezone.now(), started_at=None,
+                finished_at=None) == 1
+
+
+def queue_jobs(record_file_ids, kind):
+    # for files which were just created and have no jobs yet
+    DerivativeJob.objects.bulk_create([DerivativeJob(record_file_id=record_file_id, kind=kind)
+                                       for record_file_id in record_file_ids], ignore_conflicts=True)
+
+
+def claim_job(record_file_id, kind, task_id=None):
+    # a duplicate message finds the job running or done and is dropped, unless it is the redelivery of the message
+    # whose worker was lost; messages from before jobs were tracked get a job first
+    DerivativeJob.objects.get_or_create(record_file_id=record_file_id, kind=kind)
+    claimable = Q(state=DerivativeJob.State.QUEUED) | get_stale()
+    if task_id:
+        claimable |= Q(state=DerivativeJob.State.RUNNING, task_id=task_id)
+    return get_jobs(record_file_id, kind).filter(claimable) \
+        .update(state=DerivativeJob.State.RUNNING, attempts=F('attempts') + 1, started_at=timezone.now(),
+                finished_at=None, progress=None, task_id=task_id or '') == 1
+
+
+def finish_job(record_file_id, kind):
+    get_jobs(record_file_id, kind).update(state=DerivativeJob.State.DONE, error='', finished_at=timezone.now(),
+                                          progress=None)
+
+
+def get_attempts(record_file_id, kind):
+    return get_jobs(record_file_id, kind).values_list('attempts', flat=True).first() or 0
+
+
+def requeue_job(record_file_id, kind, error='', reset_attempts=False):
+    get_jobs(record_file_id, kind).update(state=DerivativeJob.State.QUEUED, error=error, queued_at=timezone.now(),
+                                          finished_at=None, progress=None,
+                                          **({'attempts': 0} if reset_attempts else {}))
+
+
+def fail_job(record_file_id, kind, error):
+    get_jobs(record_file_id, kind).update(state=DerivativeJob.State.FAILED, error=error, finished_at=timezone.now(),
+                                          progress=None)
+
+
+def get_retry_delay(attempts):
+    return settings.DERIVATIVE_JOB_RETRY_DELAY * 2 ** (attempts - 1)
@@ -0,0 +1,175 @@
+import csv
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from archive.upload_helper import CHECKSUM_BLOCK_SIZE, get_checksum, get_content_type_for_name, read_chunks
+
+RECORD_FILE_DIR = 'record_files'
+
+PreparedFile = namedtuple('PreparedFile', ['name', 'size', 'checksum', 'content_type'])
+
+
+def read_manifest(path):
+    # yields (row number, row) pairs from a CSV file with a header or from a file with one JSON object per line
+    with open(path, newline='', encoding='utf-8') as manifest:
+        if path.endswith('.jsonl'):
+            for number, line in enumerate(manifest, start=1):
+                if line.strip():
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError as error:
+                        raise CommandError(f'Row {number}: {error}')
+        else:
+            yield from enumerate(csv.DictReader(manifest), start=1)
+
+
+def parse_list(value):
+    if isinstance(value, list):
+        values = value
+    else:
+        values = (value or '').split(';')
+    return [str(value).strip() for value in values if str(value).strip()]
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def parse_date(value):
+    if not value:
+        return None
+    return date.fromisoformat(value)
+
+
+def get_file_name(manifest_path, row_number, path):
+    # derived from the manifest row, so a repeated import writes to the same location and can be recognized
+    directory = uuid.uuid5(uuid.NAMESPACE_URL, f'{os.path.abspath(manifest_path)}:{row_number}:{path}')
+    return f'{RECORD_FILE_DIR}/{directory}/{os.path.basename(path)}'
+
+
+def get_import_key(manifest_path, row_number):
+    # identifies the record of a manifest row, so a row committed before a crash isn't imported twice
+    return uuid.uuid5(uuid.NAMESPACE_URL, f'{os.path.abspath(manifest_path)}:{row_number}')
+
+
+def prepare_file(source, name, link=False):
+    destination = os.path.join(settings.MEDIA_ROOT, name)
+    checksum = None
+    if not os.path.exists(destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if link:
+            try:
+                os.link(source, destination)
+            except OSError:
+                # hardlinks only work within a file system
+                link = False
+        if not link:
+            checksum = copy_file(source, destination)
+    if checksum is None:
+        checksum = get_checksum(read_chunks(destination))
+    return PreparedFile(name, os.path.getsize(destination), checksum, get_content_type_for_name(name))
+
+
+def copy_file(source, destination):
+    # copies and hashes in one pass; the partial file is only renamed once complete
+    partial = f'{destination}.part'
+    checksum = hashlib.sha256()
+    with open(source, 'rb') as source_file, open(partial, 'wb') as destination_file:
+        for chunk in iter(lambda: source_file.read(CHECKSUM_BLOCK_SIZE), b''):
+            destination_file.write(chunk)
+            checksum.update(chunk)
+    os.replace(partial, destination)
+    return checksum.hexdigest()
+
+
+class Checkpoint:
+    def __init__(self, path, manifest_path):
+        self.path = path
+        self.manifest_path = os.path.abspath(manifest_path)
+        self.rows = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as file:
+            data = json.load(file)
+        if data['manifest'] != self.manifest_path:
+            raise CommandError(f'Checkpoint {self.path} belongs to {data["manifest"]}, use --restart to ignore it')
+        self.rows = data['rows']
+
+    def save(self, rows):
+        self.rows = rows
+        partial = f'{self.path}.part'
+        with open(partial, 'w') as file:
+            json.dump({'manifest': self.manifest_path, 'rows': rows}, file)
+        os.replace(partial, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RangeCheckpoint(Checkpoint):
+    # the primary key up to which all files of a selection were processed
+    def __init__(self, path, selection):
+        self.path = path
+        self.selection = selection
+        self.pk = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as file:
+            data = json.load(file)
+        if data['selection'] != self.selection:
+            raise CommandError(f'Checkpoint {self.path} belongs to {data["selection"]}, use --restart to ignore it')
+        self.pk = data['pk']
+
+    def save(self, pk):
+        self.pk = pk
+        partial = f'{self.path}.part'
+        with open(partial, 'w') as file:
+            json.dump({'selection': self.selection, 'pk': pk}, file)
+        os.replace(partial, self.path)
+
+
+class Progress:
+    # a progress bar with throughput and remaining time, redrawn in place on terminals and written as lines otherwise
+    def __init__(self, stdout, total, interval=1, width=30):
+        self.stdout = stdout
+        self.total = total
+        self.interval = interval
+        self.width = width
+        self.done = 0
+        self.started_at = self.written_at = time.monotonic()
+
+    def get_line(self):
+        elapsed = time.monotonic() - self.started_at
+        rate = self.done / elapsed if elapsed else 0
+        filled = min(self.width * self.done // self.total, self.width) if self.total else self.width
+        line = f'[{"#" * filled}{"." * (self.width - filled)}] {self.done}/{self.total} {rate:.1f} files/s'
+        if rate:
+            line += f' ETA {timedelta(seconds=round(max(self.total - self.done, 0) / rate))}'
+        return line
+
+    def update(self, count):
+        self.done += count
+        if time.monotonic() - self.written_at >= self.interval:
+            self.write()
+
+    def write(self, ending=None):
+        self.written_at = time.monotonic()
+        self.stdout.write(self.get_line(), ending=ending or ('\r' if self.stdout.isatty() else '\n'))
+
+    def finish(self):
+        self.write(ending='\n')
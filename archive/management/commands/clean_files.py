@@ -1,10 +1,15 @@
 import os
+import shutil
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from archive.models import RecordFile
+from archive.thumbnails import PAGE_PREVIEW_PATTERN, get_rendition_names
+from archive.video import HLS_DIR_SUFFIX, STORYBOARD_DIR_SUFFIX
 
 RECORD_FILE_DIR = 'record_files'
+# directories of video derivatives by their suffix and the field that points into them
+DERIVATIVE_DIRS = {HLS_DIR_SUFFIX: 'hls_playlist', STORYBOARD_DIR_SUFFIX: 'storyboard'}
 
 
 class Command(BaseCommand):
@@ -15,24 +20,51 @@ class Command(BaseCommand):
         self.file_dir = os.path.join(settings.MEDIA_ROOT, RECORD_FILE_DIR)
 
     def handle(self, *args, **options):
+        # renditions and their other formats are only listed in the JSON field, so they are collected once
+        self.rendition_names = set()
+        for renditions in RecordFile.objects.exclude(renditions=[]).values_list('renditions', flat=True).iterator():
+            self.rendition_names |= get_rendition_names(renditions)
+
         for file in os.listdir(self.file_dir):
             file_path = os.path.join(self.file_dir, file)
-            if os.path.isdir(file_path):
+            if self.is_derivative_dir(file_path):
+                self.handle_derivative_dir(os.path.join(RECORD_FILE_DIR, file))
+            elif os.path.isdir(file_path):
                 for file2 in os.listdir(file_path):
                     db_file_path = os.path.join(RECORD_FILE_DIR, file, file2)
-                    self.handle_file(db_file_path)
+                    if self.is_derivative_dir(os.path.join(file_path, file2)):
+                        self.handle_derivative_dir(db_file_path)
+                    else:
+                        self.handle_file(db_file_path)
                 self.handle_dir(file_path)
             else:
                 db_file_path = os.path.join(RECORD_FILE_DIR, file)
                 self.handle_file(db_file_path)
 
     def handle_file(self, path):
+        # page previews belong to the original they were rendered from
+        page_preview = PAGE_PREVIEW_PATTERN.search(path)
+        if page_preview and RecordFile.objects.filter(file__startswith=f'{path[:page_preview.start()]}.').exists():
+            return
+        if path in self.rendition_names:
+            return
         if not (RecordFile.objects.filter(file=path).exists()
                 or RecordFile.objects.filter(thumbnail=path).exists()
-                or RecordFile.objects.filter(preview=path)):
+                or RecordFile.objects.filter(preview=path).exists()
+                or RecordFile.objects.filter(poster=path).exists()):
             os.remove(os.path.join(settings.MEDIA_ROOT, path))
             self.stdout.write(f'Deleted file {path}')
 
+    def is_derivative_dir(self, path):
+        return path.endswith(tuple(DERIVATIVE_DIRS)) and os.path.isdir(path)
+
+    def handle_derivative_dir(self, path):
+        # HLS segments and sprite sheets are kept as long as the playlist or track of a file points to them
+        field = next(field for suffix, field in DERIVATIVE_DIRS.items() if path.endswith(suffix))
+        if not RecordFile.objects.filter(**{f'{field}__startswith': f'{path}/'}).exists():
+            shutil.rmtree(os.path.join(settings.MEDIA_ROOT, path))
+            self.stdout.write(f'Deleted dir {path}')
+
     def handle_dir(self, directory):
         if not os.listdir(directory):
             os.rmdir(directory)
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from archive.models import RecordFile
+from archive.text_extraction import extract_text, TextExtractionError
+
+BATCH_SIZE = 50
+
+
+class Command(BaseCommand):
+    help = "Extract the text layer of PDF record files into the search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', dest='all', action='store_true', default=False,
+                            help='Extract text of all PDF files, not only files which have not been processed yet')
+        parser.add_argument('--workers', dest='workers', type=int, default=4,
+                            help='Number of files processed in parallel')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=BATCH_SIZE,
+                            help='Number of files handed to a worker at once')
+
+    def handle(self, *args, **options):
+        record_files = RecordFile.objects.filter(content_type='application/pdf')
+        if not options['all']:
+            record_files = record_files.filter(text_extracted_at__isnull=True)
+        pks = list(record_files.order_by('pk').values_list('pk', flat=True))
+        batches = [pks[i:i + options['batch_size']] for i in range(0, len(pks), options['batch_size'])]
+
+        # pdftotext runs as a subprocess, so threads are enough to keep several of them busy
+        processed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for extracted, failed in executor.map(self.process_batch, batches):
+                processed += extracted
+                for record_file, error in failed:
+                    self.stderr.write(f'Could not extract text of {record_file}: {error}')
+                self.stdout.write(f'Extracted text of {processed}/{len(pks)} files')
+
+    def process_batch(self, pks):
+        extracted = 0
+        failed = []
+        try:
+            for record_file in RecordFile.objects.filter(pk__in=pks).select_related('record').order_by('pk'):
+                try:
+                    extract_text(record_file)
+                    extracted += 1
+                except (TextExtractionError, OSError) as error:
+                    failed.append((record_file, error))
+        finally:
+            connection.close()
+        return extracted, failed
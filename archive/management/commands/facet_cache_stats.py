@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from archive.cache import get_facet_cache_stats, reset_facet_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show hit and miss counters of the facet cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', dest='reset', action='store_true', default=False,
+                            help='Reset the counters after showing them')
+
+    def handle(self, *args, **options):
+        stats = get_facet_cache_stats()
+        self.stdout.write(f'Hits: {stats["hits"]}')
+        self.stdout.write(f'Misses: {stats["misses"]}')
+        self.stdout.write(f'Hit ratio: {stats["hit_ratio"]:.1%}')
+        if options['reset']:
+            reset_facet_cache_stats()
@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from archive.models import RecordFile
+from archive.thumbnails import add_image_formats, get_image_formats
+
+
+def convert(item):
+    pk, renditions, preview_name = item
+    try:
+        return pk, add_image_formats(renditions, preview_name), None
+    except OSError as error:
+        return pk, None, error
+
+
+class Command(BaseCommand):
+    help = "Add WebP and AVIF versions of existing image renditions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', dest='workers', type=int, default=os.cpu_count(),
+                            help='Number of processes encoding images in parallel')
+
+    def handle(self, *args, **options):
+        image_formats = set(get_image_formats())
+        if not image_formats:
+            self.stderr.write('Pillow supports none of the formats in IMAGE_RENDITION_FORMATS')
+            return
+
+        items = []
+        record_files = RecordFile.objects.filter(content_type__startswith='image/').only('pk', 'renditions', 'preview')
+        for record_file in record_files.order_by('pk').iterator():
+            if record_file.renditions:
+                if any(image_formats - set(rendition.get('formats', {})) for rendition in record_file.renditions):
+                    items.append((record_file.pk, record_file.renditions, None))
+            elif record_file.preview:
+                # files from before renditions existed are converted from their preview
+                items.append((record_file.pk, [], record_file.preview.name))
+
+        # encoding is CPU bound, so it runs in processes; they only touch files, the database is updated here
+        connections.close_all()
+        converted = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            for pk, renditions, error in executor.map(convert, items, chunksize=10):
+                if error:
+                    self.stderr.write(f'Could not convert renditions of record file {pk}: {error}')
+                    continue
+                record_file = RecordFile.objects.filter(pk=pk).first()
+                if record_file is not None:
+                    record_file.renditions = renditions
+                    record_file.save(update_fields=['renditions'])
+                converted += 1
+                if converted % 100 == 0:
+                    self.stdout.write(f'Converted {converted}/{len(items)} files')
+        self.stdout.write(f'Converted {converted}/{len(items)} files')
@@ -1,20 +1,20 @@
-from django.core.management.base import BaseCommand
+from django.db.models import Q
 
-from archive.models import RecordFile
-from archive.thumbnails import generate_preview
+from archive.management.derivatives import DerivativeCommand, get_image_files, get_missing
+from archive.thumbnails import get_image_preview_signature
+from archive.video import get_preview_signature
 
 
-class Command(BaseCommand):
-    help = "Generate previews for record files"
+class Command(DerivativeCommand):
+    help = "Generate missing and outdated previews for record files"
+    kind = 'preview'
 
-    def add_arguments(self, parser):
-        parser.add_argument('--regen', dest='regen', action='store_true', default=False,
-                            help='Regenerate all previews')
-
-    def handle(self, *args, **options):
-        if 'regen' in options and options['regen']:
-            record_files = RecordFile.objects.all()
-        else:
-            record_files = RecordFile.objects.filter(preview__isnull=True)
-        for record_file in record_files:
-            generate_preview(record_file)
+    def get_selection(self, regen):
+        images = Q(content_type__startswith='image/') & get_image_files()
+        videos = Q(content_type__startswith='video/')
+        if regen:
+            return images | videos
+        # images and videos are previewed with different settings, each has its own signature
+        missing = get_missing('preview')
+        return images & (missing | ~Q(preview_signature=get_image_preview_signature())) | \
+            videos & (missing | ~Q(preview_signature=get_preview_signature()))
@@ -1,20 +1,16 @@
-from django.core.management.base import BaseCommand
+from django.db.models import Q
 
-from archive.models import RecordFile
-from archive.thumbnails import generate_thumbnail
+from archive.management.derivatives import DerivativeCommand, get_image_files, get_missing
+from archive.thumbnails import get_thumbnail_signature
 
 
-class Command(BaseCommand):
-    help = "Generate thumbnails for record files"
+class Command(DerivativeCommand):
+    help = "Generate missing and outdated thumbnails for record files"
+    kind = 'thumbnail'
 
-    def add_arguments(self, parser):
-        parser.add_argument('--regen', dest='regen', action='store_true', default=False,
-                            help='Regenerate all thumbnails')
-
-    def handle(self, *args, **options):
-        if 'regen' in options and options['regen']:
-            record_files = RecordFile.objects.all()
-        else:
-            record_files = RecordFile.objects.filter(thumbnail__isnull=True)
-        for record_file in record_files:
-            generate_thumbnail(record_file)
+    def get_selection(self, regen):
+        # the files generate_thumbnail has a branch for
+        selection = Q(content_type__startswith='video/') | Q(file__endswith='.pdf') | get_image_files()
+        if regen:
+            return selection
+        return selection & (get_missing('thumbnail') | ~Q(thumbnail_signature=get_thumbnail_signature()))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from archive.iiif import build_tiles
+from archive.models import RecordFile
+
+
+class Command(BaseCommand):
+    help = "Build IIIF tile pyramids for large images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--regen', dest='regen', action='store_true', default=False,
+                            help='Rebuild all tile pyramids')
+
+    def handle(self, *args, **options):
+        min_size = settings.IIIF_TILE_MIN_SIZE
+        record_files = RecordFile.objects.filter(content_type__startswith='image/') \
+            .filter(Q(width__gt=min_size) | Q(height__gt=min_size))
+        if not options['regen']:
+            record_files = record_files.filter(tiles_generated_at__isnull=True)
+        for record_file in record_files.iterator():
+            build_tiles(record_file)
@@ -0,0 +1,206 @@
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from archive import search
+from archive.cache import bump_collection_generation, bump_tag_generation
+from archive.counters import COUNTER_MODELS, adjust
+from archive.management.batch import Checkpoint, read_manifest, parse_list, parse_bool, parse_date, get_file_name, \
+    get_import_key, prepare_file
+from archive.models import Collection, Record, RecordCategory, RecordFile, RecordTag
+from archive.jobs import queue_jobs
+from archive.tasks import get_derivative_tasks, get_priority, send
+
+CHUNK_SIZE = 500
+TASK_CHUNK_SIZE = 50
+
+
+def is_chunkable(task):
+    # the time limit and late acknowledgement of a task don't apply to the starmap task running its chunk, so long
+    # running tasks like transcoding would be killed by the global time limit halfway through a chunk
+    return task.time_limit is None and not task.acks_late
+
+
+class Command(BaseCommand):
+    help = "Import records and files listed in a CSV or JSONL manifest"
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', help='CSV file with a header row or JSONL file, one record per row with '
+                                             'title, category, description, physical_location, physical_signature, '
+                                             'origin_date, public, tags and files; lists are separated by ";" in CSV')
+        parser.add_argument('--source', dest='source', required=True,
+                            help='Directory the file paths in the manifest are relative to')
+        parser.add_argument('--collection', dest='collection', type=int, required=True,
+                            help='ID of the collection the records are added to')
+        parser.add_argument('--link', dest='link', action='store_true', default=False,
+                            help='Hardlink files instead of copying them')
+        parser.add_argument('--workers', dest='workers', type=int, default=4,
+                            help='Number of files copied and hashed in parallel')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=CHUNK_SIZE,
+                            help='Number of manifest rows imported per transaction')
+        parser.add_argument('--checkpoint', dest='checkpoint', default=None,
+                            help='Checkpoint file, defaults to the manifest path with .checkpoint appended')
+        parser.add_argument('--restart', dest='restart', action='store_true', default=False,
+                            help='Ignore an existing checkpoint')
+        parser.add_argument('--no-derivatives', dest='derivatives', action='store_false', default=True,
+                            help="Don't queue thumbnail, preview, text extraction and OCR jobs")
+
+    def handle(self, *args, **options):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('The database does not return primary keys from bulk inserts')
+        try:
+            self.collection = Collection.objects.get(pk=options['collection'])
+        except Collection.DoesNotExist:
+            raise CommandError(f'Collection {options["collection"]} does not exist')
+
+        self.options = options
+        self.categories = {category.name: category for category in RecordCategory.objects.all()}
+        checkpoint = Checkpoint(options['checkpoint'] or f'{options["manifest"]}.checkpoint', options['manifest'])
+        if not options['restart']:
+            checkpoint.load()
+        if checkpoint.rows:
+            self.stdout.write(f'Resuming after row {checkpoint.rows}')
+
+        rows = ((number, row) for number, row in read_manifest(options['manifest']) if number > checkpoint.rows)
+        imported = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            self.executor = executor
+            while True:
+                chunk = list(islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                imported += self.import_chunk(chunk)
+                checkpoint.save(chunk[-1][0])
+                self.stdout.write(f'Imported {imported} records, {checkpoint.rows} rows done')
+
+        checkpoint.delete()
+        self.stdout.write(f'Import finished, {imported} records imported')
+
+    def import_chunk(self, chunk):
+        entries = [self.parse_row(number, row) for number, row in chunk]
+
+        # rows of a chunk whose transaction committed before the checkpoint was saved already have their records
+        keys = [entry['record'].import_key for entry in entries]
+        existing = set(Record.objects.filter(import_key__in=keys).values_list('import_key', flat=True))
+        entries = [entry for entry in entries if entry['record'].import_key not in existing]
+
+        jobs = [(source, name) for entry in entries for source, name in entry['files']]
+        prepared = dict(zip((name for _, name in jobs), self.executor.map(
+            lambda job: prepare_file(job[0], job[1], self.options['link']), jobs)))
+
+        with transaction.atomic():
+            record_files = self.create_records(entries, prepared)
+        if self.options['derivatives']:
+            self.enqueue(record_files)
+        return len(entries)
+
+    def parse_row(self, number, row):
+        title = (row.get('title') or '').strip()
+        category_name = (row.get('category') or '').strip()
+        if not title or not category_name:
+            raise CommandError(f'Row {number}: title and category are required')
+        try:
+            origin_date = parse_date(row.get('origin_date'))
+        except ValueError as error:
+            raise CommandError(f'Row {number}: {error}')
+
+        files = []
+        for path in parse_list(row.get('files')):
+            source = os.path.join(self.options['source'], path)
+            if not os.path.isfile(source):
+                raise CommandError(f'Row {number}: file {source} does not exist')
+            files.append((source, get_file_name(self.options['manifest'], number, path)))
+
+        if category_name not in self.categories:
+            self.categories[category_name] = RecordCategory.objects.get_or_create(name=category_name)[0]
+        record = Record(title=title, category=self.categories[category_name], collection=self.collection,
+                        description=row.get('description') or None,
+                        physical_location=row.get('physical_location') or None,
+                        physical_signature=row.get('physical_signature') or None,
+                        origin_date=origin_date, public=parse_bool(row.get('public')),
+                        import_key=get_import_key(self.options['manifest'], number))
+        tags = {}
+        for name in parse_list(row.get('tags')):
+            tags.setdefault(name.lower(), name)
+        return {'record': record, 'tags': list(tags.values()), 'files': files}
+
+    def create_records(self, entries, prepared):
+        now = timezone.now()
+        for entry in entries:
+            record = entry['record']
+            entry['record_files'] = [RecordFile(file=name, content_type=prepared[name].content_type,
+                                                size_bytes=prepared[name].size, checksum=prepared[name].checksum)
+                                     for _, name in entry['files']]
+            # bulk_create skips the signals, so the fields Record.update_cover maintains are set here
+            if entry['record_files']:
+                record.media_kind = entry['record_files'][0].get_media_kind()
+                record.files_updated_at = now
+        Record.objects.bulk_create([entry['record'] for entry in entries])
+
+        record_files = []
+        for entry in entries:
+            for record_file in entry['record_files']:
+                record_file.record = entry['record']
+                record_files.append(record_file)
+        RecordFile.objects.bulk_create(record_files)
+
+        self.create_tags(entries)
+        self.update_counters(entries)
+        search.index_records(Record.objects.filter(pk__in=[entry['record'].pk for entry in entries])
+                             .select_related('category').prefetch_related('tags'))
+        bump_collection_generation(self.collection.pk)
+        return record_files
+
+    def create_tags(self, entries):
+        names = {}
+        for entry in entries:
+            for name in entry['tags']:
+                names.setdefault(name.lower(), name)
+        if not names:
+            return
+        RecordTag.objects.bulk_create([RecordTag(name=name) for name in names.values()], ignore_conflicts=True)
+        # the database may lowercase differently than Python, so exact names are looked up as well
+        candidates = RecordTag.objects.annotate(lower_name=Lower('name')) \
+            .filter(Q(lower_name__in=list(names)) | Q(name__in=list(names.values())))
+        tags = {tag.name.lower(): tag for tag in candidates}
+        RecordTags = Record.tags.through
+        RecordTags.objects.bulk_create([RecordTags(record_id=entry['record'].pk, recordtag_id=tags[name.lower()].pk)
+                                        for entry in entries for name in entry['tags']], ignore_conflicts=True)
+        bump_tag_generation()
+
+    def update_counters(self, entries):
+        deltas = defaultdict(Counter)
+        for entry in entries:
+            record = entry['record']
+            for model, field in COUNTER_MODELS:
+                counters = deltas[model, getattr(record, field)]
+                counters['record_count'] += 1
+                counters['public_record_count'] += int(record.public)
+                counters['file_count'] += len(entry['record_files'])
+                counters['bytes_total'] += sum(record_file.size_bytes for record_file in entry['record_files'])
+        for (model, pk), counters in deltas.items():
+            adjust(model, pk, **counters)
+
+    def enqueue(self, record_files):
+        # one message per TASK_CHUNK_SIZE files instead of one per file; chunks run as celery.starmap, so the queue of
+        # the task is passed explicitly, and imports wait behind interactive uploads
+        files_by_task = defaultdict(list)
+        for record_file in record_files:
+            for task in get_derivative_tasks(record_file):
+                files_by_task[task].append(record_file)
+        for task, files in files_by_task.items():
+            queue_jobs([record_file.pk for record_file in files], task.job_kind)
+            if not is_chunkable(task):
+                for record_file in files:
+                    send(task, record_file.pk, backfill=True)
+                continue
+            task.chunks([(record_file.pk, True) for record_file in files], TASK_CHUNK_SIZE) \
+                .apply_async(queue=settings.CELERY_TASK_ROUTES[task.name]['queue'], priority=get_priority(True))
\ No newline at end of file
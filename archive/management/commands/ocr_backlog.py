@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from archive.models import RecordFile
+from archive.ocr import OCR_CONTENT_TYPES
+from archive.tasks import enqueue, ocr_record_file
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Queue OCR jobs for record files which have not been completely recognized yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', dest='limit', type=int, default=None,
+                            help='Maximum number of files to queue')
+        parser.add_argument('--status', dest='status', action='store_true', default=False,
+                            help='Only show the size of the backlog')
+
+    def handle(self, *args, **options):
+        record_files = RecordFile.objects.filter(content_type__in=OCR_CONTENT_TYPES, ocr_completed_at__isnull=True)
+        total = record_files.count()
+        if options['status']:
+            done = RecordFile.objects.filter(content_type__in=OCR_CONTENT_TYPES, ocr_completed_at__isnull=False)
+            self.stdout.write(f'{total} files pending, {done.count()} files completed')
+            return
+
+        # already recognized pages are skipped by the task, so queueing a file again is safe
+        limit = min(total, options['limit']) if options['limit'] is not None else total
+        queued = 0
+        last_pk = 0
+        while queued < limit:
+            pks = list(record_files.filter(pk__gt=last_pk).order_by('pk')
+                       .values_list('pk', flat=True)[:min(CHUNK_SIZE, limit - queued)])
+            if not pks:
+                break
+            for pk in pks:
+                enqueue(ocr_record_file, pk, backfill=True)
+            queued += len(pks)
+            last_pk = pks[-1]
+            self.stdout.write(f'Queued {queued}/{limit} files')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from archive.models import Record
+from archive.search import get_backend
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full text search index for all records"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=CHUNK_SIZE,
+                            help='Number of records indexed per transaction')
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.clear()
+
+        queryset = Record.objects.select_related('category').prefetch_related('tags').order_by('pk')
+        indexed = 0
+        last_pk = 0
+        while True:
+            records = list(queryset.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not records:
+                break
+            with transaction.atomic():
+                backend.index_records(records)
+            indexed += len(records)
+            last_pk = records[-1].pk
+            self.stdout.write(f'Indexed {indexed} records')
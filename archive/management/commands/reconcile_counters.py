@@ -0,0 +1,41 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from archive.counters import reconcile_counters
+from archive.models import RecordFile
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Recompute the record, file and storage counters of collections and categories"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', dest='sizes', action='store_true', default=False,
+                            help='Read the size of files without a stored size from disk first')
+
+    def handle(self, *args, **options):
+        if options['sizes']:
+            self.store_sizes()
+        reconcile_counters()
+        self.stdout.write('Counters reconciled')
+
+    def store_sizes(self):
+        record_files = RecordFile.objects.filter(size_bytes__isnull=True).order_by('pk').only('pk', 'file')
+        last_pk = 0
+        stored = 0
+        while True:
+            chunk = list(record_files.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+            if not chunk:
+                break
+            for record_file in chunk:
+                try:
+                    record_file.size_bytes = os.path.getsize(os.path.join(settings.MEDIA_ROOT, record_file.file.name))
+                except OSError as error:
+                    self.stderr.write(f'Could not read size of {record_file}: {error}')
+            # bulk_update skips the counter signals, the counters are recomputed afterwards
+            stored += RecordFile.objects.bulk_update(chunk, ['size_bytes'])
+            last_pk = chunk[-1].pk
+            self.stdout.write(f'Stored size of {stored} files')
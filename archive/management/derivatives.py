@@ -0,0 +1,127 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from itertools import repeat
+from operator import or_
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min, Q
+
+from archive.management.batch import RangeCheckpoint, Progress
+from archive.models import RecordFile
+from archive.thumbnails import IMAGE_EXTS, generate_thumbnail, generate_preview
+
+CHUNK_SIZE = 100
+
+GENERATORS = {
+    'thumbnail': generate_thumbnail,
+    'preview': generate_preview,
+}
+
+
+def get_missing(field):
+    # files without a derivative have an empty name, older rows may have NULL
+    return Q(**{field: ''}) | Q(**{f'{field}__isnull': True})
+
+
+def get_image_files():
+    # the extensions generate_thumbnail and generate_preview decode with Pillow
+    return reduce(or_, [Q(file__iendswith=ext) for ext in IMAGE_EXTS]) & ~Q(content_type__startswith='video/')
+
+
+def generate(kind, selection, start, end):
+    # runs in the worker processes, which select and load the files of their primary key range themselves
+    count = 0
+    errors = []
+    for record_file in RecordFile.objects.filter(selection, pk__gt=start, pk__lte=end).order_by('pk').iterator():
+        try:
+            GENERATORS[kind](record_file)
+        except Exception as error:
+            errors.append((record_file.pk, f'{type(error).__name__}: {error}'))
+        count += 1
+    return end, count, errors
+
+
+class DerivativeCommand(BaseCommand):
+    kind = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--regen', dest='regen', action='store_true', default=False,
+                            help=f'Regenerate all {self.kind}s instead of missing and outdated ones')
+        parser.add_argument('--collection', dest='collection', type=int, default=None,
+                            help='Only files of records in this collection')
+        parser.add_argument('--content-type', dest='content_types', action='append', default=[],
+                            help='Only files whose content type starts with this, e.g. image/ or application/pdf; '
+                                 'may be given more than once')
+        parser.add_argument('--workers', dest='workers', type=int, default=os.cpu_count(),
+                            help=f'Number of processes generating {self.kind}s in parallel')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=CHUNK_SIZE,
+                            help='Size of the primary key ranges handed to the workers')
+        parser.add_argument('--checkpoint', dest='checkpoint', default=f'{self.kind}s.checkpoint',
+                            help='Checkpoint file an interrupted run resumes from')
+        parser.add_argument('--restart', dest='restart', action='store_true', default=False,
+                            help='Ignore an existing checkpoint')
+
+    def get_selection(self, regen):
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers and --chunk-size must be at least 1')
+
+        selection = self.get_selection(options['regen'])
+        if options['collection'] is not None:
+            selection &= Q(record__collection_id=options['collection'])
+        if options['content_types']:
+            selection &= reduce(or_, [Q(content_type__startswith=content_type)
+                                      for content_type in options['content_types']])
+
+        checkpoint = RangeCheckpoint(options['checkpoint'], json.dumps({
+            'kind': self.kind,
+            'regen': options['regen'],
+            'collection': options['collection'],
+            'content_types': sorted(options['content_types']),
+        }))
+        if not options['restart']:
+            checkpoint.load()
+        if checkpoint.pk:
+            self.stdout.write(f'Resuming after record file {checkpoint.pk}')
+
+        record_files = RecordFile.objects.filter(selection, pk__gt=checkpoint.pk)
+        bounds = record_files.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            checkpoint.delete()
+            self.stdout.write(f'No {self.kind}s to generate')
+            return
+        total = record_files.count()
+        starts = range(bounds['first'] - 1, bounds['last'], options['chunk_size'])
+        ends = [min(start + options['chunk_size'], bounds['last']) for start in starts]
+
+        progress = Progress(self.stdout, total)
+        errors = 0
+        items = (repeat(self.kind), repeat(selection), starts, ends)
+        if options['workers'] == 1:
+            results = map(generate, *items)
+            executor = None
+        else:
+            # the workers open their own database connections, none may be inherited from this process
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=options['workers'])
+            results = executor.map(generate, *items)
+        try:
+            # results arrive in the order of the ranges, so everything up to the saved key is done
+            for end, count, file_errors in results:
+                for pk, error in file_errors:
+                    self.stderr.write(f'Could not generate {self.kind} of record file {pk}: {error}')
+                errors += len(file_errors)
+                progress.update(count)
+                checkpoint.save(end)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        progress.finish()
+        checkpoint.delete()
+        self.stdout.write(f'Generated {progress.done - errors} {self.kind}s, {errors} failed')
@@ -0,0 +1,71 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def get_media_kind(content_type):
+    if content_type.startswith('image/'):
+        return 'image'
+    if content_type == 'application/pdf':
+        return 'pdf'
+    if content_type.startswith('video/'):
+        return 'video'
+    if content_type == 'application/wacz':
+        return 'wacz'
+    return 'other'
+
+
+def populate_cover(apps, schema_editor):
+    Record = apps.get_model('archive', 'Record')
+    RecordFile = apps.get_model('archive', 'RecordFile')
+    for record in Record.objects.all():
+        record_files = list(RecordFile.objects.filter(record=record).order_by('pk'))
+        if not record_files:
+            continue
+        record.cover_file = next((record_file for record_file in record_files if record_file.thumbnail), None)
+        record.media_kind = get_media_kind(record_files[0].content_type)
+        Record.objects.filter(pk=record.pk).update(cover_file=record.cover_file, media_kind=record.media_kind)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0015_alter_recordtag_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="cover_file",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="archive.recordfile",
+                verbose_name="Cover file",
+            ),
+        ),
+        migrations.AddField(
+            model_name="record",
+            name="media_kind",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("", "-"),
+                    ("image", "Bild"),
+                    ("pdf", "PDF"),
+                    ("video", "Video"),
+                    ("wacz", "Web archive"),
+                    ("other", "Other"),
+                ],
+                default="",
+                editable=False,
+                max_length=10,
+                verbose_name="Media kind",
+            ),
+        ),
+        migrations.RunPython(populate_cover, migrations.RunPython.noop),
+    ]
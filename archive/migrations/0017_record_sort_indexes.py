@@ -0,0 +1,41 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0016_record_cover_file_media_kind"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                fields=["collection", "public", "origin_date", "id"],
+                name="record_coll_pub_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                fields=["collection", "public", "title", "id"],
+                name="record_coll_pub_title_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                fields=["collection", "public", "created_at", "id"],
+                name="record_coll_pub_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                fields=["collection", "public", "updated_at", "id"],
+                name="record_coll_pub_updated_idx",
+            ),
+        ),
+    ]
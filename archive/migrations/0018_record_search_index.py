@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db import migrations
+
+SQLITE_CREATE = """
+CREATE VIRTUAL TABLE archive_record_search USING fts5(
+    title, description, location, category, tags,
+    collection_id UNINDEXED, public UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+SQLITE_POPULATE = """
+INSERT INTO archive_record_search (rowid, title, description, location, category, tags, collection_id, public)
+SELECT r.id, r.title, COALESCE(r.description, ''),
+       TRIM(COALESCE(r.physical_location, '') || ' ' || COALESCE(r.physical_signature, '')), c.name,
+       COALESCE((SELECT GROUP_CONCAT(t.name, ' ') FROM archive_record_tags rt
+                 JOIN archive_recordtag t ON t.id = rt.recordtag_id WHERE rt.record_id = r.id), ''),
+       r.collection_id, r.public
+FROM archive_record r JOIN archive_recordcategory c ON c.id = r.category_id
+"""
+
+POSTGRES_CREATE = """
+CREATE TABLE archive_record_search (
+    record_id bigint PRIMARY KEY,
+    collection_id bigint NOT NULL,
+    public boolean NOT NULL,
+    title text NOT NULL,
+    body text NOT NULL,
+    document tsvector NOT NULL
+);
+CREATE INDEX archive_record_search_document_idx ON archive_record_search USING GIN (document);
+"""
+
+POSTGRES_POPULATE = """
+INSERT INTO archive_record_search (record_id, collection_id, public, title, body, document)
+SELECT r.id, r.collection_id, r.public, r.title,
+       CONCAT_WS(' ', r.description, r.physical_location, r.physical_signature, tags.names),
+       setweight(to_tsvector(%(config)s::regconfig, r.title), 'A') ||
+       setweight(to_tsvector(%(config)s::regconfig, CONCAT_WS(' ', tags.names, c.name)), 'B') ||
+       setweight(to_tsvector(%(config)s::regconfig, CONCAT_WS(' ', r.physical_location, r.physical_signature)), 'C') ||
+       setweight(to_tsvector(%(config)s::regconfig, COALESCE(r.description, '')), 'D')
+FROM archive_record r
+JOIN archive_recordcategory c ON c.id = r.category_id
+LEFT JOIN LATERAL (SELECT STRING_AGG(t.name, ' ') AS names FROM archive_record_tags rt
+                   JOIN archive_recordtag t ON t.id = rt.recordtag_id WHERE rt.record_id = r.id) tags ON TRUE
+"""
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+        schema_editor.execute(SQLITE_POPULATE)
+    elif vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_CREATE)
+        schema_editor.execute(POSTGRES_POPULATE, {'config': settings.SEARCH_CONFIG})
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE archive_record_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0017_record_sort_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0018_record_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordfile",
+            name="text_extracted_at",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="Text extracted at"
+            ),
+        ),
+        migrations.CreateModel(
+            name="RecordFilePage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.PositiveIntegerField(verbose_name="Page number")),
+                ("text", models.TextField(blank=True, verbose_name="Text")),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("text", "Text layer")],
+                        default="text",
+                        max_length=10,
+                        verbose_name="Source",
+                    ),
+                ),
+                (
+                    "record_file",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="pages",
+                        to="archive.recordfile",
+                        verbose_name="Record file",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["record_file", "number"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="recordfilepage",
+            constraint=models.UniqueConstraint(
+                fields=("record_file", "number"), name="recordfilepage_unique_number"
+            ),
+        ),
+    ]
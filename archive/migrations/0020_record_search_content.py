@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.db import migrations
+
+SQLITE_CREATE = """
+CREATE VIRTUAL TABLE archive_record_search USING fts5(
+    title, description, location, category, tags, content,
+    collection_id UNINDEXED, public UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+SQLITE_POPULATE = """
+INSERT INTO archive_record_search (rowid, title, description, location, category, tags, content, collection_id,
+                                   public)
+SELECT r.id, r.title, COALESCE(r.description, ''),
+       TRIM(COALESCE(r.physical_location, '') || ' ' || COALESCE(r.physical_signature, '')), c.name,
+       COALESCE((SELECT GROUP_CONCAT(t.name, ' ') FROM archive_record_tags rt
+                 JOIN archive_recordtag t ON t.id = rt.recordtag_id WHERE rt.record_id = r.id), ''),
+       SUBSTR(COALESCE((SELECT GROUP_CONCAT(p.text, CHAR(10)) FROM archive_recordfilepage p
+                        JOIN archive_recordfile f ON f.id = p.record_file_id WHERE f.record_id = r.id), ''),
+              1, %s),
+       r.collection_id, r.public
+FROM archive_record r JOIN archive_recordcategory c ON c.id = r.category_id
+"""
+
+POSTGRES_POPULATE = """
+INSERT INTO archive_record_search (record_id, collection_id, public, title, body, document)
+SELECT r.id, r.collection_id, r.public, r.title,
+       CONCAT_WS(' ', r.description, r.physical_location, r.physical_signature, tags.names, pages.content),
+       setweight(to_tsvector(%(config)s::regconfig, r.title), 'A') ||
+       setweight(to_tsvector(%(config)s::regconfig, CONCAT_WS(' ', tags.names, c.name)), 'B') ||
+       setweight(to_tsvector(%(config)s::regconfig, CONCAT_WS(' ', r.physical_location, r.physical_signature)), 'C') ||
+       setweight(to_tsvector(%(config)s::regconfig, CONCAT_WS(' ', r.description, pages.content)), 'D')
+FROM archive_record r
+JOIN archive_recordcategory c ON c.id = r.category_id
+LEFT JOIN LATERAL (SELECT STRING_AGG(t.name, ' ') AS names FROM archive_record_tags rt
+                   JOIN archive_recordtag t ON t.id = rt.recordtag_id WHERE rt.record_id = r.id) tags ON TRUE
+LEFT JOIN LATERAL (SELECT LEFT(STRING_AGG(p.text, E'\\n' ORDER BY p.record_file_id, p.number), %(max_length)s)
+                   AS content FROM archive_recordfilepage p
+                   JOIN archive_recordfile f ON f.id = p.record_file_id WHERE f.record_id = r.id) pages ON TRUE
+"""
+
+
+def add_search_content(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE archive_record_search')
+        schema_editor.execute(SQLITE_CREATE)
+        schema_editor.execute(SQLITE_POPULATE, [settings.SEARCH_MAX_CONTENT_LENGTH])
+    elif vendor == 'postgresql':
+        schema_editor.execute('TRUNCATE archive_record_search')
+        schema_editor.execute(POSTGRES_POPULATE, {'config': settings.SEARCH_CONFIG,
+                                                  'max_length': settings.SEARCH_MAX_CONTENT_LENGTH})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0019_recordfilepage"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_content, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0020_record_search_content"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="recordfilepage",
+            options={"ordering": ["record_file", "number", "source"]},
+        ),
+        migrations.RemoveConstraint(
+            model_name="recordfilepage",
+            name="recordfilepage_unique_number",
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="ocr_completed_at",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="OCR completed at"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfilepage",
+            name="height",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Height"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfilepage",
+            name="width",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="Width"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfilepage",
+            name="words",
+            field=models.JSONField(blank=True, default=list, verbose_name="Words"),
+        ),
+        migrations.AlterField(
+            model_name="recordfilepage",
+            name="source",
+            field=models.CharField(
+                choices=[("text", "Text layer"), ("ocr", "OCR")],
+                default="text",
+                max_length=10,
+                verbose_name="Source",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="recordfilepage",
+            constraint=models.UniqueConstraint(
+                fields=("record_file", "number", "source"),
+                name="recordfilepage_unique_number",
+            ),
+        ),
+    ]
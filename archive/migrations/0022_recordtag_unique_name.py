@@ -0,0 +1,42 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:56
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    RecordTag = apps.get_model('archive', 'RecordTag')
+    RecordTags = apps.get_model('archive', 'Record').tags.through
+    tags = {}
+    for tag in RecordTag.objects.order_by('pk'):
+        key = tag.name.lower()
+        if key not in tags:
+            tags[key] = tag
+            continue
+        # move the records of a duplicate to the oldest tag with the same name, then drop the duplicate
+        tagged = RecordTags.objects.filter(recordtag=tags[key]).values_list('record_id', flat=True)
+        RecordTags.objects.filter(recordtag=tag).exclude(record_id__in=list(tagged)).update(recordtag=tags[key])
+        tag.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0021_recordfilepage_ocr"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="recordtag",
+            name="name",
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name="recordtag",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("name"),
+                name="recordtag_unique_name_ci",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0022_recordtag_unique_name"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="files_updated_at",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="Files updated at"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Bearbeitet am"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0023_record_files_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collection",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Bearbeitet am"),
+        ),
+    ]
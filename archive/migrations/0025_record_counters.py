@@ -0,0 +1,102 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_records(apps, schema_editor):
+    # file sizes are unknown until `manage.py reconcile_counters --sizes` ran, so bytes_total starts at 0
+    Record = apps.get_model('archive', 'Record')
+    RecordFile = apps.get_model('archive', 'RecordFile')
+    for model_name, lookup in [('Collection', 'collection'), ('RecordCategory', 'category')]:
+        records = Record.objects.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup)
+        files = RecordFile.objects.filter(**{f'record__{lookup}': OuterRef('pk')}).order_by() \
+            .values(f'record__{lookup}')
+        apps.get_model('archive', model_name).objects.update(
+            record_count=Coalesce(Subquery(records.annotate(count=Count('pk')).values('count')), 0),
+            public_record_count=Coalesce(Subquery(records.filter(public=True).annotate(count=Count('pk'))
+                                                  .values('count')), 0),
+            file_count=Coalesce(Subquery(files.annotate(count=Count('pk')).values('count')), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0024_collection_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collection",
+            name="bytes_total",
+            field=models.PositiveBigIntegerField(
+                default=0, editable=False, verbose_name="Storage used"
+            ),
+        ),
+        migrations.AddField(
+            model_name="collection",
+            name="file_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Dateien"
+            ),
+        ),
+        migrations.AddField(
+            model_name="collection",
+            name="public_record_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Public records"
+            ),
+        ),
+        migrations.AddField(
+            model_name="collection",
+            name="record_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Records"
+            ),
+        ),
+        migrations.AddField(
+            model_name="collection",
+            name="storage_quota_bytes",
+            field=models.PositiveBigIntegerField(
+                blank=True, null=True, verbose_name="Storage quota (bytes)"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordcategory",
+            name="bytes_total",
+            field=models.PositiveBigIntegerField(
+                default=0, editable=False, verbose_name="Storage used"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordcategory",
+            name="file_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Dateien"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordcategory",
+            name="public_record_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Public records"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordcategory",
+            name="record_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Records"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="size_bytes",
+            field=models.PositiveBigIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Size"
+            ),
+        ),
+        migrations.RunPython(count_records, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0025_record_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordfile",
+            name="checksum",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=64,
+                verbose_name="SHA-256 checksum",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0026_recordfile_checksum"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                fields=["public", "updated_at", "id"], name="record_pub_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="record",
+            index=models.Index(
+                fields=["category", "public", "updated_at", "id"],
+                name="record_cat_pub_updated_idx",
+            ),
+        ),
+    ]
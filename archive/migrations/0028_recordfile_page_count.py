@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0027_record_oai_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordfile",
+            name="page_count",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Pages"
+            ),
+        ),
+    ]
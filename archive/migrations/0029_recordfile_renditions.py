@@ -0,0 +1,34 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0028_recordfile_page_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordfile",
+            name="height",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Height"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="renditions",
+            field=models.JSONField(
+                blank=True, default=list, editable=False, verbose_name="Renditions"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="width",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Width"
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0029_recordfile_renditions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordfile",
+            name="tiles_generated_at",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="Tiles generated at"
+            ),
+        ),
+    ]
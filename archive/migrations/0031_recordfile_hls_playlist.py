@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0030_recordfile_tiles_generated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordfile",
+            name="hls_playlist",
+            field=models.CharField(
+                blank=True, editable=False, max_length=500, verbose_name="HLS playlist"
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0031_recordfile_hls_playlist"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordfile",
+            name="audio_codec",
+            field=models.CharField(
+                blank=True, editable=False, max_length=30, verbose_name="Audio codec"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="bitrate",
+            field=models.PositiveBigIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Bitrate"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="duration",
+            field=models.FloatField(
+                blank=True, editable=False, null=True, verbose_name="Zeitspanne"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="poster",
+            field=models.FileField(
+                blank=True,
+                editable=False,
+                max_length=500,
+                null=True,
+                upload_to="",
+                verbose_name="Poster",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="video_codec",
+            field=models.CharField(
+                blank=True, editable=False, max_length=30, verbose_name="Video codec"
+            ),
+        ),
+    ]
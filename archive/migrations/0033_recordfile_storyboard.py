@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0032_recordfile_video_properties"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordfile",
+            name="storyboard",
+            field=models.CharField(
+                blank=True, editable=False, max_length=500, verbose_name="Storyboard"
+            ),
+        ),
+    ]
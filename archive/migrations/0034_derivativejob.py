@@ -0,0 +1,107 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0033_recordfile_storyboard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DerivativeJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("image", "Image renditions"),
+                            ("tiles", "Image tiles"),
+                            ("pdf", "PDF thumbnail"),
+                            ("video_thumbnail", "Video thumbnail"),
+                            ("transcode", "Video transcoding"),
+                            ("storyboard", "Video storyboard"),
+                            ("text", "Text extraction"),
+                            ("ocr", "OCR"),
+                        ],
+                        max_length=20,
+                        verbose_name="Kind",
+                    ),
+                ),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="queued",
+                        max_length=10,
+                        verbose_name="State",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="Attempts"),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="Error")),
+                (
+                    "queued_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Queued at"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Started at"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Finished at"
+                    ),
+                ),
+                (
+                    "record_file",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="jobs",
+                        to="archive.recordfile",
+                        verbose_name="Record file",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["record_file", "kind"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="derivativejob",
+            index=models.Index(
+                fields=["state", "queued_at"], name="derivativejob_state_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="derivativejob",
+            constraint=models.UniqueConstraint(
+                fields=("record_file", "kind"), name="derivativejob_unique_kind"
+            ),
+        ),
+    ]
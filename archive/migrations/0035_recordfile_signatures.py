@@ -0,0 +1,72 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:32
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Q
+
+# the values archive.thumbnails and archive.video sign their derivatives with at the time of this migration
+THUMB_SIZE = (400, 400)
+HLS_BITRATES = {
+    240: ('400k', '64k'),
+    360: ('800k', '96k'),
+    480: ('1400k', '128k'),
+    720: ('2800k', '128k'),
+    1080: ('5000k', '192k'),
+    1440: ('8000k', '192k'),
+    2160: ('14000k', '192k'),
+}
+HLS_SEGMENT_DURATION = 6
+
+
+def get_signature(*values):
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()[:16]
+
+
+def populate_signatures(apps, schema_editor):
+    # derivatives of the current pipeline are taken to match the current settings; single previews of images from
+    # before renditions and videos previews from before the HLS ladder stay unsigned, so they count as outdated
+    RecordFile = apps.get_model('archive', 'RecordFile')
+    RecordFile.objects.exclude(Q(thumbnail='') | Q(thumbnail__isnull=True)) \
+        .update(thumbnail_signature=get_signature(THUMB_SIZE))
+    previews = RecordFile.objects.exclude(Q(preview='') | Q(preview__isnull=True))
+    previews.filter(content_type__startswith='image/').exclude(renditions=[]) \
+        .update(preview_signature=get_signature(sorted(set(settings.IMAGE_RENDITION_WIDTHS))))
+    # transcoded to the ladder, or an original that is played as it is
+    previews.filter(content_type__startswith='video/').filter(~Q(hls_playlist='') | Q(preview=F('file'))) \
+        .update(preview_signature=get_signature(sorted(settings.VIDEO_HLS_HEIGHTS), settings.VIDEO_PREVIEW_HEIGHT,
+                                                settings.VIDEO_PRESET, settings.VIDEO_REMUX_MAX_BITRATE,
+                                                HLS_BITRATES, HLS_SEGMENT_DURATION))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0034_derivativejob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recordfile",
+            name="preview_signature",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=16,
+                verbose_name="Preview signature",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recordfile",
+            name="thumbnail_signature",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=16,
+                verbose_name="Thumbnail signature",
+            ),
+        ),
+        migrations.RunPython(populate_signatures, migrations.RunPython.noop),
+    ]
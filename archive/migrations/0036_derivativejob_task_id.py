@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0035_recordfile_signatures"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="derivativejob",
+            name="task_id",
+            field=models.CharField(blank=True, max_length=255, verbose_name="Task ID"),
+        ),
+    ]
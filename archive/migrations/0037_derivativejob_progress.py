@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0036_derivativejob_task_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="derivativejob",
+            name="progress",
+            field=models.PositiveSmallIntegerField(
+                blank=True, null=True, verbose_name="Progress"
+            ),
+        ),
+    ]
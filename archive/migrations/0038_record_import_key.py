@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0037_derivativejob_progress"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="record",
+            name="import_key",
+            field=models.UUIDField(
+                blank=True,
+                editable=False,
+                null=True,
+                unique=True,
+                verbose_name="Import key",
+            ),
+        ),
+    ]
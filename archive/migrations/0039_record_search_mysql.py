@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import migrations
+
+MYSQL_CREATE = """
+CREATE TABLE archive_record_search (
+    record_id bigint NOT NULL PRIMARY KEY,
+    collection_id bigint NOT NULL,
+    public bool NOT NULL,
+    title varchar(200) NOT NULL,
+    body longtext NOT NULL,
+    FULLTEXT INDEX archive_record_search_title_idx (title),
+    FULLTEXT INDEX archive_record_search_document_idx (title, body)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+MYSQL_POPULATE = """
+INSERT INTO archive_record_search (record_id, collection_id, public, title, body)
+SELECT r.id, r.collection_id, r.public, r.title,
+       CONCAT_WS(' ', r.description, TRIM(CONCAT_WS(' ', r.physical_location, r.physical_signature)),
+                 (SELECT GROUP_CONCAT(t.name SEPARATOR ' ') FROM archive_record_tags rt
+                  JOIN archive_recordtag t ON t.id = rt.recordtag_id WHERE rt.record_id = r.id),
+                 c.name,
+                 (SELECT GROUP_CONCAT(p.text ORDER BY p.record_file_id, p.number SEPARATOR '\\n')
+                  FROM archive_recordfilepage p
+                  JOIN archive_recordfile f ON f.id = p.record_file_id WHERE f.record_id = r.id))
+FROM archive_record r JOIN archive_recordcategory c ON c.id = r.category_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(MYSQL_CREATE)
+        # the page text of a record is cut off at SEARCH_MAX_CONTENT_LENGTH like in the other backends
+        schema_editor.execute('SET SESSION group_concat_max_len = %s', [settings.SEARCH_MAX_CONTENT_LENGTH])
+        schema_editor.execute(MYSQL_POPULATE)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP TABLE archive_record_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0038_record_import_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,15 +1,35 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.urls import reverse
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.translation import gettext as _
 import os
 import uuid
 
 
-class Collection(models.Model):
+class RecordCounters(models.Model):
+    # maintained by archive.counters, recomputed by the reconcile_counters command
+    record_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('Records'))
+    public_record_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('Public records'))
+    file_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('Files'))
+    bytes_total = models.PositiveBigIntegerField(default=0, editable=False, verbose_name=_('Storage used'))
+
+    class Meta:
+        abstract = True
+
+
+# field values remembered when loading, so the counters can be moved when they change
+COUNTED_RECORD_FIELDS = ['collection_id', 'category_id', 'public']
+COUNTED_FILE_FIELDS = ['record_id', 'size_bytes']
+
+
+class Collection(RecordCounters):
     name = models.CharField(max_length=100, verbose_name=_('Name'))
     description = models.TextField(blank=True, null=True, verbose_name=_('Description'))
     public = models.BooleanField(default=False, verbose_name=_('Public'))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Updated at'))
+    storage_quota_bytes = models.PositiveBigIntegerField(null=True, blank=True, verbose_name=_('Storage quota (bytes)'))
 
     def __str__(self):
         return self.name
@@ -24,7 +44,7 @@ class Collection(models.Model):
         ordering = ['name']
 
 
-class RecordCategory(models.Model):
+class RecordCategory(RecordCounters):
     name = models.CharField(max_length=100, unique=True, verbose_name=_('Name'))
 
     def __str__(self):
@@ -41,6 +61,14 @@ class RecordCategory(models.Model):
 
 
 class Record(models.Model):
+    class MediaKind(models.TextChoices):
+        NONE = '', _('None')
+        IMAGE = 'image', _('Image')
+        PDF = 'pdf', _('PDF')
+        VIDEO = 'video', _('Video')
+        WACZ = 'wacz', _('Web archive')
+        OTHER = 'other', _('Other')
+
     title = models.CharField(max_length=200, verbose_name=_('Title'))
     category = models.ForeignKey(RecordCategory, on_delete=models.CASCADE, verbose_name=_('Category'),
                                  related_name='records')
@@ -53,6 +81,14 @@ class Record(models.Model):
     origin_date = models.DateField(blank=True, null=True, verbose_name=_('Date of origin'))
     tags = models.ManyToManyField("RecordTag", blank=True)
     public = models.BooleanField(default=False, verbose_name=_('Public'))
+    cover_file = models.ForeignKey('RecordFile', on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                                   related_name='+', verbose_name=_('Cover file'))
+    media_kind = models.CharField(max_length=10, choices=MediaKind.choices, default=MediaKind.NONE, blank=True,
+                                  editable=False, verbose_name=_('Media kind'))
+    files_updated_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                            verbose_name=_('Files updated at'))
+    import_key = models.UUIDField(null=True, blank=True, unique=True, editable=False,
+                                  verbose_name=_('Import key'))
 
     def __str__(self):
         return self.title
@@ -65,30 +101,44 @@ class Record(models.Model):
 
     class Meta:
         ordering = ['origin_date']
+        indexes = [
+            models.Index(fields=['collection', 'public', 'origin_date', 'id'], name='record_coll_pub_date_idx'),
+            models.Index(fields=['collection', 'public', 'title', 'id'], name='record_coll_pub_title_idx'),
+            models.Index(fields=['collection', 'public', 'created_at', 'id'], name='record_coll_pub_created_idx'),
+            models.Index(fields=['collection', 'public', 'updated_at', 'id'], name='record_coll_pub_updated_idx'),
+            # OAI-PMH harvesting of all records and of category sets
+            models.Index(fields=['public', 'updated_at', 'id'], name='record_pub_updated_idx'),
+            models.Index(fields=['category', 'public', 'updated_at', 'id'], name='record_cat_pub_updated_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted = {name: getattr(instance, name) for name in COUNTED_RECORD_FIELDS
+                             if name in instance.__dict__}
+        return instance
 
     def get_absolute_url(self):
-        return reverse('record-detail', kwargs={'collection_id': self.collection.id, 'pk': self.pk})
+        return reverse('record-detail', kwargs={'collection_id': self.collection_id, 'pk': self.pk})
 
     def get_thumbnail(self):
-        thumbnail = None
-        for record_file in self.recordfile_set.all():
-            if record_file.thumbnail:
-                thumbnail = record_file
-                break
-
-        return thumbnail
+        return self.cover_file
 
     def is_video(self):
-        if self.recordfile_set.count():
-            first_file = self.recordfile_set.first()
-            return first_file.is_video()
-        return False
+        return self.media_kind == Record.MediaKind.VIDEO
 
     def is_wacz(self):
-        if self.recordfile_set.count():
-            first_file = self.recordfile_set.first()
-            return first_file.is_wacz()
-        return False
+        return self.media_kind == Record.MediaKind.WACZ
+
+    def update_cover(self):
+        # cover is the first file with a thumbnail, media kind comes from the first file; plain update keeps
+        # updated_at untouched, files_updated_at versions the cached file fragments
+        record_files = list(self.recordfile_set.order_by('pk').only('pk', 'content_type', 'thumbnail'))
+        self.cover_file = next((record_file for record_file in record_files if record_file.thumbnail), None)
+        self.media_kind = record_files[0].get_media_kind() if record_files else Record.MediaKind.NONE
+        self.files_updated_at = timezone.now()
+        Record.objects.filter(pk=self.pk).update(cover_file=self.cover_file, media_kind=self.media_kind,
+                                                 files_updated_at=self.files_updated_at)
 
 
 def get_file_path(instance, filename):
@@ -101,6 +151,36 @@ class RecordFile(models.Model):
     content_type = models.CharField(max_length=50, verbose_name=_('Content-Type'), default='application/octet-stream')
     thumbnail = models.FileField(max_length=500, verbose_name=_('Thumbnail'), null=True, blank=True)
     preview = models.FileField(max_length=500, verbose_name=_('Preview'), null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_('Updated at'))
+    size_bytes = models.PositiveBigIntegerField(null=True, blank=True, editable=False, verbose_name=_('Size'))
+    checksum = models.CharField(max_length=64, blank=True, editable=False, db_index=True,
+                                verbose_name=_('SHA-256 checksum'))
+    text_extracted_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                             verbose_name=_('Text extracted at'))
+    ocr_completed_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                            verbose_name=_('OCR completed at'))
+    page_count = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name=_('Pages'))
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name=_('Width'))
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name=_('Height'))
+    # scaled JPEG copies of images as {'width', 'height', 'name'}, ordered by width
+    renditions = models.JSONField(default=list, blank=True, editable=False, verbose_name=_('Renditions'))
+    tiles_generated_at = models.DateTimeField(null=True, blank=True, editable=False,
+                                              verbose_name=_('Tiles generated at'))
+    # stream properties of videos as reported by ffprobe, bitrate in bits per second
+    video_codec = models.CharField(max_length=30, blank=True, editable=False, verbose_name=_('Video codec'))
+    audio_codec = models.CharField(max_length=30, blank=True, editable=False, verbose_name=_('Audio codec'))
+    duration = models.FloatField(null=True, blank=True, editable=False, verbose_name=_('Duration'))
+    bitrate = models.PositiveBigIntegerField(null=True, blank=True, editable=False, verbose_name=_('Bitrate'))
+    poster = models.FileField(max_length=500, verbose_name=_('Poster'), null=True, blank=True, editable=False)
+    # master playlist of the HLS ladder of a video, relative to MEDIA_ROOT
+    hls_playlist = models.CharField(max_length=500, blank=True, editable=False, verbose_name=_('HLS playlist'))
+    # WebVTT track of the sprite sheets for skimming a video, relative to MEDIA_ROOT
+    storyboard = models.CharField(max_length=500, blank=True, editable=False, verbose_name=_('Storyboard'))
+    # settings the thumbnail and preview were generated with, see gen_thumbs and gen_previews
+    thumbnail_signature = models.CharField(max_length=16, blank=True, editable=False,
+                                           verbose_name=_('Thumbnail signature'))
+    preview_signature = models.CharField(max_length=16, blank=True, editable=False,
+                                         verbose_name=_('Preview signature'))
 
     def __str__(self):
         return os.path.basename(self.file.name)
@@ -109,6 +189,13 @@ class RecordFile(models.Model):
         return f'RecordFile(record={self.record!r}, file={self.file!r}, content_type={self.content_type!r}, ' \
                f'thumbnail={self.thumbnail!r}, preview={self.preview!r})'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted = {name: getattr(instance, name) for name in COUNTED_FILE_FIELDS
+                             if name in instance.__dict__}
+        return instance
+
     def get_absolute_url(self):
         return reverse('record-files-get', kwargs={'collection_id': self.record.collection.pk,
                                                    'record_id': self.record.pk,
@@ -126,12 +213,112 @@ class RecordFile(models.Model):
     def is_video(self):
         return self.content_type.startswith('video/')
 
+    def get_media_kind(self):
+        if self.is_image():
+            return Record.MediaKind.IMAGE
+        if self.is_pdf():
+            return Record.MediaKind.PDF
+        if self.is_video():
+            return Record.MediaKind.VIDEO
+        if self.is_wacz():
+            return Record.MediaKind.WACZ
+        return Record.MediaKind.OTHER
+
+    def is_paged(self):
+        return self.page_count is not None and self.page_count > 1
+
     def is_previewable(self):
-        return self.preview.name != "" or self.is_pdf() or self.is_wacz()
+        return self.preview.name != "" or self.hls_playlist != "" or self.is_pdf() or self.is_wacz()
+
+
+class RecordFilePage(models.Model):
+    class Source(models.TextChoices):
+        TEXT_LAYER = 'text', _('Text layer')
+        OCR = 'ocr', _('OCR')
+
+    record_file = models.ForeignKey(RecordFile, on_delete=models.CASCADE, related_name='pages',
+                                    verbose_name=_('Record file'))
+    number = models.PositiveIntegerField(verbose_name=_('Page number'))
+    text = models.TextField(blank=True, verbose_name=_('Text'))
+    source = models.CharField(max_length=10, choices=Source.choices, default=Source.TEXT_LAYER,
+                              verbose_name=_('Source'))
+    # word boxes as [text, left, top, width, height, confidence] in pixels of the page image
+    words = models.JSONField(default=list, blank=True, verbose_name=_('Words'))
+    width = models.PositiveIntegerField(null=True, blank=True, verbose_name=_('Width'))
+    height = models.PositiveIntegerField(null=True, blank=True, verbose_name=_('Height'))
+
+    def __str__(self):
+        return f'{self.record_file} ({self.number})'
+
+    def __repr__(self):
+        return f'RecordFilePage(record_file={self.record_file!r}, number={self.number!r}, source={self.source!r})'
+
+    class Meta:
+        ordering = ['record_file', 'number', 'source']
+        constraints = [
+            models.UniqueConstraint(fields=['record_file', 'number', 'source'], name='recordfilepage_unique_number'),
+        ]
+
+
+class DerivativeJob(models.Model):
+    # state of the latest run of one kind of derivative work for a file
+    class Kind(models.TextChoices):
+        IMAGE = 'image', _('Image renditions')
+        TILES = 'tiles', _('Image tiles')
+        PDF = 'pdf', _('PDF thumbnail')
+        VIDEO_THUMBNAIL = 'video_thumbnail', _('Video thumbnail')
+        TRANSCODE = 'transcode', _('Video transcoding')
+        STORYBOARD = 'storyboard', _('Video storyboard')
+        TEXT = 'text', _('Text extraction')
+        OCR = 'ocr', _('OCR')
+
+    class State(models.TextChoices):
+        QUEUED = 'queued', _('Queued')
+        RUNNING = 'running', _('Running')
+        DONE = 'done', _('Done')
+        FAILED = 'failed', _('Failed')
+
+    record_file = models.ForeignKey(RecordFile, on_delete=models.CASCADE, related_name='jobs',
+                                    verbose_name=_('Record file'))
+    kind = models.CharField(max_length=20, choices=Kind.choices, verbose_name=_('Kind'))
+    state = models.CharField(max_length=10, choices=State.choices, default=State.QUEUED, verbose_name=_('State'))
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_('Attempts'))
+    error = models.TextField(blank=True, verbose_name=_('Error'))
+    queued_at = models.DateTimeField(default=timezone.now, verbose_name=_('Queued at'))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Started at'))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Finished at'))
+    # percent done of a running transcode
+    progress = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name=_('Progress'))
+    # message that claimed the job, a redelivery of it may claim the running job again
+    task_id = models.CharField(max_length=255, blank=True, verbose_name=_('Task ID'))
+
+    def __str__(self):
+        return f'{self.record_file} ({self.kind})'
+
+    def __repr__(self):
+        return f'DerivativeJob(record_file={self.record_file!r}, kind={self.kind!r}, state={self.state!r})'
+
+    def get_duration(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    def is_pending(self):
+        return self.state in [DerivativeJob.State.QUEUED, DerivativeJob.State.RUNNING]
+
+    class Meta:
+        ordering = ['record_file', 'kind']
+        constraints = [
+            models.UniqueConstraint(fields=['record_file', 'kind'], name='derivativejob_unique_kind'),
+        ]
+        indexes = [
+            models.Index(fields=['state', 'queued_at'], name='derivativejob_state_idx'),
+        ]
 
 
 class RecordTag(models.Model):
-    name = models.CharField(max_length=100)
+    # unique=True is case insensitive with the default MariaDB collation, other databases use the constraint below
+    name = models.CharField(max_length=100, unique=True)
 
     def __str__(self):
         return self.name
@@ -141,3 +328,6 @@ class RecordTag(models.Model):
 
     class Meta:
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(Lower('name'), name='recordtag_unique_name_ci'),
+        ]
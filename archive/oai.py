@@ -0,0 +1,308 @@
+import base64
+import binascii
+import json
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.db.models import Min, Prefetch, Q
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from archive.models import Collection, Record, RecordCategory, RecordFile, RecordTag
+from archive.pagination import KeysetPaginator
+
+OAI_NAMESPACE = 'http://www.openarchives.org/OAI/2.0/'
+OAI_SCHEMA = 'http://www.openarchives.org/OAI/2.0/OAI-PMH.xsd'
+OAI_DC_NAMESPACE = 'http://www.openarchives.org/OAI/2.0/oai_dc/'
+OAI_DC_SCHEMA = 'http://www.openarchives.org/OAI/2.0/oai_dc.xsd'
+DC_NAMESPACE = 'http://purl.org/dc/elements/1.1/'
+XSI_NAMESPACE = 'http://www.w3.org/2001/XMLSchema-instance'
+METADATA_FORMATS = {'oai_dc': (OAI_DC_SCHEMA, OAI_DC_NAMESPACE)}
+DATESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# required arguments, optional arguments and method of OAIRepository per verb
+VERBS = {
+    'Identify': ([], [], 'identify'),
+    'ListMetadataFormats': ([], ['identifier'], 'list_metadata_formats'),
+    'ListSets': ([], [], 'list_sets'),
+    'ListIdentifiers': (['metadataPrefix'], ['from', 'until', 'set'], 'list_identifiers'),
+    'ListRecords': (['metadataPrefix'], ['from', 'until', 'set'], 'list_records'),
+    'GetRecord': (['identifier', 'metadataPrefix'], [], 'get_record'),
+}
+RESUMABLE_VERBS = ['ListIdentifiers', 'ListRecords', 'ListSets']
+
+ElementTree.register_namespace('', OAI_NAMESPACE)
+ElementTree.register_namespace('oai_dc', OAI_DC_NAMESPACE)
+ElementTree.register_namespace('dc', DC_NAMESPACE)
+ElementTree.register_namespace('xsi', XSI_NAMESPACE)
+
+
+class OAIError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def oai_tag(name):
+    return f'{{{OAI_NAMESPACE}}}{name}'
+
+
+def sub_element(parent, name, text=None, **attrib):
+    element = ElementTree.SubElement(parent, name, attrib)
+    if text is not None:
+        element.text = str(text)
+    return element
+
+
+def format_datestamp(value):
+    return value.astimezone(dt_timezone.utc).strftime(DATESTAMP_FORMAT)
+
+
+def parse_datestamp(value, until=False):
+    # returns an aware datetime and whether the value had day granularity; until is inclusive, so a day or second
+    # boundary is turned into the exclusive start of the next day or second
+    try:
+        if len(value) == 10:
+            date = datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), time(), dt_timezone.utc)
+            return (date + timedelta(days=1) if until else date), True
+        date = datetime.strptime(value, DATESTAMP_FORMAT).replace(tzinfo=dt_timezone.utc)
+        return (date + timedelta(seconds=1) if until else date), False
+    except ValueError:
+        raise OAIError('badArgument', f'Invalid datestamp: {value}')
+
+
+def get_identifier(record):
+    return f'oai:{settings.OAI_REPOSITORY_IDENTIFIER}:record/{record.pk}'
+
+
+def parse_identifier(identifier):
+    prefix = f'oai:{settings.OAI_REPOSITORY_IDENTIFIER}:record/'
+    if identifier.startswith(prefix) and identifier[len(prefix):].isdigit():
+        return int(identifier[len(prefix):])
+    raise OAIError('idDoesNotExist', f'Unknown identifier: {identifier}')
+
+
+def get_records():
+    # public records of public collections, like for anonymous users on the website
+    return Record.objects.filter(public=True, collection__public=True)
+
+
+def get_set_filter(set_spec):
+    kind, _, pk = set_spec.partition(':')
+    if pk.isdigit():
+        if kind == 'collection':
+            return Q(collection_id=int(pk))
+        if kind == 'category':
+            return Q(category_id=int(pk))
+    raise OAIError('badArgument', f'Unknown set: {set_spec}')
+
+
+def get_set_specs(record):
+    return [f'collection:{record.collection_id}', f'category:{record.category_id}']
+
+
+def encode_token(arguments, cursor):
+    data = json.dumps([arguments, cursor]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_token(token):
+    try:
+        arguments, cursor = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(arguments, dict) or not isinstance(cursor, str) or \
+                not all(isinstance(value, str) for value in arguments.values()):
+            raise ValueError
+        return arguments, cursor
+    except (binascii.Error, ValueError, TypeError):
+        raise OAIError('badResumptionToken', 'Invalid resumption token')
+
+
+class OAIRepository:
+    def __init__(self, request):
+        self.request = request
+
+    def get_arguments(self):
+        query = self.request.POST if self.request.method == 'POST' else self.request.GET
+        arguments = {}
+        for key, values in query.lists():
+            if len(values) > 1:
+                raise OAIError('badArgument', f'Repeated argument: {key}')
+            arguments[key] = values[0]
+        return arguments
+
+    def check_arguments(self, verb, arguments):
+        if verb not in VERBS:
+            raise OAIError('badVerb', 'Illegal OAI verb')
+        required, optional, _ = VERBS[verb]
+        if 'resumptionToken' in arguments and verb in RESUMABLE_VERBS:
+            if set(arguments) != {'verb', 'resumptionToken'}:
+                raise OAIError('badArgument', 'resumptionToken is an exclusive argument')
+            return
+        missing = [name for name in required if name not in arguments]
+        illegal = [name for name in arguments if name not in ['verb'] + required + optional]
+        if missing or illegal:
+            raise OAIError('badArgument', f'Illegal or missing arguments: {", ".join(missing + illegal)}')
+
+    def response(self):
+        root = ElementTree.Element(oai_tag('OAI-PMH'), {
+            f'{{{XSI_NAMESPACE}}}schemaLocation': f'{OAI_NAMESPACE} {OAI_SCHEMA}',
+        })
+        sub_element(root, oai_tag('responseDate'), format_datestamp(timezone.now()))
+        request_element = sub_element(root, oai_tag('request'), self.request.build_absolute_uri(self.request.path))
+
+        element = None
+        try:
+            arguments = self.get_arguments()
+            verb = arguments.get('verb')
+            self.check_arguments(verb, arguments)
+            # the request element only echoes the arguments of valid requests
+            request_element.attrib.update(arguments)
+            element = sub_element(root, oai_tag(verb))
+            getattr(self, VERBS[verb][2])(element, arguments)
+        except OAIError as error:
+            if element is not None:
+                root.remove(element)
+            sub_element(root, oai_tag('error'), error.message, code=error.code)
+
+        response = HttpResponse(content_type='text/xml; charset=utf-8')
+        ElementTree.ElementTree(root).write(response, encoding='utf-8', xml_declaration=True)
+        return response
+
+    def identify(self, element, arguments):
+        earliest = get_records().aggregate(earliest=Min('updated_at'))['earliest']
+        sub_element(element, oai_tag('repositoryName'), settings.OAI_REPOSITORY_NAME)
+        sub_element(element, oai_tag('baseURL'), self.request.build_absolute_uri(self.request.path))
+        sub_element(element, oai_tag('protocolVersion'), '2.0')
+        sub_element(element, oai_tag('adminEmail'), settings.OAI_ADMIN_EMAIL)
+        sub_element(element, oai_tag('earliestDatestamp'),
+                    format_datestamp(earliest or datetime(1970, 1, 1, tzinfo=dt_timezone.utc)))
+        # records that are deleted or made private are not tracked
+        sub_element(element, oai_tag('deletedRecord'), 'no')
+        sub_element(element, oai_tag('granularity'), 'YYYY-MM-DDThh:mm:ssZ')
+
+    def list_metadata_formats(self, element, arguments):
+        identifier = arguments.get('identifier')
+        if identifier and not get_records().filter(pk=parse_identifier(identifier)).exists():
+            raise OAIError('idDoesNotExist', f'Unknown identifier: {arguments["identifier"]}')
+        for prefix, (schema, namespace) in METADATA_FORMATS.items():
+            metadata_format = sub_element(element, oai_tag('metadataFormat'))
+            sub_element(metadata_format, oai_tag('metadataPrefix'), prefix)
+            sub_element(metadata_format, oai_tag('schema'), schema)
+            sub_element(metadata_format, oai_tag('metadataNamespace'), namespace)
+
+    def list_sets(self, element, arguments):
+        if 'resumptionToken' in arguments:
+            raise OAIError('badResumptionToken', 'Set lists are complete')
+        sets = [(f'collection:{collection.pk}', collection.name)
+                for collection in Collection.objects.filter(public=True).order_by('pk')]
+        sets += [(f'category:{category.pk}', category.name) for category in RecordCategory.objects.order_by('pk')]
+        for spec, name in sets:
+            set_element = sub_element(element, oai_tag('set'))
+            sub_element(set_element, oai_tag('setSpec'), spec)
+            sub_element(set_element, oai_tag('setName'), name)
+
+    def get_record(self, element, arguments):
+        self.check_metadata_prefix(arguments['metadataPrefix'])
+        record = self.get_queryset(True).filter(pk=parse_identifier(arguments['identifier'])).first()
+        if record is None:
+            raise OAIError('idDoesNotExist', f'Unknown identifier: {arguments["identifier"]}')
+        self.add_record(element, record)
+
+    def check_metadata_prefix(self, prefix):
+        if prefix not in METADATA_FORMATS:
+            raise OAIError('cannotDisseminateFormat', f'Unsupported metadata format: {prefix}')
+
+    def get_queryset(self, with_metadata):
+        queryset = get_records()
+        if not with_metadata:
+            return queryset.only('pk', 'updated_at', 'collection', 'category')
+        return queryset.select_related('category').prefetch_related(
+            Prefetch('tags', queryset=RecordTag.objects.order_by('name')),
+            Prefetch('recordfile_set', queryset=RecordFile.objects.order_by('pk').only('pk', 'record', 'content_type')))
+
+    def list_identifiers(self, element, arguments):
+        self.list_records(element, arguments, False)
+
+    def list_records(self, element, arguments, with_metadata=True):
+        cursor = None
+        if 'resumptionToken' in arguments:
+            arguments, cursor = decode_token(arguments['resumptionToken'])
+            if 'metadataPrefix' not in arguments:
+                raise OAIError('badResumptionToken', 'Invalid resumption token')
+        self.check_metadata_prefix(arguments['metadataPrefix'])
+
+        # a range scan on the (public, updated_at, id) or (set, public, updated_at, id) indexes
+        queryset = self.get_queryset(with_metadata)
+        granularities = set()
+        if 'from' in arguments:
+            start, day_granularity = parse_datestamp(arguments['from'])
+            queryset = queryset.filter(updated_at__gte=start)
+            granularities.add(day_granularity)
+        if 'until' in arguments:
+            end, day_granularity = parse_datestamp(arguments['until'], until=True)
+            queryset = queryset.filter(updated_at__lt=end)
+            granularities.add(day_granularity)
+        if len(granularities) > 1:
+            raise OAIError('badArgument', 'from and until must have the same granularity')
+        if 'set' in arguments:
+            queryset = queryset.filter(get_set_filter(arguments['set']))
+
+        paginator = KeysetPaginator(queryset, 'updated_at', settings.OAI_PAGE_SIZE)
+        try:
+            page = paginator.get_page(cursor)
+        except BadRequest:
+            raise OAIError('badResumptionToken', 'Invalid resumption token')
+        if not page.object_list and cursor is None:
+            raise OAIError('noRecordsMatch', 'No records match the request')
+
+        for record in page:
+            if with_metadata:
+                self.add_record(element, record)
+            else:
+                self.add_header(element, record)
+        if page.has_next():
+            sub_element(element, oai_tag('resumptionToken'), encode_token(arguments, page.next_cursor))
+        elif cursor is not None:
+            # an empty token marks the last page of a resumed list
+            sub_element(element, oai_tag('resumptionToken'))
+
+    def add_header(self, parent, record):
+        header = sub_element(parent, oai_tag('header'))
+        sub_element(header, oai_tag('identifier'), get_identifier(record))
+        sub_element(header, oai_tag('datestamp'), format_datestamp(record.updated_at))
+        for spec in get_set_specs(record):
+            sub_element(header, oai_tag('setSpec'), spec)
+
+    def add_record(self, parent, record):
+        record_element = sub_element(parent, oai_tag('record'))
+        self.add_header(record_element, record)
+        metadata = sub_element(record_element, oai_tag('metadata'))
+        dc = sub_element(metadata, f'{{{OAI_DC_NAMESPACE}}}dc', **{
+            f'{{{XSI_NAMESPACE}}}schemaLocation': f'{OAI_DC_NAMESPACE} {OAI_DC_SCHEMA}',
+        })
+
+        values = [
+            ('title', record.title),
+            ('description', record.description),
+            ('type', record.category.name),
+            ('date', record.origin_date.isoformat() if record.origin_date else None),
+            ('identifier', self.request.build_absolute_uri(record.get_absolute_url())),
+            ('source', ', '.join(filter(None, [record.physical_location, record.physical_signature]))),
+        ]
+        values += [('subject', tag.name) for tag in record.tags.all()]
+        values += [('format', content_type) for content_type
+                   in dict.fromkeys(record_file.content_type for record_file in record.recordfile_set.all())]
+        for name, value in values:
+            if value:
+                sub_element(dc, f'{{{DC_NAMESPACE}}}{name}', value)
+
+
+@csrf_exempt
+def oai_view(request):
+    if request.method not in ['GET', 'POST']:
+        return HttpResponseNotAllowed(['GET', 'POST'])
+    return OAIRepository(request).response()
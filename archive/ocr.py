@@ -0,0 +1,131 @@
+import csv
+import io
+import os
+import subprocess
+
+from django.conf import settings
+from django.db.models.functions import Length
+from django.utils import timezone
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from archive.models import RecordFilePage
+from archive import search, text_extraction
+
+OCR_IMAGE_EXTS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff']
+OCR_CONTENT_TYPES = ['application/pdf', 'image/jpeg', 'image/png', 'image/tiff']
+# pages with less text in their text layer are treated as scans
+MIN_TEXT_LAYER_LENGTH = 20
+
+
+class OCRError(Exception):
+    pass
+
+
+def is_ocr_candidate(record_file):
+    name, ext = os.path.splitext(record_file.file.name)
+    return record_file.is_pdf() or (record_file.is_image() and ext.lower() in OCR_IMAGE_EXTS)
+
+
+def get_page_count(record_file, path):
+    if record_file.page_count:
+        return record_file.page_count
+    if record_file.is_pdf():
+        return pdfinfo_from_path(path, timeout=settings.OCR_TIMEOUT)['Pages']
+    with Image.open(path) as image:
+        return getattr(image, 'n_frames', 1)
+
+
+def get_text_layer_pages(record_file):
+    return set(record_file.pages.filter(source=RecordFilePage.Source.TEXT_LAYER)
+               .annotate(length=Length('text')).filter(length__gte=MIN_TEXT_LAYER_LENGTH)
+               .values_list('number', flat=True))
+
+
+def needs_ocr(record_file):
+    text_pages = record_file.pages.filter(source=RecordFilePage.Source.TEXT_LAYER)
+    return text_pages.exists() and text_pages.count() > len(get_text_layer_pages(record_file))
+
+
+def get_pending_pages(record_file, page_count):
+    done = set(record_file.pages.filter(source=RecordFilePage.Source.OCR).values_list('number', flat=True))
+    if record_file.is_pdf():
+        done |= get_text_layer_pages(record_file)
+    return [number for number in range(1, page_count + 1) if number not in done]
+
+
+def render_page(record_file, path, number):
+    if record_file.is_pdf():
+        images = convert_from_path(path, dpi=settings.OCR_DPI, first_page=number, last_page=number, grayscale=True,
+                                   timeout=settings.OCR_TIMEOUT)
+        if not images:
+            raise OCRError(f'Could not render page {number} of {path}')
+        return images[0]
+    with Image.open(path) as image:
+        # multi-page TIFFs are OCRed frame by frame
+        image.seek(number - 1)
+        return image.convert('L')
+
+
+def parse_tsv(output):
+    lines = []
+    words = []
+    current_line = None
+    for row in csv.DictReader(io.StringIO(output), delimiter='\t', quoting=csv.QUOTE_NONE):
+        text = (row.get('text') or '').strip()
+        if row['level'] != '5' or not text or float(row['conf']) < 0:
+            continue
+        line = (row['block_num'], row['par_num'], row['line_num'])
+        if line != current_line:
+            if current_line is not None and line[:2] != current_line[:2]:
+                lines.append([])
+            lines.append([])
+            current_line = line
+        lines[-1].append(text)
+        words.append([text, int(row['left']), int(row['top']), int(row['width']), int(row['height']),
+                      round(float(row['conf']))])
+    return '\n'.join(' '.join(line) for line in lines), words
+
+
+def run_tesseract(image):
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    dpi = image.info.get('dpi', (settings.OCR_DPI,))[0]
+    # the worker pool provides the parallelism, so tesseract itself runs single threaded
+    env = dict(os.environ, OMP_THREAD_LIMIT='1')
+    try:
+        result = subprocess.run(['tesseract', 'stdin', 'stdout', '-l', settings.OCR_LANGUAGES, '--dpi', str(int(dpi)),
+                                 'tsv'], input=buffer.getvalue(), capture_output=True, env=env,
+                                timeout=settings.OCR_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise OCRError('tesseract timed out')
+    if result.returncode != 0:
+        raise OCRError(f'tesseract failed with exit code {result.returncode}')
+    return parse_tsv(result.stdout.decode('utf-8', errors='replace'))
+
+
+def ocr_record_file(record_file, max_pages=None):
+    if not is_ocr_candidate(record_file):
+        return 0
+    if record_file.is_pdf() and record_file.text_extracted_at is None:
+        text_extraction.extract_text(record_file)
+
+    path = os.path.join(settings.MEDIA_ROOT, record_file.file.name)
+    pending = get_pending_pages(record_file, get_page_count(record_file, path))
+    batch = pending[:max_pages]
+    for number in batch:
+        image = render_page(record_file, path, number)
+        text, words = run_tesseract(image)
+        # every page is stored on its own, so an interrupted job continues after the last finished page
+        RecordFilePage.objects.update_or_create(record_file=record_file, number=number,
+                                                source=RecordFilePage.Source.OCR,
+                                                defaults={'text': text, 'words': words, 'width': image.width,
+                                                          'height': image.height})
+
+    remaining = len(pending) - len(batch)
+    if not remaining:
+        record_file.ocr_completed_at = timezone.now()
+        record_file.save(update_fields=['ocr_completed_at'])
+    if batch:
+        search.index_records([record_file.record])
+    return remaining
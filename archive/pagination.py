@@ -0,0 +1,93 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.db import connections, router
+from django.db.models import Q
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __contains__(self, item):
+        return item in self.object_list
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    # Paginates on (ordering field, pk) instead of OFFSET, so every page is a range scan on an index that ends with
+    # the ordering field and the primary key.
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.descending = ordering.startswith('-')
+        self.field_name = ordering.lstrip('-')
+        self.field = queryset.model._meta.get_field(self.field_name)
+        self.per_page = per_page
+
+    def get_ordering(self):
+        if self.descending:
+            return [f'-{self.field_name}', '-pk']
+        return [self.field_name, 'pk']
+
+    def get_page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.get_ordering())
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._after(value, pk))
+
+        object_list = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[:self.per_page]
+            last = object_list[-1]
+            next_cursor = self.encode_cursor(getattr(last, self.field.attname), last.pk)
+        return KeysetPage(object_list, next_cursor)
+
+    def _nulls_first(self):
+        connection = connections[router.db_for_read(self.queryset.model)]
+        if self.descending:
+            return connection.features.nulls_order_largest
+        return not connection.features.nulls_order_largest
+
+    def _after(self, value, pk):
+        lookup = 'lt' if self.descending else 'gt'
+        pk_after = Q(**{f'pk__{lookup}': pk})
+
+        if value is None:
+            after = Q(**{f'{self.field_name}__isnull': True}) & pk_after
+            if self._nulls_first():
+                after |= Q(**{f'{self.field_name}__isnull': False})
+            return after
+
+        after = Q(**{f'{self.field_name}__{lookup}': value}) | (Q(**{self.field_name: value}) & pk_after)
+        if self.field.null and not self._nulls_first():
+            after |= Q(**{f'{self.field_name}__isnull': True})
+        return after
+
+    def encode_cursor(self, value, pk):
+        if value is not None:
+            value = self.field.value_to_string(self.queryset.model(**{self.field.attname: value}))
+        data = json.dumps([value, pk]).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            value, pk = json.loads(data)
+            if value is not None:
+                value = self.field.to_python(value)
+            return value, int(pk)
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise BadRequest('Invalid cursor')
@@ -0,0 +1,337 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
+
+from archive.models import Collection, Record, RecordFilePage
+
+SEARCH_TABLE = 'archive_record_search'
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+
+def get_query_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def get_record_content(record):
+    content = []
+    length = 0
+    pages = RecordFilePage.objects.filter(record_file__record=record).exclude(text='') \
+        .order_by('record_file', 'number').values_list('text', flat=True)
+    for text in pages.iterator():
+        content.append(text)
+        length += len(text) + 1
+        if length >= settings.SEARCH_MAX_CONTENT_LENGTH:
+            break
+    return '\n'.join(content)[:settings.SEARCH_MAX_CONTENT_LENGTH]
+
+
+def get_document(record):
+    return {
+        'title': record.title,
+        'description': record.description or '',
+        'location': ' '.join(filter(None, [record.physical_location, record.physical_signature])),
+        'category': record.category.name,
+        'tags': ' '.join(tag.name for tag in record.tags.all()),
+        'content': get_record_content(record),
+    }
+
+
+def highlight(text, terms):
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    return pattern.sub(lambda match: f'{HIGHLIGHT_START}{match[0]}{HIGHLIGHT_END}', text)
+
+
+def format_snippet(snippet):
+    snippet = escape(snippet)
+    return mark_safe(snippet.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+class SearchResults:
+    # Lazy, sliceable result list, so that django.core.paginator.Paginator only fetches the requested page.
+
+    def __init__(self, backend, terms, public_only):
+        self.backend = backend
+        self.terms = terms
+        self.public_only = public_only
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.terms, self.public_only) if self.terms else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        offset = key.start or 0
+        limit = key.stop - offset
+        if not self.terms or limit <= 0:
+            return []
+
+        hits = self.backend.fetch(self.terms, self.public_only, offset, limit)
+        records = Record.objects.select_related('collection').in_bulk([record_id for record_id, _ in hits])
+        results = []
+        for record_id, snippet in hits:
+            if record_id in records:
+                record = records[record_id]
+                record.search_snippet = format_snippet(snippet)
+                results.append(record)
+        return results
+
+
+class BaseSearchBackend:
+    def search(self, query, public_only=False):
+        return SearchResults(self, get_query_terms(query), public_only)
+
+    def index_records(self, records):
+        raise NotImplementedError
+
+    def remove_records(self, record_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def count(self, terms, public_only):
+        raise NotImplementedError
+
+    def fetch(self, terms, public_only, offset, limit):
+        raise NotImplementedError
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+    # bm25 weights for title, description, location, category, tags and file content
+    weights = (10.0, 1.0, 2.0, 2.0, 5.0, 0.5)
+
+    def index_records(self, records):
+        rows = []
+        for record in records:
+            document = get_document(record)
+            rows.append((record.pk, document['title'], document['description'], document['location'],
+                         document['category'], document['tags'], document['content'], record.collection_id,
+                         int(record.public)))
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, location, category, tags, '
+                               f'content, collection_id, public) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)', rows)
+
+    def remove_records(self, record_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(pk,) for pk in record_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def _where(self, terms, public_only):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        where = f'{SEARCH_TABLE} MATCH %s'
+        if public_only:
+            where += f' AND public = 1 AND collection_id IN ' \
+                     f'(SELECT id FROM {Collection._meta.db_table} WHERE public = 1)'
+        return where, [match]
+
+    def count(self, terms, public_only):
+        where, params = self._where(terms, public_only)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {where}', params)
+            return cursor.fetchone()[0]
+
+    def fetch(self, terms, public_only, offset, limit):
+        where, params = self._where(terms, public_only)
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid, snippet({SEARCH_TABLE}, -1, %s, %s, %s, 24) FROM {SEARCH_TABLE} '
+                           f'WHERE {where} ORDER BY bm25({SEARCH_TABLE}, {weights}), rowid LIMIT %s OFFSET %s',
+                           [HIGHLIGHT_START, HIGHLIGHT_END, '…'] + params + [limit, offset])
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    def index_records(self, records):
+        config = settings.SEARCH_CONFIG
+        rows = []
+        for record in records:
+            document = get_document(record)
+            body = ' '.join(filter(None, [document['description'], document['location'], document['tags'],
+                                          document['content']]))
+            rows.append((record.pk, record.collection_id, record.public, document['title'], body,
+                         config, document['title'], config, f'{document["tags"]} {document["category"]}',
+                         config, document['location'], config, f'{document["description"]} {document["content"]}'))
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (record_id, collection_id, public, title, body, document) '
+                               f'VALUES (%s, %s, %s, %s, %s, '
+                               f'setweight(to_tsvector(%s::regconfig, %s), \'A\') || '
+                               f'setweight(to_tsvector(%s::regconfig, %s), \'B\') || '
+                               f'setweight(to_tsvector(%s::regconfig, %s), \'C\') || '
+                               f'setweight(to_tsvector(%s::regconfig, %s), \'D\')) '
+                               f'ON CONFLICT (record_id) DO UPDATE SET collection_id = EXCLUDED.collection_id, '
+                               f'public = EXCLUDED.public, title = EXCLUDED.title, body = EXCLUDED.body, '
+                               f'document = EXCLUDED.document', rows)
+
+    def remove_records(self, record_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE record_id = ANY(%s)', [list(record_ids)])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+
+    def _where(self, terms, public_only):
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        where = 'document @@ to_tsquery(%s::regconfig, %s)'
+        if public_only:
+            where += f' AND public AND collection_id IN (SELECT id FROM {Collection._meta.db_table} WHERE public)'
+        return where, [settings.SEARCH_CONFIG, tsquery]
+
+    def count(self, terms, public_only):
+        where, params = self._where(terms, public_only)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {where}', params)
+            return cursor.fetchone()[0]
+
+    def fetch(self, terms, public_only, offset, limit):
+        where, params = self._where(terms, public_only)
+        headline_options = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=30, MinWords=10'
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT record_id, ts_headline(%s::regconfig, title || \' \' || body, '
+                           f'to_tsquery(%s::regconfig, %s), %s) FROM {SEARCH_TABLE} WHERE {where} '
+                           f'ORDER BY ts_rank_cd(document, to_tsquery(%s::regconfig, %s)) DESC, record_id '
+                           f'LIMIT %s OFFSET %s',
+                           params + [headline_options] + params + params + [limit, offset])
+            return cursor.fetchall()
+
+
+class MysqlSearchBackend(BaseSearchBackend):
+    # InnoDB FULLTEXT indexes, used by MariaDB as well; words shorter than innodb_ft_min_token_size (3 by default)
+    # and InnoDB stopwords are not indexed
+    title_weight = 10
+    # characters of the body around the first match the snippet is taken from
+    snippet_length = 300
+
+    def index_records(self, records):
+        rows = []
+        for record in records:
+            document = get_document(record)
+            body = ' '.join(filter(None, [document['description'], document['location'], document['tags'],
+                                          document['category'], document['content']]))
+            rows.append((record.pk, record.collection_id, record.public, document['title'], body))
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (record_id, collection_id, public, title, body) '
+                               f'VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE '
+                               f'collection_id = VALUES(collection_id), public = VALUES(public), '
+                               f'title = VALUES(title), body = VALUES(body)', rows)
+
+    def remove_records(self, record_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE record_id = %s', [(pk,) for pk in record_ids])
+
+    def clear(self):
+        # TRUNCATE would commit the surrounding transaction
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def _match(self, terms):
+        return ' '.join(f'+{term}*' for term in terms)
+
+    def _where(self, terms, public_only):
+        where = 'MATCH (title, body) AGAINST (%s IN BOOLEAN MODE)'
+        if public_only:
+            where += f' AND public = 1 AND collection_id IN ' \
+                     f'(SELECT id FROM {Collection._meta.db_table} WHERE public = 1)'
+        return where, [self._match(terms)]
+
+    def count(self, terms, public_only):
+        where, params = self._where(terms, public_only)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE {where}', params)
+            return cursor.fetchone()[0]
+
+    def fetch(self, terms, public_only, offset, limit):
+        where, params = self._where(terms, public_only)
+        match = self._match(terms)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT record_id, title, SUBSTRING(body, GREATEST(LOCATE(%s, body) - %s, 1), %s) '
+                           f'FROM {SEARCH_TABLE} WHERE {where} '
+                           f'ORDER BY MATCH (title) AGAINST (%s IN BOOLEAN MODE) * {self.title_weight} + '
+                           f'MATCH (title, body) AGAINST (%s IN BOOLEAN MODE) DESC, record_id LIMIT %s OFFSET %s',
+                           [terms[0], self.snippet_length // 4, self.snippet_length] + params +
+                           [match, match, limit, offset])
+            rows = cursor.fetchall()
+        hits = []
+        for record_id, title, excerpt in rows:
+            # records matching only in their title show the title
+            text = excerpt if highlight(excerpt, terms) != excerpt else title
+            hits.append((record_id, highlight(Truncator(text).words(30), terms)))
+        return hits
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    # Fallback for databases without a supported full text index, searches the records table directly.
+
+    def index_records(self, records):
+        pass
+
+    def remove_records(self, record_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def _get_queryset(self, terms, public_only):
+        queryset = Record.objects.all()
+        for term in terms:
+            queryset = queryset.filter(Q(title__icontains=term) | Q(description__icontains=term) |
+                                       Q(physical_location__icontains=term) | Q(physical_signature__icontains=term) |
+                                       Q(category__name__icontains=term) |
+                                       Q(pk__in=Record.objects.filter(tags__name__icontains=term).values('pk')) |
+                                       Q(pk__in=RecordFilePage.objects.filter(text__icontains=term)
+                                         .values('record_file__record')))
+        if public_only:
+            queryset = queryset.filter(public=True, collection__public=True)
+        return queryset
+
+    def count(self, terms, public_only):
+        return self._get_queryset(terms, public_only).count()
+
+    def fetch(self, terms, public_only, offset, limit):
+        records = self._get_queryset(terms, public_only).order_by('title', 'pk')[offset:offset + limit]
+        return [(record.pk, highlight(Truncator(record.description or record.title).words(30), terms))
+                for record in records.only('pk', 'title', 'description')]
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+    'mysql': MysqlSearchBackend,
+}
+
+
+def get_backend():
+    if settings.SEARCH_BACKEND:
+        return import_string(settings.SEARCH_BACKEND)()
+    return BACKENDS.get(connection.vendor, BasicSearchBackend)()
+
+
+def index_records(records):
+    get_backend().index_records(records)
+
+
+def remove_records(record_ids):
+    get_backend().remove_records(record_ids)
@@ -0,0 +1,178 @@
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from archive.cache import bump_collection_generation, bump_global_generation, bump_tag_generation
+from archive.models import Collection, Record, RecordFile, RecordCategory, RecordTag
+from archive import counters, iiif, search
+
+
+@receiver(post_save, sender=RecordFile)
+@receiver(post_delete, sender=RecordFile)
+def update_record_cover(sender, instance, **kwargs):
+    record = Record.objects.filter(pk=instance.record_id).first()
+    if record:
+        record.update_cover()
+        bump_collection_generation(record.collection_id)
+
+
+@receiver(post_save, sender=Record)
+@receiver(post_delete, sender=Record)
+def invalidate_record_collection(sender, instance, **kwargs):
+    bump_collection_generation(instance.collection_id)
+
+
+@receiver(post_delete, sender=RecordFile)
+def delete_record_file_tiles(sender, instance, **kwargs):
+    iiif.delete_tiles(instance.pk)
+
+
+@receiver(post_delete, sender=RecordFile)
+def unindex_record_file_text(sender, instance, **kwargs):
+    if instance.text_extracted_at is None:
+        return
+    record = Record.objects.filter(pk=instance.record_id).select_related('category').first()
+    if record:
+        search.index_records([record])
+
+
+@receiver(post_save, sender=Record)
+def index_record(sender, instance, **kwargs):
+    search.index_records([instance])
+
+
+@receiver(post_delete, sender=Record)
+def unindex_record(sender, instance, **kwargs):
+    search.remove_records([instance.pk])
+
+
+@receiver(m2m_changed, sender=Record.tags.through)
+def index_record_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._cleared_record_ids = set(instance.record_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.index_records([instance])
+    else:
+        record_ids = pk_set if action != 'post_clear' else getattr(instance, '_cleared_record_ids', set())
+        search.index_records(Record.objects.filter(pk__in=record_ids).select_related('category')
+                             .prefetch_related('tags'))
+
+
+@receiver(post_save, sender=RecordCategory)
+def index_category_records(sender, instance, created, **kwargs):
+    if not created:
+        search.index_records(instance.records.select_related('category').prefetch_related('tags'))
+
+
+@receiver(post_save, sender=RecordTag)
+def index_tag_records(sender, instance, created, **kwargs):
+    if not created:
+        search.index_records(instance.record_set.select_related('category').prefetch_related('tags'))
+
+
+@receiver(m2m_changed, sender=Record.tags.through)
+def invalidate_record_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_collection_generation(instance.collection_id)
+    elif pk_set:
+        for collection_id in Record.objects.filter(pk__in=pk_set).values_list('collection_id', flat=True).distinct():
+            bump_collection_generation(collection_id)
+    else:
+        bump_global_generation()
+
+
+@receiver(post_save, sender=RecordCategory)
+@receiver(post_delete, sender=RecordCategory)
+@receiver(post_save, sender=RecordTag)
+@receiver(post_delete, sender=RecordTag)
+def invalidate_labels(sender, instance, **kwargs):
+    bump_global_generation()
+
+
+@receiver(post_save, sender=RecordTag)
+@receiver(post_delete, sender=RecordTag)
+def invalidate_tag_index(sender, **kwargs):
+    bump_tag_generation()
+
+
+@receiver(m2m_changed, sender=Record.tags.through)
+def invalidate_tag_usage(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_tag_generation()
+
+
+@receiver(post_save, sender=Record)
+def count_record(sender, instance, created, **kwargs):
+    counters.record_saved(instance, created)
+
+
+@receiver(post_delete, sender=Record)
+def uncount_record(sender, instance, **kwargs):
+    counters.record_deleted(instance)
+
+
+@receiver(post_save, sender=RecordFile)
+def count_record_file(sender, instance, created, **kwargs):
+    counters.file_saved(instance, created)
+
+
+@receiver(post_delete, sender=RecordFile)
+def uncount_record_file(sender, instance, **kwargs):
+    counters.file_deleted(instance)
+
+
+# updated_at is the datestamp OAI-PMH harvesters select changed records by, so changes of the files and labels a
+# record's metadata shows touch it with a plain update; regenerated derivatives leave it alone
+def touch_records(records):
+    records.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=RecordFile)
+@receiver(post_delete, sender=RecordFile)
+def touch_record_of_file(sender, instance, **kwargs):
+    # deletions have no created argument, saves of existing files mostly store their derivatives
+    if kwargs.get('created', True):
+        touch_records(Record.objects.filter(pk=instance.record_id))
+
+
+@receiver(m2m_changed, sender=Record.tags.through)
+def touch_record_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        touch_records(instance.record_set.all())
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            touch_records(Record.objects.filter(pk=instance.pk))
+        elif pk_set:
+            touch_records(Record.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=RecordCategory)
+def touch_category_records(sender, instance, created, **kwargs):
+    if not created:
+        touch_records(instance.records.all())
+
+
+@receiver(post_save, sender=RecordTag)
+@receiver(pre_delete, sender=RecordTag)
+def touch_tag_records(sender, instance, **kwargs):
+    if not kwargs.get('created'):
+        touch_records(instance.record_set.all())
+
+
+@receiver(pre_save, sender=Collection)
+def remember_collection_visibility(sender, instance, **kwargs):
+    instance._was_public = Collection.objects.filter(pk=instance.pk).values_list('public', flat=True).first() \
+        if instance.pk else None
+
+
+@receiver(post_save, sender=Collection)
+def touch_collection_records(sender, instance, created, **kwargs):
+    # records of a collection that is published or hidden enter or leave the repository
+    was_public = getattr(instance, '_was_public', None)
+    if not created and was_public is not None and was_public != instance.public:
+        touch_records(Record.objects.filter(collection=instance))
@@ -0,0 +1,7 @@
+import hashlib
+import json
+
+
+def get_signature(*values):
+    # stored next to a derivative, it changes when the settings the derivative is generated with change
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()[:16]
@@ -0,0 +1,45 @@
+function loadNextRecords(link, observer) {
+    if (link.dataset.loading) {
+        return;
+    }
+    link.dataset.loading = 'true';
+
+    fetch(link.dataset.fragmentUrl)
+        .then(function (response) {
+            const nextQuery = response.headers.get('X-Next-Query');
+            return response.text().then(function (html) {
+                document.querySelector('.record-grid').insertAdjacentHTML('beforeend', html);
+
+                if (nextQuery) {
+                    const fragmentUrl = new URL(link.dataset.fragmentUrl, window.location.href);
+                    link.href = '?' + nextQuery;
+                    link.dataset.fragmentUrl = fragmentUrl.pathname + '?' + nextQuery;
+                    delete link.dataset.loading;
+                    // re-observe so another batch is loaded if the link is still in view
+                    observer.unobserve(link);
+                    observer.observe(link);
+                } else {
+                    link.parentElement.remove();
+                }
+            });
+        })
+        .catch(function () {
+            delete link.dataset.loading;
+        });
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    const link = document.querySelector('.record-grid-next');
+    if (!link || !('IntersectionObserver' in window)) {
+        return;
+    }
+
+    const observer = new IntersectionObserver(function (entries) {
+        for (const entry of entries) {
+            if (entry.isIntersecting) {
+                loadNextRecords(entry.target, observer);
+            }
+        }
+    }, {rootMargin: '400px'});
+    observer.observe(link);
+});
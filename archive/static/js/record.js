@@ -1,3 +1,130 @@
+function getPageUrl(pageUrl, page) {
+    return pageUrl.replace(/\/pages\/1\/$/, '/pages/' + page + '/');
+}
+
+const PAGE_RETRIES = 60;
+
+function loadPage(image, pageUrl, attempt = 0) {
+    // a page is answered with 202 until a worker has rendered it, then redirects to the rendered image
+    image.dataset.pageUrl = pageUrl;
+    fetch(pageUrl).then(response => {
+        if (image.dataset.pageUrl !== pageUrl) {
+            return;
+        }
+        if (response.status === 202) {
+            if (attempt < PAGE_RETRIES) {
+                const delay = parseInt(response.headers.get('Retry-After') || '1') * 1000;
+                setTimeout(() => {
+                    if (image.dataset.pageUrl === pageUrl) {
+                        loadPage(image, pageUrl, attempt + 1);
+                    }
+                }, delay);
+            }
+        } else if (response.ok) {
+            image.src = response.url;
+        }
+    });
+}
+
+function createPageViewer(pageUrl, pageCount) {
+    const viewer = document.createElement('div');
+    viewer.classList.add('record-pages');
+    viewer.dataset.pageUrl = pageUrl;
+    viewer.dataset.pageCount = pageCount;
+    viewer.dataset.page = '1';
+
+    const image = document.createElement('img');
+    image.classList.add('record-image');
+    loadPage(image, pageUrl);
+
+    const buttons = document.createElement('div');
+    buttons.classList.add('btn-group', 'mt-2');
+    for (const [label, delta] of [['\u2039', -1], [null, 0], ['\u203a', 1]]) {
+        let button;
+        if (delta === 0) {
+            button = document.createElement('span');
+            button.classList.add('btn', 'btn-outline-secondary', 'disabled', 'page-number');
+            button.textContent = '1 / ' + pageCount;
+        } else {
+            button = document.createElement('button');
+            button.type = 'button';
+            button.classList.add('btn', 'btn-secondary');
+            button.textContent = label;
+            button.addEventListener('click', () => changePage(button, delta));
+        }
+        buttons.append(button);
+    }
+
+    viewer.append(image, buttons);
+    return viewer;
+}
+
+function changePage(button, delta) {
+    // pages are rendered on the server one at a time, the next one is requested ahead
+    const viewer = button.closest('.record-pages');
+    const pageCount = parseInt(viewer.dataset.pageCount);
+    const page = Math.min(Math.max(parseInt(viewer.dataset.page) + delta, 1), pageCount);
+
+    viewer.dataset.page = page;
+    loadPage(viewer.querySelector('img'), getPageUrl(viewer.dataset.pageUrl, page));
+    viewer.querySelector('.page-number').textContent = page + ' / ' + pageCount;
+    if (page < pageCount) {
+        // queues the rendering of the next page
+        fetch(getPageUrl(viewer.dataset.pageUrl, page + 1));
+    }
+}
+
+function parseTimestamp(timestamp) {
+    const [hours, minutes, seconds] = timestamp.split(':');
+    return parseInt(hours) * 3600 + parseInt(minutes) * 60 + parseFloat(seconds);
+}
+
+function parseStoryboard(track, trackUrl) {
+    // cues of a WebVTT thumbnail track as {start, url, x, y, width, height}
+    const frames = [];
+    for (const block of track.split(/\r?\n\r?\n/)) {
+        const lines = block.trim().split(/\r?\n/);
+        const timing = lines.findIndex(line => line.includes('-->'));
+        if (timing === -1 || !lines[timing + 1]) {
+            continue;
+        }
+        const [image, fragment] = lines[timing + 1].split('#xywh=');
+        const [x, y, width, height] = fragment.split(',').map(value => parseInt(value));
+        frames.push({
+            start: parseTimestamp(lines[timing].split('-->')[0].trim()),
+            url: new URL(image, new URL(trackUrl, document.baseURI)).href,
+            x: x, y: y, width: width, height: height,
+        });
+    }
+    return frames;
+}
+
+function createStoryboard(video, trackUrl) {
+    // a strip of frames below the player, the sprite sheets are loaded once and every frame seeks the video
+    const storyboard = document.createElement('div');
+    storyboard.classList.add('storyboard', 'mt-2');
+    fetch(trackUrl).then(response => response.ok ? response.text() : '').then(track => {
+        for (const frame of parseStoryboard(track, trackUrl)) {
+            const button = document.createElement('button');
+            button.type = 'button';
+            button.classList.add('storyboard-frame');
+            button.style.width = frame.width + 'px';
+            button.style.height = frame.height + 'px';
+            button.style.backgroundImage = 'url("' + frame.url + '")';
+            button.style.backgroundPosition = '-' + frame.x + 'px -' + frame.y + 'px';
+            const label = document.createElement('span');
+            label.textContent = new Date(frame.start * 1000).toISOString().substring(11, 19);
+            button.append(label);
+            button.addEventListener('click', () => {
+                video.currentTime = frame.start;
+                video.play();
+            });
+            storyboard.append(button);
+        }
+    });
+    video.after(storyboard);
+}
+
 function fileSelected(element) {
     const fileContainer = document.querySelector('.record-media');
 
@@ -6,7 +133,9 @@ function fileSelected(element) {
 
     let newElement;
 
-    if (!url) {
+    if (element.dataset.pageCount) {
+        newElement = createPageViewer(element.dataset.pageUrl, element.dataset.pageCount);
+    } else if (!url) {
         newElement = document.createElement("p");
         newElement.textContent = 'No preview available';
     } else if (contentType === "application/pdf") {
@@ -15,9 +144,26 @@ function fileSelected(element) {
         newElement.width = "100%";
         newElement.height = "678";
     } else if (contentType.startsWith("image/")) {
-        newElement = document.createElement('img');
-        newElement.src = url;
-        newElement.classList.add("record-image");
+        newElement = document.createElement('picture');
+        // AVIF and WebP renditions come first, the browser uses the first type it supports
+        for (const [format, type] of [['avif', 'image/avif'], ['webp', 'image/webp']]) {
+            const srcset = element.dataset['srcset' + format.charAt(0).toUpperCase() + format.slice(1)];
+            if (srcset) {
+                const source = document.createElement('source');
+                source.type = type;
+                source.srcset = srcset;
+                source.sizes = '(min-width: 768px) 75vw, 100vw';
+                newElement.append(source);
+            }
+        }
+        const image = document.createElement('img');
+        image.src = url;
+        if (element.dataset.srcset) {
+            image.srcset = element.dataset.srcset;
+            image.sizes = '(min-width: 768px) 75vw, 100vw';
+        }
+        image.classList.add("record-image");
+        newElement.append(image);
     } else if (contentType === "application/wacz") {
         let replayEmbed = document.createElement("replay-web-page");
         replayEmbed.setAttribute("replayBase", "/static/js/");
@@ -29,11 +175,20 @@ function fileSelected(element) {
     } else if (contentType.startsWith("video/")) {
         newElement = document.createElement("video");
         newElement.setAttribute('controls', '');
+        newElement.setAttribute('preload', 'metadata');
+        if (element.dataset.poster) {
+            newElement.setAttribute('poster', element.dataset.poster);
+        }
         newElement.setAttribute('width', '100%');
-        let sourceElement = document.createElement('source');
-        sourceElement.setAttribute('src', url);
-        sourceElement.setAttribute('type', 'video/mp4');
-        newElement.append(sourceElement);
+        // the HLS ladder comes first, browsers without HLS support play the MP4 preview
+        for (const [src, type] of [[element.dataset.hlsUrl, 'application/vnd.apple.mpegurl'], [url, 'video/mp4']]) {
+            if (src) {
+                let sourceElement = document.createElement('source');
+                sourceElement.setAttribute('src', src);
+                sourceElement.setAttribute('type', type);
+                newElement.append(sourceElement);
+            }
+        }
     } else {
         newElement = document.createElement("p");
         newElement.textContent = 'No preview available';
@@ -41,6 +196,9 @@ function fileSelected(element) {
 
     if (newElement) {
         fileContainer.replaceChildren(newElement);
+        if (newElement.tagName === 'VIDEO' && element.dataset.storyboard) {
+            createStoryboard(newElement, element.dataset.storyboard);
+        }
     }
 
     const fileListItems = document.getElementsByClassName("file-list-item");
@@ -53,10 +211,47 @@ function fileSelected(element) {
     element.setAttribute("aria-current", "true");
 }
 
+function pollDerivativeStatus(status) {
+    // the cached file list is rendered again once the derivatives of all files are done
+    const interval = parseInt(status.dataset.pollInterval) * 1000;
+    const poll = () => {
+        $.getJSON(status.dataset.statusUrl, function(data) {
+            if (data.pending) {
+                const jobs = data.files.flatMap(file => file.jobs);
+                const done = jobs.filter(job => job.state === 'done' || job.state === 'failed').length;
+                status.querySelector('.derivative-progress').textContent = '(' + done + ' / ' + jobs.length + ')';
+                setTimeout(poll, interval);
+            } else {
+                window.location.reload();
+            }
+        }).fail(function() {
+            setTimeout(poll, interval * 10);
+        });
+    };
+    setTimeout(poll, interval);
+}
+
 $(document).ready(function() {
-    $('#inputTag').autocomplete({
-        delay: 500,
-        minLength: 2,
+    document.querySelectorAll('.derivative-status[data-status-url]').forEach(pollDerivativeStatus);
 
-    })
-})
\ No newline at end of file
+    document.querySelectorAll('.record-media .record-pages').forEach(viewer => {
+        loadPage(viewer.querySelector('img'), viewer.dataset.pageUrl);
+    });
+
+    document.querySelectorAll('.record-media video[data-storyboard]').forEach(video => {
+        createStoryboard(video, video.dataset.storyboard);
+    });
+
+    const tagInput = $('#inputTag');
+    tagInput.autocomplete({
+        delay: 150,
+        minLength: 2,
+        source: function(request, response) {
+            $.getJSON(tagInput.data('autocompleteUrl'), {q: request.term}, function(tags) {
+                response(tags.map(tag => tag.name));
+            }).fail(function() {
+                response([]);
+            });
+        },
+    });
+})
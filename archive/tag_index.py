@@ -0,0 +1,67 @@
+import bisect
+import heapq
+import threading
+
+from django.db.models import Count
+
+from archive.cache import get_tag_generation
+from archive.models import RecordTag
+
+# results for prefixes up to this length are memoized, longer prefixes only match a few tags
+MEMO_PREFIX_LENGTH = 3
+
+
+def normalize(name):
+    return name.strip().casefold()
+
+
+class TagIndex:
+    def __init__(self, tags):
+        # tags are (name, usage count) pairs, kept sorted by the normalized name for bisecting prefix ranges
+        entries = sorted((normalize(name), name, count) for name, count in tags)
+        self.keys = [key for key, _, _ in entries]
+        self.entries = [(name, count) for _, name, count in entries]
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix, limit):
+        prefix = normalize(prefix)
+        if len(prefix) <= MEMO_PREFIX_LENGTH and (prefix, limit) in self._memo:
+            return self._memo[prefix, limit]
+
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\U0010ffff', lo=start)
+        # most used tags first, ties ordered by name
+        results = heapq.nsmallest(limit, self.entries[start:end], key=lambda entry: (-entry[1], entry[0].casefold()))
+
+        if len(prefix) <= MEMO_PREFIX_LENGTH:
+            self._memo[prefix, limit] = results
+        return results
+
+
+_index = None
+_generation = None
+_lock = threading.Lock()
+
+
+def load_index():
+    tags = RecordTag.objects.annotate(usage=Count('record')).values_list('name', 'usage').order_by()
+    return TagIndex(tags)
+
+
+def get_index():
+    # the index is built once per process and rebuilt when the tag generation changes
+    global _index, _generation
+    generation = get_tag_generation()
+    if _index is None or _generation != generation:
+        with _lock:
+            if _index is None or _generation != generation:
+                _index = load_index()
+                _generation = generation
+    return _index
+
+
+def search_tags(prefix, limit):
+    return get_index().search(prefix, limit)
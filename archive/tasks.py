@@ -1,11 +1,186 @@
+import logging
+
 from celery import shared_task
+from celery.signals import task_failure
+from django.conf import settings
+from django.core.cache import cache
+
+from archive import thumbnails, text_extraction, ocr, iiif, video, jobs
+from archive.models import DerivativeJob, RecordFile
+
+logger = logging.getLogger(__name__)
+
+
+def get_priority(backfill):
+    return settings.TASK_PRIORITY_BACKFILL if backfill else settings.TASK_PRIORITY_INTERACTIVE
+
+
+def send(task, record_file_id, backfill=False, countdown=None):
+    # the queue comes from CELERY_TASK_ROUTES, uploads are worked on before backfills waiting in the same queue
+    task.apply_async((record_file_id, backfill), priority=get_priority(backfill), countdown=countdown)
+
+
+def enqueue(task, record_file_id, backfill=False):
+    # duplicate enqueues collapse into the job that is already queued or running
+    if jobs.queue_job(record_file_id, task.job_kind):
+        send(task, record_file_id, backfill)
+
+
+def get_derivative_tasks(record_file):
+    # every kind of file has its own tasks, which are routed to their own queue and run in parallel
+    if record_file.is_image():
+        derivative_tasks = [generate_image_derivatives]
+    elif record_file.is_pdf():
+        derivative_tasks = [generate_pdf_derivatives, extract_text]
+    elif record_file.is_video():
+        derivative_tasks = [generate_video_thumbnail, transcode_video, generate_storyboard]
+    else:
+        derivative_tasks = []
+    if not record_file.is_pdf() and ocr.is_ocr_candidate(record_file):
+        derivative_tasks.append(ocr_record_file)
+    return derivative_tasks
+
+
+def queue_derivatives(record_file, backfill=False):
+    for task in get_derivative_tasks(record_file):
+        enqueue(task, record_file.pk, backfill)
 
-from archive import thumbnails
-from archive.models import RecordFile
+
+def handle_failure(task, record_file_id, backfill, error):
+    kind = task.job_kind
+    attempts = jobs.get_attempts(record_file_id, kind)
+    message = f'{type(error).__name__}: {error}'
+    if attempts < settings.DERIVATIVE_JOB_MAX_ATTEMPTS:
+        jobs.requeue_job(record_file_id, kind, message)
+        send(task, record_file_id, backfill, countdown=jobs.get_retry_delay(attempts))
+    else:
+        jobs.fail_job(record_file_id, kind, message)
+
+
+def run_job(task, record_file_id, backfill, function):
+    # function(record_file, backfill) returns True if the work is split over several runs and not finished yet
+    record_file = RecordFile.objects.filter(pk=record_file_id).first()
+    kind = task.job_kind
+    if record_file is None or not jobs.claim_job(record_file_id, kind, task.request.id):
+        return
+
+    try:
+        unfinished = function(record_file, backfill)
+    except Exception as error:
+        logger.exception('%s failed for record file %s', kind, record_file_id)
+        handle_failure(task, record_file_id, backfill, error)
+        return
+
+    if unfinished is True:
+        jobs.requeue_job(record_file_id, kind, reset_attempts=True)
+        send(task, record_file_id, backfill)
+    else:
+        jobs.finish_job(record_file_id, kind)
+
+
+@task_failure.connect
+def handle_lost_job(sender=None, args=None, kwargs=None, exception=None, **other):
+    # exceptions are handled by run_job, this is reported by the parent process when the time limit killed the task
+    # or its process died
+    if getattr(sender, 'job_kind', None) is None:
+        return
+    args, kwargs = args or [], kwargs or {}
+    record_file_id = args[0] if args else kwargs['record_file_id']
+    backfill = args[1] if len(args) > 1 else kwargs.get('backfill', False)
+    logger.error('%s was lost for record file %s: %r', sender.job_kind, record_file_id, exception)
+    handle_failure(sender, record_file_id, backfill, exception)
 
 
 @shared_task
-def generate_preview(record_file_id):
-    record_file = RecordFile.objects.get(pk=record_file_id)
+def generate_preview(record_file_id, backfill=False):
+    # messages queued before the work was split by kind
+    record_file = RecordFile.objects.filter(pk=record_file_id).first()
+    if record_file is not None:
+        for task in get_derivative_tasks(record_file):
+            if task not in [extract_text, ocr_record_file]:
+                enqueue(task, record_file_id, backfill)
+
+
+def generate_image(record_file, backfill):
+    # the thumbnail of an image is generated together with its preview and renditions
     thumbnails.generate_thumbnail(record_file)
-    thumbnails.generate_preview(record_file)
+    if iiif.is_iiif_candidate(record_file) and \
+            max(record_file.width, record_file.height) > settings.IIIF_TILE_MIN_SIZE:
+        enqueue(build_tiles, record_file.pk, backfill)
+
+
+@shared_task(bind=True, job_kind=DerivativeJob.Kind.IMAGE)
+def generate_image_derivatives(self, record_file_id, backfill=False):
+    run_job(self, record_file_id, backfill, generate_image)
+
+
+@shared_task(bind=True, job_kind=DerivativeJob.Kind.TILES)
+def build_tiles(self, record_file_id, backfill=False):
+    run_job(self, record_file_id, backfill, lambda record_file, backfill: iiif.build_tiles(record_file))
+
+
+@shared_task(bind=True, job_kind=DerivativeJob.Kind.PDF)
+def generate_pdf_derivatives(self, record_file_id, backfill=False):
+    run_job(self, record_file_id, backfill, lambda record_file, backfill: thumbnails.generate_thumbnail(record_file))
+
+
+@shared_task(bind=True, job_kind=DerivativeJob.Kind.VIDEO_THUMBNAIL)
+def generate_video_thumbnail(self, record_file_id, backfill=False):
+    run_job(self, record_file_id, backfill, lambda record_file, backfill: thumbnails.generate_thumbnail(record_file))
+
+
+def transcode(record_file, backfill):
+    video.generate_video_preview(record_file, video.ProgressReporter(record_file.pk))
+
+
+@shared_task(bind=True, job_kind=DerivativeJob.Kind.TRANSCODE,
+             time_limit=jobs.get_time_limit(DerivativeJob.Kind.TRANSCODE))
+def transcode_video(self, record_file_id, backfill=False):
+    run_job(self, record_file_id, backfill, transcode)
+
+
+@shared_task(bind=True, job_kind=DerivativeJob.Kind.STORYBOARD,
+             time_limit=jobs.get_time_limit(DerivativeJob.Kind.STORYBOARD))
+def generate_storyboard(self, record_file_id, backfill=False):
+    run_job(self, record_file_id, backfill, lambda record_file, backfill: video.generate_storyboard(record_file))
+
+
+def extract(record_file, backfill):
+    text_extraction.extract_text(record_file)
+    if ocr.needs_ocr(record_file):
+        enqueue(ocr_record_file, record_file.pk, backfill)
+
+
+@shared_task(bind=True, job_kind=DerivativeJob.Kind.TEXT)
+def extract_text(self, record_file_id, backfill=False):
+    run_job(self, record_file_id, backfill, extract)
+
+
+def recognize(record_file, backfill):
+    # long files are split over several runs to stay within the task time limit
+    return ocr.ocr_record_file(record_file, settings.OCR_PAGES_PER_TASK) > 0
+
+
+@shared_task(bind=True, job_kind=DerivativeJob.Kind.OCR, acks_late=True)
+def ocr_record_file(self, record_file_id, backfill=False):
+    run_job(self, record_file_id, backfill, recognize)
+
+
+def get_page_lock_key(record_file_id, number):
+    return f'archive:page-preview:{record_file_id}:{number}'
+
+
+def queue_page_preview(record_file_id, number):
+    # requests for a page that is already being rendered don't queue it again
+    if cache.add(get_page_lock_key(record_file_id, number), True, 2 * settings.PDF_RENDER_TIMEOUT):
+        render_page_preview.apply_async((record_file_id, number), priority=settings.TASK_PRIORITY_INTERACTIVE)
+
+
+@shared_task
+def render_page_preview(record_file_id, number):
+    try:
+        record_file = RecordFile.objects.filter(pk=record_file_id).first()
+        if record_file is not None:
+            thumbnails.generate_page_preview(record_file, number)
+    finally:
+        cache.delete(get_page_lock_key(record_file_id, number))
@@ -0,0 +1,33 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from archive.thumbnails import IMAGE_FORMAT_TYPES
+
+register = template.Library()
+
+
+def get_srcset(record_file, max_width=None, image_format=None):
+    if not record_file:
+        return ''
+    sources = []
+    for rendition in record_file.renditions:
+        name = rendition.get('formats', {}).get(image_format) if image_format else rendition['name']
+        if name and (max_width is None or rendition['width'] <= int(max_width)):
+            sources.append(f'{default_storage.url(name)} {rendition["width"]}w')
+    return ', '.join(sources)
+
+
+@register.filter
+def srcset(record_file, max_width=None):
+    return get_srcset(record_file, max_width)
+
+
+@register.simple_tag
+def picture_sources(record_file, max_width=None):
+    # <source> candidates for a <picture>, the browser picks the first type it supports
+    sources = []
+    for image_format, content_type in IMAGE_FORMAT_TYPES.items():
+        image_srcset = get_srcset(record_file, max_width, image_format)
+        if image_srcset:
+            sources.append({'format': image_format, 'type': content_type, 'srcset': image_srcset})
+    return sources
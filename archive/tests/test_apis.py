@@ -1,8 +1,10 @@
 import json
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.test import TestCase, Client
 from django.urls import reverse
 
-from archive.models import RecordTag
+from archive.models import Collection, Record, RecordCategory, RecordFile, RecordTag
 
 
 class TagApiTestCase(TestCase):
@@ -21,3 +23,141 @@ class TagApiTestCase(TestCase):
     def test_tag_autocomplete_no_query(self):
         response = self.c.get(reverse('tag-autocomplete'))
         self.assertEqual(400, response.status_code)
+
+    def test_tag_autocomplete_ranked_by_usage(self):
+        collection = Collection.objects.create(name='Test Collection')
+        category = RecordCategory.objects.create(name='Test Category')
+        record = Record.objects.create(title='Test Record', collection=collection, category=category)
+        testing = RecordTag.objects.create(name='testing')
+        record.tags.add(testing)
+
+        response = self.c.get(reverse('tag-autocomplete'), data={'q': 'TEST'})
+        data = json.loads(response.content)
+        self.assertEqual([{'name': 'testing', 'count': 1}, {'name': 'Test Tag', 'count': 0}], data)
+
+    def test_tag_autocomplete_limit(self):
+        for i in range(20):
+            RecordTag.objects.create(name=f'Tested {i}')
+
+        response = self.c.get(reverse('tag-autocomplete'), data={'q': 'test', 'limit': 100})
+        self.assertEqual(settings.TAG_AUTOCOMPLETE_LIMIT, len(json.loads(response.content)))
+        response = self.c.get(reverse('tag-autocomplete'), data={'q': 'test', 'limit': 2})
+        self.assertEqual(2, len(json.loads(response.content)))
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_tag_autocomplete_without_queries(self):
+        self.c.get(reverse('tag-autocomplete'), data={'q': 'test'})
+        with self.assertNumQueries(0):
+            response = self.c.get(reverse('tag-autocomplete'), data={'q': 'tag'})
+        self.assertEqual(['Tag Test'], [tag['name'] for tag in json.loads(response.content)])
+
+    def test_tag_autocomplete_sees_new_tags(self):
+        self.c.get(reverse('tag-autocomplete'), data={'q': 'test'})
+        RecordTag.objects.create(name='Testimony')
+        response = self.c.get(reverse('tag-autocomplete'), data={'q': 'testi'})
+        self.assertEqual(['Testimony'], [tag['name'] for tag in json.loads(response.content)])
+
+
+class JsonApiTestCase(TestCase):
+    def setUp(self):
+        self.c = Client()
+        self.user = User.objects.create(username='user1', password='password')
+        self.collection = Collection.objects.create(name='Public Collection', public=True)
+        self.private_collection = Collection.objects.create(name='Private Collection')
+        self.category = RecordCategory.objects.create(name='Test Category')
+        self.tag = RecordTag.objects.create(name='Test Tag')
+        self.records = []
+        for i in range(5):
+            record = Record.objects.create(title=f'Record {i}', collection=self.collection, category=self.category,
+                                           public=i != 2)
+            record.tags.add(self.tag)
+            if i == 0:
+                RecordFile.objects.create(record=record, file='record_files/test/sample.jpg',
+                                          content_type='image/jpeg', size_bytes=100)
+            self.records.append(record)
+        self.private_record = self.records[2]
+
+    def test_collection_list(self):
+        response = self.c.get(reverse('api-collection-list'))
+        self.assertEqual(200, response.status_code)
+        data = json.loads(response.content)
+        self.assertEqual(['Public Collection'], [collection['name'] for collection in data['results']])
+        self.assertEqual(4, data['results'][0]['record_count'])
+        self.assertIsNone(data['next'])
+
+        self.c.force_login(self.user)
+        data = json.loads(self.c.get(reverse('api-collection-list')).content)
+        self.assertEqual(2, len(data['results']))
+        self.assertEqual(5, data['results'][0]['record_count'])
+
+    def test_collection_detail_visibility(self):
+        response = self.c.get(reverse('api-collection-detail', kwargs={'pk': self.private_collection.pk}))
+        self.assertEqual(404, response.status_code)
+        response = self.c.get(reverse('api-record-list', kwargs={'collection_id': self.private_collection.pk}))
+        self.assertEqual(404, response.status_code)
+
+        self.c.force_login(self.user)
+        response = self.c.get(reverse('api-collection-detail', kwargs={'pk': self.private_collection.pk}))
+        self.assertEqual(self.private_collection.pk, json.loads(response.content)['id'])
+
+    def test_record_list_cursor(self):
+        url = reverse('api-record-list', kwargs={'collection_id': self.collection.pk})
+        titles = []
+        data = {'next': f'{url}?limit=2'}
+        while data['next']:
+            data = json.loads(self.c.get(data['next']).content)
+            self.assertLessEqual(len(data['results']), 2)
+            titles += [record['title'] for record in data['results']]
+        self.assertEqual(['Record 0', 'Record 1', 'Record 3', 'Record 4'], titles)
+
+        response = self.c.get(url, data={'cursor': 'invalid'})
+        self.assertEqual(400, response.status_code)
+
+    def test_record_fields(self):
+        url = reverse('api-record-list', kwargs={'collection_id': self.collection.pk})
+        # collection and records
+        with self.assertNumQueries(2):
+            response = self.c.get(url, data={'fields': 'id,title'})
+        data = json.loads(response.content)
+        self.assertEqual({'id': self.records[0].pk, 'title': 'Record 0'}, data['results'][0])
+
+        # collection, records, tags and files, independent of the number of records
+        with self.assertNumQueries(4):
+            response = self.c.get(url, data={'fields': 'title,category,tags,files'})
+        record = json.loads(response.content)['results'][0]
+        self.assertEqual({'id': self.category.pk, 'name': 'Test Category'}, record['category'])
+        self.assertEqual(['Test Tag'], record['tags'])
+        self.assertEqual('image/jpeg', record['files'][0]['content_type'])
+        self.assertTrue(record['files'][0]['file'].startswith('http://testserver/'))
+
+        response = self.c.get(url, data={'fields': 'title,secret'})
+        self.assertEqual(400, response.status_code)
+
+    def test_record_detail_visibility(self):
+        url = reverse('api-record-detail', kwargs={'collection_id': self.collection.pk, 'pk': self.private_record.pk})
+        self.assertEqual(404, self.c.get(url).status_code)
+        self.c.force_login(self.user)
+        self.assertEqual('Record 2', json.loads(self.c.get(url).content)['title'])
+
+    def test_record_ndjson(self):
+        url = reverse('api-record-list', kwargs={'collection_id': self.collection.pk})
+        with self.settings(API_STREAM_CHUNK_SIZE=2):
+            response = self.c.get(url, data={'format': 'ndjson', 'fields': 'id,tags'})
+            self.assertEqual('application/x-ndjson', response['Content-Type'])
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record.pk for record in self.records if record.public], [record['id'] for record in records])
+        self.assertEqual(['Test Tag'], records[0]['tags'])
+
+    def test_file_list(self):
+        url = reverse('api-file-list', kwargs={'collection_id': self.collection.pk, 'record_id': self.records[0].pk})
+        data = json.loads(self.c.get(url).content)
+        self.assertEqual(100, data['results'][0]['size_bytes'])
+        url = reverse('api-file-list', kwargs={'collection_id': self.collection.pk,
+                                               'record_id': self.private_record.pk})
+        self.assertEqual(404, self.c.get(url).status_code)
+
+    def test_tag_list(self):
+        response = self.c.get(reverse('api-tag-list'))
+        self.assertEqual(['Test Tag'], [tag['name'] for tag in json.loads(response.content)['results']])
+        self.assertEqual(405, self.c.post(reverse('api-tag-list')).status_code)
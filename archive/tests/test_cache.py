@@ -0,0 +1,88 @@
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+
+from archive.checks import check_shared_cache
+from archive.cache import FacetCache, get_facet_cache_stats, reset_facet_cache_stats
+from archive.filters import RecordFilter
+from archive.models import Collection, Record, RecordCategory, RecordTag, RecordFile
+
+
+class FacetCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.collection = Collection.objects.create(name='Test Collection', public=True)
+        self.category = RecordCategory.objects.create(name='Test Category')
+        self.record = Record.objects.create(title='Test Record', collection=self.collection, category=self.category,
+                                            public=True)
+
+    def get_facets(self, query='', visibility='public'):
+        queryset = Record.objects.filter(collection=self.collection)
+        if visibility == 'public':
+            queryset = queryset.filter(public=True)
+        record_filter = RecordFilter(QueryDict(query), queryset=queryset,
+                                     facet_cache=FacetCache(self.collection.pk, visibility))
+        return record_filter.get_facets()
+
+    def test_cache_hit(self):
+        self.get_facets()
+        with self.assertNumQueries(0):
+            facets = self.get_facets()
+        self.assertEqual(1, facets['category'][0].count)
+
+    def test_cache_keyed_by_filters_and_visibility(self):
+        Record.objects.create(title='Private Record', collection=self.collection, category=self.category)
+        self.assertEqual(1, self.get_facets()['category'][0].count)
+        self.assertEqual(2, self.get_facets(visibility='authenticated')['category'][0].count)
+        self.assertEqual([], self.get_facets('title_contains=nothing')['category'])
+
+    def test_invalidated_by_record_changes(self):
+        self.get_facets()
+        Record.objects.create(title='Second Record', collection=self.collection, category=self.category,
+                              public=True)
+        self.assertEqual(2, self.get_facets()['category'][0].count)
+
+        self.record.delete()
+        self.assertEqual(1, self.get_facets()['category'][0].count)
+
+    def test_invalidated_by_tag_changes(self):
+        tag = RecordTag.objects.create(name='tag')
+        self.assertEqual([], self.get_facets()['tags'])
+        self.record.tags.add(tag)
+        self.assertEqual(['tag'], [value.label for value in self.get_facets()['tags']])
+        tag.record_set.remove(self.record)
+        self.assertEqual([], self.get_facets()['tags'])
+
+    def test_invalidated_by_file_changes(self):
+        self.get_facets()
+        RecordFile.objects.create(record=self.record, file='record_files/sample.jpg', content_type='image/jpeg')
+        with self.assertNumQueries(3):
+            self.get_facets()
+
+    def test_invalidated_by_category_rename(self):
+        self.get_facets()
+        self.category.name = 'Renamed Category'
+        self.category.save()
+        self.assertEqual('Renamed Category', self.get_facets()['category'][0].label)
+
+    def test_stats(self):
+        reset_facet_cache_stats()
+        self.get_facets()
+        self.get_facets()
+        self.get_facets()
+        stats = get_facet_cache_stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+
+class SharedCacheCheckTestCase(TestCase):
+    def test_local_cache_in_production(self):
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                              'LOCATION': 'redis://localhost:6379/1'}}
+        with override_settings(DEBUG=False, CACHES=local):
+            self.assertEqual(['archive.E001'], [error.id for error in check_shared_cache(None)])
+        with override_settings(DEBUG=True, CACHES=local):
+            self.assertEqual([], check_shared_cache(None))
+        with override_settings(DEBUG=False, CACHES=shared):
+            self.assertEqual([], check_shared_cache(None))
@@ -0,0 +1,63 @@
+from django.test import TestCase
+
+from archive.counters import reconcile_counters
+from archive.models import Collection, Record, RecordCategory, RecordFile
+
+
+class CountersTestCase(TestCase):
+    def setUp(self):
+        self.collection = Collection.objects.create(name='Test Collection')
+        self.other_collection = Collection.objects.create(name='Other Collection')
+        self.category = RecordCategory.objects.create(name='Letters')
+        self.record = Record.objects.create(title='Public Record', collection=self.collection, category=self.category,
+                                            public=True)
+        Record.objects.create(title='Private Record', collection=self.collection, category=self.category)
+        RecordFile.objects.create(record=self.record, file='record_files/a.jpg', size_bytes=100)
+        RecordFile.objects.create(record=self.record, file='record_files/b.jpg', size_bytes=50)
+
+    def assertCounters(self, obj, record_count, public_record_count, file_count, bytes_total):
+        obj.refresh_from_db()
+        self.assertEqual((record_count, public_record_count, file_count, bytes_total),
+                         (obj.record_count, obj.public_record_count, obj.file_count, obj.bytes_total))
+
+    def test_counters_on_create(self):
+        self.assertCounters(self.collection, 2, 1, 2, 150)
+        self.assertCounters(self.category, 2, 1, 2, 150)
+        self.assertCounters(self.other_collection, 0, 0, 0, 0)
+
+    def test_counters_on_visibility_change(self):
+        record = Record.objects.get(pk=self.record.pk)
+        record.public = False
+        record.save()
+        self.assertCounters(self.collection, 2, 0, 2, 150)
+        record.save()
+        self.assertCounters(self.collection, 2, 0, 2, 150)
+
+    def test_counters_on_move(self):
+        record = Record.objects.get(pk=self.record.pk)
+        record.collection = self.other_collection
+        record.save()
+        self.assertCounters(self.collection, 1, 0, 0, 0)
+        self.assertCounters(self.other_collection, 1, 1, 2, 150)
+        self.assertCounters(self.category, 2, 1, 2, 150)
+
+    def test_counters_on_file_change(self):
+        record_file = RecordFile.objects.get(file='record_files/a.jpg')
+        record_file.size_bytes = 300
+        record_file.save()
+        self.assertCounters(self.collection, 2, 1, 2, 350)
+        record_file.delete()
+        self.assertCounters(self.collection, 2, 1, 1, 50)
+
+    def test_counters_on_delete(self):
+        Record.objects.get(pk=self.record.pk).delete()
+        self.assertCounters(self.collection, 1, 0, 0, 0)
+        self.assertCounters(self.category, 1, 0, 0, 0)
+
+    def test_reconcile_counters(self):
+        Collection.objects.update(record_count=42, public_record_count=42, file_count=42, bytes_total=42)
+        Record.objects.filter(pk=self.record.pk).update(public=False)
+        reconcile_counters()
+        self.assertCounters(self.collection, 2, 0, 2, 150)
+        self.assertCounters(self.other_collection, 0, 0, 0, 0)
+        self.assertCounters(self.category, 2, 0, 2, 150)
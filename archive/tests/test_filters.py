@@ -0,0 +1,69 @@
+from datetime import date
+
+from django.http import QueryDict
+from django.test import TestCase
+
+from archive.filters import RecordFilter
+from archive.models import Collection, Record, RecordCategory, RecordTag
+
+
+class RecordFilterFacetTestCase(TestCase):
+    def setUp(self):
+        self.collection = Collection.objects.create(name='Test Collection')
+        other_collection = Collection.objects.create(name='Other Collection')
+        self.letters = RecordCategory.objects.create(name='Letters')
+        self.photos = RecordCategory.objects.create(name='Photos')
+        self.tag_a = RecordTag.objects.create(name='a')
+        self.tag_b = RecordTag.objects.create(name='b')
+        self.unused_tag = RecordTag.objects.create(name='unused')
+
+        self.record1 = Record.objects.create(title='Record 1', collection=self.collection, category=self.letters,
+                                             origin_date=date(1990, 1, 1))
+        self.record2 = Record.objects.create(title='Record 2', collection=self.collection, category=self.letters,
+                                             origin_date=date(1990, 6, 1))
+        self.record3 = Record.objects.create(title='Record 3', collection=self.collection, category=self.photos,
+                                             origin_date=date(2000, 1, 1))
+        self.record1.tags.add(self.tag_a, self.tag_b)
+        self.record2.tags.add(self.tag_a)
+        self.record3.tags.add(self.tag_b)
+
+        other_record = Record.objects.create(title='Other', collection=other_collection, category=self.photos,
+                                             origin_date=date(1800, 1, 1))
+        other_record.tags.add(self.unused_tag)
+
+    def get_filter(self, query=''):
+        return RecordFilter(QueryDict(query), queryset=Record.objects.filter(collection=self.collection))
+
+    def test_facets_scoped_to_queryset(self):
+        facets = self.get_filter().get_facets()
+        self.assertEqual([(2000, 1), (1990, 2)], [(value.value, value.count) for value in facets['origin_date__year']])
+        self.assertEqual([('Letters', 2), ('Photos', 1)],
+                         [(value.label, value.count) for value in facets['category']])
+        self.assertEqual([('a', 2), ('b', 2)], [(value.label, value.count) for value in facets['tags']])
+
+    def test_facets_reflect_other_filters(self):
+        record_filter = self.get_filter(f'category={self.letters.pk}&tags={self.tag_b.pk}')
+        self.assertEqual([self.record1], list(record_filter.qs))
+        facets = record_filter.get_facets()
+        # the category facet ignores the category filter, but respects the tag filter
+        self.assertEqual([('Letters', 1), ('Photos', 1)],
+                         [(value.label, value.count) for value in facets['category']])
+        self.assertEqual([('a', 2), ('b', 1)], [(value.label, value.count) for value in facets['tags']])
+        self.assertEqual([(1990, 1)], [(value.value, value.count) for value in facets['origin_date__year']])
+
+    def test_selected_value_without_matches_stays_visible(self):
+        record_filter = self.get_filter(f'origin_date__year=2000&category={self.letters.pk}')
+        self.assertEqual([], list(record_filter.qs))
+        self.assertIn(('2000', '2000 (0)'), record_filter.get_facet_choices('origin_date__year'))
+
+    def test_invalid_year(self):
+        record_filter = self.get_filter('origin_date__year=abc')
+        self.assertIn('origin_date__year', record_filter.errors)
+
+    def test_render_form_queries(self):
+        record_filter = self.get_filter(f'tags={self.tag_a.pk}')
+        # one query validating the tag, three facet queries
+        with self.assertNumQueries(4):
+            html = record_filter.form.as_p()
+        self.assertIn('Letters (2)', html)
+        self.assertNotIn('unused', html)
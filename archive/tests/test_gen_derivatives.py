@@ -0,0 +1,168 @@
+import json
+import os
+from importlib import import_module
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError, OutputWrapper
+from django.test import TestCase
+from PIL import Image
+
+from archive.management.batch import Progress
+from archive.management.derivatives import GENERATORS
+from archive.models import Collection, Record, RecordCategory, RecordFile
+from archive.thumbnails import get_thumbnail_signature, get_image_preview_signature
+from archive.video import get_preview_signature
+
+
+class GenDerivativesTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.checkpoint = os.path.join(self.tmp_dir.name, 'thumbnails.checkpoint')
+        category = RecordCategory.objects.create(name='Test Category')
+        self.collection = Collection.objects.create(name='Test Collection', public=True)
+        self.record = Record.objects.create(title='Test Record', collection=self.collection, category=category)
+        other_collection = Collection.objects.create(name='Other Collection', public=True)
+        self.other_record = Record.objects.create(title='Other Record', collection=other_collection,
+                                                  category=category)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_file(self, name, content_type, record=None, **kwargs):
+        return RecordFile.objects.create(record=record or self.record, file=f'record_files/{name}',
+                                         content_type=content_type, **kwargs)
+
+    def run_command(self, name, *args, kind='thumbnail', side_effect=None):
+        generator = MagicMock(side_effect=side_effect)
+        stdout, stderr = StringIO(), StringIO()
+        with patch.dict(GENERATORS, {kind: generator}):
+            call_command(name, '--workers', '1', '--chunk-size', '2', '--checkpoint', self.checkpoint, *args,
+                         stdout=stdout, stderr=stderr)
+        return [call.args[0].pk for call in generator.call_args_list], stdout.getvalue(), stderr.getvalue()
+
+    def test_missing_and_outdated_thumbnails(self):
+        missing = self.create_file('missing.jpg', 'image/jpeg')
+        null = self.create_file('null.pdf', 'application/pdf', thumbnail=None)
+        current = self.create_file('current.jpg', 'image/jpeg', thumbnail='record_files/current_thumb.jpg',
+                                   thumbnail_signature=get_thumbnail_signature())
+        outdated = self.create_file('outdated.mp4', 'video/mp4', thumbnail='record_files/outdated_thumb.jpg',
+                                    thumbnail_signature='0' * 16)
+        self.create_file('site.wacz', 'application/wacz')
+
+        pks, stdout, stderr = self.run_command('gen_thumbs')
+        self.assertEqual([missing.pk, null.pk, outdated.pk], pks)
+        self.assertIn('Generated 3 thumbnails, 0 failed', stdout)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        pks, stdout, stderr = self.run_command('gen_thumbs', '--regen')
+        self.assertEqual([missing.pk, null.pk, current.pk, outdated.pk], pks)
+
+    def test_missing_and_outdated_previews(self):
+        image = self.create_file('scan.tif', 'image/tiff', preview='record_files/scan_2000w.jpg',
+                                 preview_signature=get_image_preview_signature())
+        video = self.create_file('interview.mp4', 'video/mp4')
+        self.create_file('letter.pdf', 'application/pdf')
+
+        self.assertEqual([video.pk], self.run_command('gen_previews', kind='preview')[0])
+        with self.settings(IMAGE_RENDITION_WIDTHS=[400, 1600]):
+            self.assertEqual([image.pk, video.pk], self.run_command('gen_previews', kind='preview')[0])
+
+    def test_scope(self):
+        image = self.create_file('scan.tif', 'image/tiff')
+        pdf = self.create_file('letter.pdf', 'application/pdf')
+        self.create_file('other.pdf', 'application/pdf', record=self.other_record)
+
+        pks = self.run_command('gen_thumbs', '--collection', str(self.collection.pk))[0]
+        self.assertEqual([image.pk, pdf.pk], pks)
+        pks = self.run_command('gen_thumbs', '--collection', str(self.collection.pk), '--content-type', 'image/')[0]
+        self.assertEqual([image.pk], pks)
+
+    def test_resume_from_checkpoint(self):
+        record_files = [self.create_file(f'scan{number}.jpg', 'image/jpeg') for number in range(5)]
+        with open(self.checkpoint, 'w') as file:
+            json.dump({'selection': json.dumps({'kind': 'thumbnail', 'regen': False, 'collection': None,
+                                                'content_types': []}), 'pk': record_files[2].pk}, file)
+
+        pks, stdout, stderr = self.run_command('gen_thumbs')
+        self.assertIn(f'Resuming after record file {record_files[2].pk}', stdout)
+        self.assertEqual([record_file.pk for record_file in record_files[3:]], pks)
+
+    def test_checkpoint_of_other_selection(self):
+        self.create_file('scan.jpg', 'image/jpeg')
+        with open(self.checkpoint, 'w') as file:
+            json.dump({'selection': 'other', 'pk': 1}, file)
+        with self.assertRaises(CommandError):
+            self.run_command('gen_thumbs')
+        self.assertEqual(1, len(self.run_command('gen_thumbs', '--restart')[0]))
+
+    def test_failed_files_are_reported(self):
+        broken, fine = self.create_file('broken.jpg', 'image/jpeg'), self.create_file('fine.jpg', 'image/jpeg')
+        pks, stdout, stderr = self.run_command('gen_thumbs', side_effect=[OSError('truncated'), None])
+        self.assertEqual([broken.pk, fine.pk], pks)
+        self.assertIn(f'Could not generate thumbnail of record file {broken.pk}: OSError: truncated', stderr)
+        self.assertIn('Generated 1 thumbnails, 1 failed', stdout)
+
+    def test_failed_previews_are_reported(self):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            broken = RecordFile.objects.create(record=self.record, file=ContentFile(b'not an image', name='broken.jpg'),
+                                               content_type='image/jpeg')
+            stdout, stderr = StringIO(), StringIO()
+            with self.assertLogs('archive.thumbnails', 'ERROR'):
+                call_command('gen_previews', '--workers', '1', '--checkpoint', self.checkpoint, stdout=stdout,
+                             stderr=stderr)
+        self.assertIn(f'Could not generate preview of record file {broken.pk}: UnidentifiedImageError',
+                      stderr.getvalue())
+        self.assertIn('Generated 0 previews, 1 failed', stdout.getvalue())
+
+    def test_generate_thumbnails(self):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(buffer, 'JPEG')
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            record_file = RecordFile.objects.create(record=self.record, file=ContentFile(buffer.getvalue(),
+                                                                                         name='photo.jpg'),
+                                                    content_type='image/jpeg')
+            call_command('gen_thumbs', '--workers', '1', '--checkpoint', self.checkpoint, stdout=StringIO())
+            stdout = StringIO()
+            call_command('gen_thumbs', '--workers', '1', '--checkpoint', self.checkpoint, stdout=stdout)
+        record_file.refresh_from_db()
+        self.assertTrue(record_file.thumbnail.name.endswith('_thumb.jpg'))
+        self.assertEqual(get_thumbnail_signature(), record_file.thumbnail_signature)
+        self.assertEqual(get_image_preview_signature(), record_file.preview_signature)
+        self.assertIn('No thumbnails to generate', stdout.getvalue())
+
+    def test_signatures_of_existing_derivatives(self):
+        migration = import_module('archive.migrations.0035_recordfile_signatures')
+        image = self.create_file('scan.tif', 'image/tiff', thumbnail='record_files/scan_thumb.jpg',
+                                 preview='record_files/scan_2000w.jpg',
+                                 renditions=[{'width': 2000, 'height': 1000, 'name': 'record_files/scan_2000w.jpg'}])
+        legacy_image = self.create_file('old.jpg', 'image/jpeg', preview='record_files/old_preview.jpg')
+        video = self.create_file('interview.mp4', 'video/mp4', preview='record_files/interview_preview.mp4',
+                                 hls_playlist='record_files/interview_hls/master.m3u8')
+        remuxed_video = self.create_file('clip.mp4', 'video/mp4', preview='record_files/clip.mp4')
+        legacy_video = self.create_file('tape.mp4', 'video/mp4', preview='record_files/tape_preview.mp4')
+        migration.populate_signatures(apps, None)
+
+        signatures = dict(RecordFile.objects.values_list('pk', 'preview_signature'))
+        self.assertEqual(get_image_preview_signature(), signatures[image.pk])
+        self.assertEqual(get_preview_signature(), signatures[video.pk])
+        self.assertEqual(get_preview_signature(), signatures[remuxed_video.pk])
+        self.assertEqual('', signatures[legacy_image.pk])
+        self.assertEqual('', signatures[legacy_video.pk])
+        image.refresh_from_db()
+        self.assertEqual(get_thumbnail_signature(), image.thumbnail_signature)
+
+
+class ProgressTestCase(TestCase):
+    @patch('archive.management.batch.time.monotonic')
+    def test_progress(self, monotonic):
+        monotonic.return_value = 0
+        stdout = StringIO()
+        progress = Progress(OutputWrapper(stdout), 1000, width=10)
+        monotonic.return_value = 10
+        progress.update(250)
+        self.assertEqual('[##........] 250/1000 25.0 files/s ETA 0:00:30\n', stdout.getvalue())
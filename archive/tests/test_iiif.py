@@ -0,0 +1,157 @@
+import json
+import os
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.test import TestCase, Client
+from django.urls import reverse
+from PIL import Image
+
+from archive import iiif
+from archive.models import Collection, Record, RecordCategory, RecordFile
+
+
+def get_image(size):
+    image = Image.new('RGB', size, 'white')
+    # a red quarter in the bottom right corner
+    image.paste(Image.new('RGB', (size[0] // 2, size[1] // 2), 'red'), (size[0] // 2, size[1] // 2))
+    buffer = BytesIO()
+    image.save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name='map.png')
+
+
+class IIIFTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.settings_override = self.settings(MEDIA_ROOT=os.path.join(self.tmp_dir.name, 'media'),
+                                               IIIF_ROOT=os.path.join(self.tmp_dir.name, 'iiif'), IIIF_TILE_SIZE=256)
+        self.settings_override.enable()
+        collection = Collection.objects.create(name='Test Collection', public=True)
+        category = RecordCategory.objects.create(name='Maps')
+        self.record = Record.objects.create(title='Map', collection=collection, category=category, public=True)
+        self.record_file = RecordFile.objects.create(record=self.record, file=get_image((1000, 600)),
+                                                     content_type='image/png', width=1000, height=600)
+        self.c = Client()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+
+    def get_image(self, path, status=200):
+        response = self.c.get(f'/iiif/{self.record_file.pk}/{path}')
+        self.assertEqual(status, response.status_code)
+        if status != 200:
+            return None
+        return Image.open(BytesIO(b''.join(response.streaming_content)))
+
+    def test_parse(self):
+        self.assertEqual((0, 0, 1000, 600), iiif.parse_region('full', 1000, 600))
+        self.assertEqual((200, 0, 600, 600), iiif.parse_region('square', 1000, 600))
+        self.assertEqual((500, 300, 500, 300), iiif.parse_region('pct:50,50,50,50', 1000, 600))
+        self.assertEqual((900, 500, 100, 100), iiif.parse_region('900,500,200,200', 1000, 600))
+        self.assertEqual((250, 150), iiif.parse_size('250,', 500, 300))
+        self.assertEqual((200, 120), iiif.parse_size('!200,200', 500, 300))
+        self.assertEqual((1000, 600), iiif.parse_size('^pct:200', 500, 300))
+        self.assertEqual((True, 90), iiif.parse_rotation('!90'))
+        for function, value in [(iiif.parse_region, '0,0,0,10'), (iiif.parse_region, '2000,0,10,10'),
+                                (iiif.parse_size, '1000,'), (iiif.parse_size, 'huge')]:
+            with self.assertRaises(iiif.IIIFError):
+                function(value, 500, 300)
+        with self.assertRaises(iiif.IIIFError):
+            iiif.parse_rotation('45')
+
+    def test_build_tiles(self):
+        iiif.build_tiles(self.record_file)
+        self.assertIsNotNone(self.record_file.tiles_generated_at)
+        self.assertEqual([1, 2, 4], iiif.get_scale_factors(1000, 600))
+        with Image.open(iiif.get_tile_path(self.record_file.pk, 1, 3, 2)) as tile:
+            self.assertEqual((1000 - 768, 600 - 512), tile.size)
+        with Image.open(iiif.get_tile_path(self.record_file.pk, 4, 0, 0)) as tile:
+            self.assertEqual((250, 150), tile.size)
+
+    def test_info(self):
+        iiif.build_tiles(self.record_file)
+        response = self.c.get(reverse('iiif-info', kwargs={'pk': self.record_file.pk}))
+        info = json.loads(response.content)
+        self.assertEqual(f'http://testserver/iiif/{self.record_file.pk}', info['id'])
+        self.assertEqual([{'width': 256, 'scaleFactors': [1, 2, 4]}], info['tiles'])
+        self.assertEqual('*', response['Access-Control-Allow-Origin'])
+        self.assertIn('public', response['Cache-Control'])
+
+        response = self.c.get(reverse('iiif-base', kwargs={'pk': self.record_file.pk}))
+        self.assertEqual(303, response.status_code)
+
+    def test_tile_served_from_pyramid(self):
+        iiif.build_tiles(self.record_file)
+        with patch('archive.iiif.render') as render:
+            image = self.get_image('512,512,488,88/244,/0/default.jpg')
+            render.assert_not_called()
+        self.assertEqual((244, 44), image.size)
+        image = self.get_image('768,0,232,256/232,/0/default.jpg')
+        self.assertEqual((232, 256), image.size)
+
+    def test_region_from_tiles(self):
+        iiif.build_tiles(self.record_file)
+        image = self.get_image('400,200,300,200/150,/0/default.png')
+        self.assertEqual((150, 100), image.size)
+        red, green, blue = image.convert('RGB').getpixel((10, 10))
+        self.assertTrue(red > 250 and green > 250 and blue > 250)
+        red, green, blue = image.convert('RGB').getpixel((140, 90))
+        self.assertTrue(red > 250 and green < 5 and blue < 5)
+
+        # the second request is answered from the cache
+        with patch('archive.iiif.render') as render:
+            self.get_image('400,200,300,200/150,/0/default.png')
+            render.assert_not_called()
+
+    def test_without_tiles(self):
+        image = self.get_image('full/!100,100/!90/gray.jpg')
+        self.assertEqual((60, 100), image.size)
+        self.assertEqual('L', image.mode)
+        self.get_image('full/max/45/default.jpg', status=501)
+        self.get_image('full/max/0/default.gif', status=415)
+        self.get_image('full/2000,/0/default.jpg', status=400)
+
+    def test_large_image_without_tiles(self):
+        # a blue rendition tells its pixels apart from the original
+        os.makedirs(os.path.join(self.tmp_dir.name, 'media', 'record_files'), exist_ok=True)
+        Image.new('RGB', (400, 240), 'blue').save(os.path.join(self.tmp_dir.name, 'media', 'record_files',
+                                                               'map_400w.jpg'))
+        self.record_file.renditions = [{'width': 400, 'height': 240, 'name': 'record_files/map_400w.jpg'}]
+        self.record_file.save()
+        with self.settings(IIIF_TILE_MIN_SIZE=500):
+            red, green, blue = self.get_image('full/200,/0/default.png').getpixel((10, 10))
+            self.assertTrue(blue > 200 and red < 50)
+            response = self.c.get(f'/iiif/{self.record_file.pk}/full/max/0/default.jpg')
+            self.assertEqual(503, response.status_code)
+            self.assertEqual(str(iiif.RETRY_AFTER), response['Retry-After'])
+
+    def test_visibility(self):
+        self.record.public = False
+        self.record.save()
+        self.get_image('full/max/0/default.jpg', status=404)
+        self.c.force_login(User.objects.create(username='user1', password='password'))
+        response = self.c.get(reverse('iiif-info', kwargs={'pk': self.record_file.pk}))
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_cache_eviction(self):
+        with self.settings(IIIF_CACHE_MAX_BYTES=0):
+            self.get_image('full/100,/0/default.jpg')
+            iiif.evict_cache()
+        self.assertEqual([], os.listdir(iiif.get_cache_dir(self.record_file.pk)))
+
+    def test_delete(self):
+        iiif.build_tiles(self.record_file)
+        self.record_file.delete()
+        self.assertFalse(os.path.exists(iiif.get_tile_dir(self.record_file.pk)))
+
+    def test_gen_tiles(self):
+        with self.settings(IIIF_TILE_MIN_SIZE=500):
+            call_command('gen_tiles')
+        self.record_file.refresh_from_db()
+        self.assertIsNotNone(self.record_file.tiles_generated_at)
+        self.assertTrue(os.path.exists(iiif.get_tile_path(self.record_file.pk, 4, 0, 0)))
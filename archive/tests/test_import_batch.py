@@ -0,0 +1,117 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from archive import tasks
+from archive.models import Collection, Record, RecordCategory, RecordFile, RecordTag
+from archive.search import get_backend
+
+TEST_ASSETS_DIR = 'test_assets'
+
+
+class ImportBatchTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.source = os.path.join(self.tmp_dir.name, 'source')
+        self.media_root = os.path.join(self.tmp_dir.name, 'media')
+        os.makedirs(os.path.join(self.source, 'scans'))
+        shutil.copy(os.path.join(TEST_ASSETS_DIR, 'sample.jpg'), os.path.join(self.source, 'scans', 'page1.jpg'))
+        shutil.copy(os.path.join(TEST_ASSETS_DIR, 'sample.pdf'), os.path.join(self.source, 'minutes.pdf'))
+        self.collection = Collection.objects.create(name='Test Collection')
+        RecordTag.objects.create(name='Berlin')
+
+        self.manifest = os.path.join(self.tmp_dir.name, 'manifest.csv')
+        with open(self.manifest, 'w', newline='') as file:
+            writer = csv.DictWriter(file, ['title', 'category', 'description', 'origin_date', 'public', 'tags',
+                                           'files'])
+            writer.writeheader()
+            writer.writerow({'title': 'Poster', 'category': 'Posters', 'origin_date': '1989-11-09', 'public': 'yes',
+                             'tags': 'berlin; Wall; wall', 'files': 'scans/page1.jpg'})
+            writer.writerow({'title': 'Minutes', 'category': 'Letters', 'description': 'Plenary session',
+                             'tags': 'Berlin', 'files': 'minutes.pdf;scans/page1.jpg'})
+            writer.writerow({'title': 'Note', 'category': 'Letters'})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_import(self, *args):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            call_command('import_batch', self.manifest, '--source', self.source, '--collection',
+                         str(self.collection.pk), '--chunk-size', '2', *args, stdout=StringIO())
+
+    def test_import(self):
+        self.run_import()
+
+        self.assertEqual(3, Record.objects.count())
+        poster = Record.objects.get(title='Poster')
+        self.assertTrue(poster.public)
+        self.assertEqual('1989-11-09', poster.origin_date.isoformat())
+        self.assertEqual(['Berlin', 'Wall'], [tag.name for tag in poster.tags.all()])
+        self.assertEqual(Record.MediaKind.IMAGE, poster.media_kind)
+        self.assertEqual(2, RecordTag.objects.count())
+
+        minutes = Record.objects.get(title='Minutes')
+        self.assertEqual(Record.MediaKind.PDF, minutes.media_kind)
+        pdf = minutes.recordfile_set.get(content_type='application/pdf')
+        with open(os.path.join(TEST_ASSETS_DIR, 'sample.pdf'), 'rb') as file:
+            content = file.read()
+        self.assertEqual(hashlib.sha256(content).hexdigest(), pdf.checksum)
+        self.assertEqual(len(content), pdf.size_bytes)
+        self.assertTrue(pdf.file.name.startswith('record_files/'))
+        self.assertTrue(os.path.isfile(os.path.join(self.media_root, pdf.file.name)))
+
+        self.collection.refresh_from_db()
+        self.assertEqual((3, 1, 3), (self.collection.record_count, self.collection.public_record_count,
+                                     self.collection.file_count))
+        self.assertEqual(sum(RecordFile.objects.values_list('size_bytes', flat=True)), self.collection.bytes_total)
+        self.assertEqual(2, RecordCategory.objects.get(name='Letters').record_count)
+        self.assertEqual(1, get_backend().search('plenary').count())
+        self.assertFalse(os.path.exists(f'{self.manifest}.checkpoint'))
+
+    def test_import_resume_from_checkpoint(self):
+        with open(f'{self.manifest}.checkpoint', 'w') as file:
+            json.dump({'manifest': os.path.abspath(self.manifest), 'rows': 2}, file)
+        self.run_import()
+        self.assertEqual(['Note'], [record.title for record in Record.objects.all()])
+
+    def test_import_skips_committed_rows(self):
+        self.run_import('--link')
+        self.run_import()
+        self.assertEqual(['Note'], list(Record.objects.filter(recordfile__isnull=True).values_list('title', flat=True)))
+        self.assertEqual(3, Record.objects.count())
+        self.assertEqual(3, RecordFile.objects.count())
+
+    def test_import_invalid_row(self):
+        with open(self.manifest, 'a', newline='') as file:
+            file.write('Untitled,,,,,,\n')
+        with self.assertRaisesMessage(CommandError, 'Row 4'):
+            self.run_import()
+        self.assertEqual(2, Record.objects.count())
+        with open(f'{self.manifest}.checkpoint') as file:
+            self.assertEqual(2, json.load(file)['rows'])
+
+    @patch('archive.management.commands.import_batch.send')
+    def test_import_sends_long_tasks_per_file(self, send):
+        with open(os.path.join(self.source, 'interview.mp4'), 'wb') as file:
+            file.write(b'\0' * 100)
+        with open(self.manifest, 'a', newline='') as file:
+            file.write('Interview,Videos,,,,,interview.mp4\n')
+        self.run_import()
+        video_file = RecordFile.objects.get(file__endswith='interview.mp4')
+        # transcoding, storyboards and OCR keep their own time limit or late acknowledgement instead of running in
+        # a chunk
+        sent = {(call.args[0], call.args[1]) for call in send.call_args_list}
+        self.assertEqual({tasks.transcode_video, tasks.generate_storyboard, tasks.ocr_record_file},
+                         {task for task, pk in sent})
+        self.assertEqual({tasks.transcode_video, tasks.generate_storyboard},
+                         {task for task, pk in sent if pk == video_file.pk})
+        self.assertTrue(all(call.kwargs['backfill'] for call in send.call_args_list))
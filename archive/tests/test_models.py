@@ -49,6 +49,30 @@ class RecordTestCase(TestCase):
 
         self.assertEqual(self.record.get_thumbnail(), None)
 
+    def test_cover_file_maintained(self):
+        record_file = RecordFile.objects.create(record=self.record, file='record_files/sample.jpg',
+                                                content_type='image/jpeg')
+        self.record.refresh_from_db()
+        self.assertIsNone(self.record.cover_file)
+        self.assertEqual(Record.MediaKind.IMAGE, self.record.media_kind)
+
+        record_file.thumbnail = 'record_files/sample_thumb.jpg'
+        record_file.save()
+        self.record.refresh_from_db()
+        self.assertEqual(record_file, self.record.cover_file)
+
+        record_file.delete()
+        self.record.refresh_from_db()
+        self.assertIsNone(self.record.cover_file)
+        self.assertEqual(Record.MediaKind.NONE, self.record.media_kind)
+
+    def test_media_kind_from_first_file(self):
+        RecordFile.objects.create(record=self.record, file='record_files/sample.mp4', content_type='video/mp4')
+        RecordFile.objects.create(record=self.record, file='record_files/sample.wacz', content_type='application/wacz')
+        self.record.refresh_from_db()
+        self.assertTrue(self.record.is_video())
+        self.assertFalse(self.record.is_wacz())
+
 
 class RecordFileTestCase(TestCase):
     def setUp(self):
@@ -0,0 +1,143 @@
+from datetime import datetime, timezone
+from xml.etree import ElementTree
+
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from archive.models import Collection, Record, RecordCategory, RecordFile, RecordTag
+from archive.oai import OAI_NAMESPACE, DC_NAMESPACE
+
+NAMESPACES = {'oai': OAI_NAMESPACE, 'dc': DC_NAMESPACE}
+
+
+@override_settings(OAI_REPOSITORY_IDENTIFIER='localhost')
+class OAITestCase(TestCase):
+    def setUp(self):
+        self.c = Client()
+        self.collection = Collection.objects.create(name='Public Collection', public=True)
+        self.private_collection = Collection.objects.create(name='Private Collection')
+        self.letters = RecordCategory.objects.create(name='Letters')
+        self.photos = RecordCategory.objects.create(name='Photos')
+        self.records = []
+        for i in range(5):
+            record = Record.objects.create(title=f'Record {i}', collection=self.collection,
+                                           category=self.letters if i % 2 else self.photos, public=True)
+            Record.objects.filter(pk=record.pk).update(updated_at=datetime(2024, 1, i + 1, 12, tzinfo=timezone.utc))
+            self.records.append(record)
+        self.private_record = Record.objects.create(title='Private Record', collection=self.collection,
+                                                    category=self.letters)
+        Record.objects.create(title='Hidden Record', collection=self.private_collection, category=self.letters,
+                              public=True)
+
+    def get(self, **data):
+        response = self.c.get(reverse('oai'), data=data)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/xml; charset=utf-8', response['Content-Type'])
+        return ElementTree.fromstring(response.content)
+
+    def get_error(self, **data):
+        error = self.get(**data).find('oai:error', NAMESPACES)
+        return error.get('code') if error is not None else None
+
+    def get_identifiers(self, root):
+        return [element.text for element in root.iterfind('.//oai:header/oai:identifier', NAMESPACES)]
+
+    def test_identify(self):
+        root = self.get(verb='Identify')
+        self.assertEqual('2024-01-01T12:00:00Z', root.find('.//oai:earliestDatestamp', NAMESPACES).text)
+        self.assertEqual('Identify', root.find('oai:request', NAMESPACES).get('verb'))
+
+    def test_errors(self):
+        self.assertEqual('badVerb', self.get_error())
+        self.assertEqual('badVerb', self.get_error(verb='Harvest'))
+        self.assertEqual('badArgument', self.get_error(verb='ListRecords'))
+        self.assertEqual('badArgument', self.get_error(verb='Identify', metadataPrefix='oai_dc'))
+        self.assertEqual('cannotDisseminateFormat', self.get_error(verb='ListRecords', metadataPrefix='marc'))
+        self.assertEqual('badArgument', self.get_error(verb='ListRecords', metadataPrefix='oai_dc', set='box:1'))
+        self.assertEqual('badArgument', self.get_error(verb='ListRecords', metadataPrefix='oai_dc', **{'from': '2024'}))
+        self.assertEqual('badResumptionToken', self.get_error(verb='ListRecords', resumptionToken='invalid'))
+        self.assertEqual('noRecordsMatch', self.get_error(verb='ListRecords', metadataPrefix='oai_dc',
+                                                          **{'from': '2025-01-01'}))
+        self.assertIsNone(self.get(verb='Harvest').find('oai:request', NAMESPACES).get('verb'))
+
+    def test_list_records(self):
+        root = self.get(verb='ListRecords', metadataPrefix='oai_dc')
+        self.assertEqual([f'oai:localhost:record/{record.pk}' for record in self.records], self.get_identifiers(root))
+        self.assertIsNone(root.find('.//oai:resumptionToken', NAMESPACES))
+        titles = [element.text for element in root.iterfind('.//dc:title', NAMESPACES)]
+        self.assertEqual([record.title for record in self.records], titles)
+
+    def test_resumption_token(self):
+        identifiers = []
+        with self.settings(OAI_PAGE_SIZE=2):
+            root = self.get(verb='ListIdentifiers', metadataPrefix='oai_dc', set=f'category:{self.photos.pk}')
+            identifiers += self.get_identifiers(root)
+            token = root.find('.//oai:resumptionToken', NAMESPACES).text
+            root = self.get(verb='ListIdentifiers', resumptionToken=token)
+            identifiers += self.get_identifiers(root)
+            self.assertIsNone(root.find('.//oai:resumptionToken', NAMESPACES).text)
+        self.assertEqual([f'oai:localhost:record/{self.records[i].pk}' for i in [0, 2, 4]], identifiers)
+
+    def test_from_until(self):
+        root = self.get(verb='ListIdentifiers', metadataPrefix='oai_dc',
+                        **{'from': '2024-01-02', 'until': '2024-01-03'})
+        self.assertEqual([f'oai:localhost:record/{self.records[i].pk}' for i in [1, 2]], self.get_identifiers(root))
+
+        root = self.get(verb='ListIdentifiers', metadataPrefix='oai_dc',
+                        **{'from': '2024-01-02T12:00:01Z', 'until': '2024-01-04T12:00:00Z'})
+        self.assertEqual([f'oai:localhost:record/{self.records[i].pk}' for i in [2, 3]], self.get_identifiers(root))
+
+    def test_changed_labels_and_files(self):
+        def changed():
+            root = self.get(verb='ListIdentifiers', metadataPrefix='oai_dc', **{'from': '2025-01-01'})
+            Record.objects.update(updated_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+            return self.get_identifiers(root)
+
+        self.letters.name = 'Correspondence'
+        self.letters.save()
+        self.assertEqual([f'oai:localhost:record/{self.records[i].pk}' for i in [1, 3]], changed())
+        tag = RecordTag.objects.create(name='Harbour')
+        self.records[0].tags.add(tag)
+        self.assertEqual([f'oai:localhost:record/{self.records[0].pk}'], changed())
+        tag.delete()
+        self.assertEqual([f'oai:localhost:record/{self.records[0].pk}'], changed())
+        record_file = RecordFile.objects.create(record=self.records[2], file='record_files/test/sample.jpg',
+                                                content_type='image/jpeg')
+        self.assertEqual([f'oai:localhost:record/{self.records[2].pk}'], changed())
+        # a regenerated thumbnail doesn't change the metadata
+        record_file.save()
+        self.assertEqual('noRecordsMatch', self.get_error(verb='ListIdentifiers', metadataPrefix='oai_dc',
+                                                          **{'from': '2025-01-01'}))
+
+    def test_published_collection(self):
+        self.collection.public = False
+        self.collection.save()
+        Record.objects.update(updated_at=datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.collection.name = 'Renamed Collection'
+        self.collection.save()
+        self.assertEqual('noRecordsMatch', self.get_error(verb='ListIdentifiers', metadataPrefix='oai_dc',
+                                                          **{'from': '2025-01-01'}))
+
+        self.collection.public = True
+        self.collection.save()
+        root = self.get(verb='ListIdentifiers', metadataPrefix='oai_dc', **{'from': '2025-01-01'})
+        self.assertEqual([f'oai:localhost:record/{record.pk}' for record in self.records], self.get_identifiers(root))
+
+    def test_get_record(self):
+        record = self.records[0]
+        record.tags.add(RecordTag.objects.create(name='Harbour'))
+        RecordFile.objects.create(record=record, file='record_files/test/sample.jpg', content_type='image/jpeg')
+        root = self.get(verb='GetRecord', metadataPrefix='oai_dc', identifier=f'oai:localhost:record/{record.pk}')
+        self.assertEqual('Harbour', root.find('.//dc:subject', NAMESPACES).text)
+        self.assertEqual('image/jpeg', root.find('.//dc:format', NAMESPACES).text)
+        self.assertEqual([f'collection:{self.collection.pk}', f'category:{self.photos.pk}'],
+                         [element.text for element in root.iterfind('.//oai:setSpec', NAMESPACES)])
+
+        self.assertEqual('idDoesNotExist', self.get_error(verb='GetRecord', metadataPrefix='oai_dc',
+                                                          identifier=f'oai:localhost:record/{self.private_record.pk}'))
+
+    def test_list_sets(self):
+        root = self.get(verb='ListSets')
+        specs = [element.text for element in root.iterfind('.//oai:setSpec', NAMESPACES)]
+        self.assertEqual([f'collection:{self.collection.pk}', f'category:{self.letters.pk}',
+                          f'category:{self.photos.pk}'], specs)
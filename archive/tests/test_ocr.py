@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+from PIL import Image
+
+from archive.models import Collection, Record, RecordCategory, RecordFile, RecordFilePage
+from archive.ocr import parse_tsv, ocr_record_file, needs_ocr
+from archive.search import get_backend
+
+TSV = '''level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext
+1\t1\t0\t0\t0\t0\t0\t0\t1000\t1400\t-1\t
+4\t1\t1\t1\t1\t0\t10\t10\t300\t30\t-1\t
+5\t1\t1\t1\t1\t1\t10\t10\t120\t30\t96.5\tDear
+5\t1\t1\t1\t1\t2\t140\t10\t170\t30\t91.2\t"friends",
+5\t1\t1\t1\t2\t1\t10\t50\t100\t30\t88\tthanks
+5\t1\t2\t1\t1\t1\t10\t200\t100\t30\t90\tRegards
+5\t1\t2\t1\t1\t2\t120\t200\t10\t30\t95\t 
+'''
+
+
+class ParseTsvTestCase(TestCase):
+    def test_parse_tsv(self):
+        text, words = parse_tsv(TSV)
+        self.assertEqual('Dear "friends",\nthanks\n\nRegards', text)
+        self.assertEqual(4, len(words))
+        self.assertEqual(['Dear', 10, 10, 120, 30, 96], words[0])
+
+
+@patch('archive.ocr.render_page', lambda record_file, path, number: Image.new('L', (100, 140)))
+@patch('archive.ocr.get_page_count', lambda record_file, path: 4)
+class OcrRecordFileTestCase(TestCase):
+    def setUp(self):
+        collection = Collection.objects.create(name='Test Collection')
+        category = RecordCategory.objects.create(name='Letters')
+        self.record = Record.objects.create(title='Minutes', collection=collection, category=category)
+
+    @patch('archive.ocr.run_tesseract')
+    def test_ocr_resumes_after_finished_pages(self, run_tesseract):
+        record_file = RecordFile.objects.create(record=self.record, file='record_files/scan.tif',
+                                                content_type='image/tiff')
+        run_tesseract.side_effect = lambda image: ('Protocol of the assembly', [])
+
+        self.assertEqual(1, ocr_record_file(record_file, max_pages=3))
+        self.assertEqual(3, run_tesseract.call_count)
+        record_file.refresh_from_db()
+        self.assertIsNone(record_file.ocr_completed_at)
+
+        self.assertEqual(0, ocr_record_file(record_file, max_pages=3))
+        self.assertEqual(4, run_tesseract.call_count)
+        self.assertEqual([1, 2, 3, 4], [page.number for page in record_file.pages.all()])
+        self.assertEqual((100, 140), (record_file.pages.first().width, record_file.pages.first().height))
+        record_file.refresh_from_db()
+        self.assertIsNotNone(record_file.ocr_completed_at)
+
+        self.assertEqual(0, ocr_record_file(record_file))
+        self.assertEqual(4, run_tesseract.call_count)
+        self.assertEqual([self.record], list(get_backend().search('assembly')[:10]))
+
+    @patch('archive.ocr.run_tesseract')
+    def test_ocr_only_pdf_pages_without_text_layer(self, run_tesseract):
+        record_file = RecordFile.objects.create(record=self.record, file='record_files/minutes.pdf',
+                                                content_type='application/pdf', text_extracted_at=timezone.now())
+        for number, text in enumerate(['Born digital page with plenty of text', '', 'Another page with text', ''],
+                                      start=1):
+            RecordFilePage.objects.create(record_file=record_file, number=number, text=text)
+        self.assertTrue(needs_ocr(record_file))
+        run_tesseract.return_value = ('Scanned appendix', [['Scanned', 1, 2, 3, 4, 90]])
+
+        self.assertEqual(0, ocr_record_file(record_file))
+        ocr_pages = record_file.pages.filter(source=RecordFilePage.Source.OCR)
+        self.assertEqual([2, 4], [page.number for page in ocr_pages])
+        self.assertEqual([['Scanned', 1, 2, 3, 4, 90]], ocr_pages[0].words)
+        self.assertEqual(1, get_backend().search('appendix').count())
+
+    def test_ocr_skips_other_files(self):
+        record_file = RecordFile.objects.create(record=self.record, file='record_files/video.mp4',
+                                                content_type='video/mp4')
+        self.assertEqual(0, ocr_record_file(record_file))
+        self.assertFalse(record_file.pages.exists())
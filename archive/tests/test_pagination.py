@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.exceptions import BadRequest
+from django.test import TestCase
+
+from archive.models import Collection, Record, RecordCategory
+from archive.pagination import KeysetPaginator
+
+
+class KeysetPaginatorTestCase(TestCase):
+    def setUp(self):
+        self.collection = Collection.objects.create(name='Test Collection')
+        category = RecordCategory.objects.create(name='Test Category')
+        origin_dates = [None, date(2001, 1, 1), None, date(1999, 5, 1), date(2001, 1, 1), None, date(1980, 1, 1)]
+        for i, origin_date in enumerate(origin_dates):
+            Record.objects.create(title=f'Record {i % 3}', collection=self.collection, category=category,
+                                  origin_date=origin_date)
+
+    def collect_pages(self, ordering, per_page):
+        paginator = KeysetPaginator(Record.objects.filter(collection=self.collection), ordering, per_page)
+        records = []
+        cursor = None
+        while True:
+            page = paginator.get_page(cursor)
+            self.assertLessEqual(len(page), per_page)
+            records.extend(page)
+            if not page.has_next():
+                return records
+            cursor = page.next_cursor
+
+    def test_pages_match_full_ordering(self):
+        for ordering in ['origin_date', '-origin_date', 'title', '-title', 'created_at', '-updated_at']:
+            expected = list(Record.objects.filter(collection=self.collection)
+                            .order_by(*KeysetPaginator(Record.objects.all(), ordering, 1).get_ordering()))
+            for per_page in [1, 2, 3, 10]:
+                self.assertEqual(expected, self.collect_pages(ordering, per_page), msg=f'{ordering} / {per_page}')
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(Record.objects.all(), 'origin_date', 2)
+        with self.assertRaises(BadRequest):
+            paginator.get_page('not-a-cursor')
@@ -0,0 +1,27 @@
+from django.db import IntegrityError
+from django.test import TestCase
+
+from archive.models import RecordTag
+from archive.tag_index import TagIndex
+
+
+class TagIndexTestCase(TestCase):
+    def setUp(self):
+        self.index = TagIndex([('Berlin', 3), ('berlin wall', 7), ('Bern', 3), ('Brandenburg', 10), ('Ärzte', 1)])
+
+    def test_search_prefix(self):
+        self.assertEqual([('berlin wall', 7), ('Berlin', 3), ('Bern', 3)], self.index.search('ber', 10))
+        self.assertEqual([('berlin wall', 7), ('Berlin', 3)], self.index.search('BERLIN', 10))
+        self.assertEqual([('Ärzte', 1)], self.index.search('är', 10))
+        self.assertEqual([], self.index.search('x', 10))
+
+    def test_search_limit(self):
+        self.assertEqual([('Brandenburg', 10), ('berlin wall', 7)], self.index.search('b', 2))
+        self.assertEqual(4, len(self.index.search('b', 10)))
+
+
+class RecordTagUniqueTestCase(TestCase):
+    def test_name_unique_ignoring_case(self):
+        RecordTag.objects.create(name='Test Tag')
+        with self.assertRaises(IntegrityError):
+            RecordTag.objects.create(name='test tag')
@@ -0,0 +1,235 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from billiard.exceptions import WorkerLostError
+from celery.signals import task_failure
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from archive import tasks, jobs
+from archive.models import Collection, DerivativeJob, Record, RecordCategory, RecordFile
+
+
+class DerivativeTasksTestCase(TestCase):
+    def setUp(self):
+        collection = Collection.objects.create(name='Test Collection', public=True)
+        category = RecordCategory.objects.create(name='Test Category')
+        self.record = Record.objects.create(title='Test Record', collection=collection, category=category)
+
+    def create_file(self, name, content_type):
+        return RecordFile.objects.create(record=self.record, file=f'record_files/{name}', content_type=content_type)
+
+    def test_tasks_by_kind(self):
+        self.assertEqual([tasks.generate_image_derivatives, tasks.ocr_record_file],
+                         tasks.get_derivative_tasks(self.create_file('scan.tif', 'image/tiff')))
+        self.assertEqual([tasks.generate_image_derivatives],
+                         tasks.get_derivative_tasks(self.create_file('photo.gif', 'image/gif')))
+        self.assertEqual([tasks.generate_pdf_derivatives, tasks.extract_text],
+                         tasks.get_derivative_tasks(self.create_file('letter.pdf', 'application/pdf')))
+        self.assertEqual([tasks.generate_video_thumbnail, tasks.transcode_video, tasks.generate_storyboard],
+                         tasks.get_derivative_tasks(self.create_file('interview.mp4', 'video/mp4')))
+        self.assertEqual([], tasks.get_derivative_tasks(self.create_file('site.wacz', 'application/wacz')))
+
+    def test_queues(self):
+        # every derivative task has a queue of its kind
+        queues = {task.name: settings.CELERY_TASK_ROUTES[task.name]['queue'] for task in [
+            tasks.generate_image_derivatives, tasks.build_tiles, tasks.generate_pdf_derivatives,
+            tasks.generate_video_thumbnail, tasks.transcode_video, tasks.generate_storyboard, tasks.extract_text,
+            tasks.ocr_record_file]}
+        self.assertEqual({'image', 'pdf', 'video', 'text', 'ocr'}, set(queues.values()))
+        self.assertEqual('video', queues['archive.tasks.transcode_video'])
+
+    @patch('celery.app.task.Task.apply_async')
+    def test_priorities(self, apply_async):
+        record_file = self.create_file('letter.pdf', 'application/pdf')
+        tasks.queue_derivatives(record_file)
+        self.assertEqual(2, apply_async.call_count)
+        apply_async.assert_called_with((record_file.pk, False), priority=settings.TASK_PRIORITY_INTERACTIVE,
+                                       countdown=None)
+
+        DerivativeJob.objects.update(state=DerivativeJob.State.DONE)
+        tasks.queue_derivatives(record_file, backfill=True)
+        apply_async.assert_called_with((record_file.pk, True), priority=settings.TASK_PRIORITY_BACKFILL,
+                                       countdown=None)
+
+    @patch('archive.tasks.enqueue')
+    def test_backfill_is_passed_on(self, enqueue):
+        record_file = self.create_file('letter.pdf', 'application/pdf')
+        with patch('archive.ocr.needs_ocr', return_value=True), patch('archive.text_extraction.extract_text'):
+            tasks.extract_text(record_file.pk, True)
+        enqueue.assert_called_once_with(tasks.ocr_record_file, record_file.pk, True)
+
+
+class DerivativeJobTestCase(TestCase):
+    def setUp(self):
+        self.collection = Collection.objects.create(name='Test Collection', public=True)
+        category = RecordCategory.objects.create(name='Test Category')
+        self.record = Record.objects.create(title='Test Record', collection=self.collection, category=category,
+                                            public=True)
+        self.record_file = RecordFile.objects.create(record=self.record, file='record_files/letter.pdf',
+                                                     content_type='application/pdf')
+
+    def get_job(self, kind=DerivativeJob.Kind.PDF):
+        return DerivativeJob.objects.get(record_file=self.record_file, kind=kind)
+
+    @patch('celery.app.task.Task.apply_async')
+    def test_enqueue_is_single_flight(self, apply_async):
+        tasks.enqueue(tasks.generate_pdf_derivatives, self.record_file.pk)
+        tasks.enqueue(tasks.generate_pdf_derivatives, self.record_file.pk)
+        self.assertEqual(1, apply_async.call_count)
+        self.assertEqual(DerivativeJob.State.QUEUED, self.get_job().state)
+
+        # a running job is not queued a second time either
+        self.assertTrue(jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.PDF))
+        tasks.enqueue(tasks.generate_pdf_derivatives, self.record_file.pk)
+        self.assertEqual(1, apply_async.call_count)
+
+        jobs.finish_job(self.record_file.pk, DerivativeJob.Kind.PDF)
+        tasks.enqueue(tasks.generate_pdf_derivatives, self.record_file.pk)
+        self.assertEqual(2, apply_async.call_count)
+
+    @patch('archive.thumbnails.generate_thumbnail')
+    def test_duplicate_message_is_dropped(self, generate_thumbnail):
+        tasks.generate_pdf_derivatives(self.record_file.pk)
+        tasks.generate_pdf_derivatives(self.record_file.pk)
+        self.assertEqual(1, generate_thumbnail.call_count)
+        job = self.get_job()
+        self.assertEqual(DerivativeJob.State.DONE, job.state)
+        self.assertEqual(1, job.attempts)
+        self.assertIsNotNone(job.get_duration())
+
+    @patch('archive.thumbnails.generate_thumbnail', side_effect=OSError('broken file'))
+    def test_retries_with_backoff(self, generate_thumbnail):
+        with patch('archive.tasks.send') as send, self.assertLogs('archive.tasks', 'ERROR'):
+            tasks.generate_pdf_derivatives(self.record_file.pk)
+        send.assert_called_once_with(tasks.generate_pdf_derivatives, self.record_file.pk, False,
+                                     countdown=settings.DERIVATIVE_JOB_RETRY_DELAY)
+        job = self.get_job()
+        self.assertEqual(DerivativeJob.State.QUEUED, job.state)
+        self.assertEqual('OSError: broken file', job.error)
+
+        with patch('archive.tasks.send') as send, self.assertLogs('archive.tasks', 'ERROR'):
+            for attempt in range(1, settings.DERIVATIVE_JOB_MAX_ATTEMPTS):
+                tasks.generate_pdf_derivatives(self.record_file.pk)
+        send.assert_called_once_with(tasks.generate_pdf_derivatives, self.record_file.pk, False,
+                                     countdown=2 * settings.DERIVATIVE_JOB_RETRY_DELAY)
+        job = self.get_job()
+        self.assertEqual(settings.DERIVATIVE_JOB_MAX_ATTEMPTS, generate_thumbnail.call_count)
+        self.assertEqual(DerivativeJob.State.FAILED, job.state)
+        self.assertEqual(settings.DERIVATIVE_JOB_MAX_ATTEMPTS, job.attempts)
+        self.assertEqual('OSError: broken file', job.error)
+
+    def test_retry_delay(self):
+        self.assertEqual([60, 120, 240], [jobs.get_retry_delay(attempts) for attempts in [1, 2, 3]])
+
+    @patch('celery.app.task.Task.apply_async')
+    def test_stale_job_is_queued_again(self, apply_async):
+        self.assertTrue(jobs.queue_job(self.record_file.pk, DerivativeJob.Kind.PDF))
+        self.assertTrue(jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.PDF))
+        self.assertFalse(jobs.queue_job(self.record_file.pk, DerivativeJob.Kind.PDF))
+
+        # the worker died while running the job
+        DerivativeJob.objects.update(started_at=timezone.now() - timedelta(
+            seconds=settings.DERIVATIVE_JOB_STALE_AFTER + 1))
+        self.assertTrue(jobs.queue_job(self.record_file.pk, DerivativeJob.Kind.PDF))
+        self.assertEqual(0, self.get_job().attempts)
+
+    def test_stale_after_time_limit_of_kind(self):
+        for kind in [DerivativeJob.Kind.PDF, DerivativeJob.Kind.TRANSCODE]:
+            jobs.queue_job(self.record_file.pk, kind)
+            jobs.claim_job(self.record_file.pk, kind)
+        DerivativeJob.objects.update(started_at=timezone.now() - timedelta(
+            seconds=settings.CELERY_TASK_TIME_LIMIT + jobs.RUNNING_GRACE + 1))
+        # transcoding has a longer time limit
+        self.assertEqual([DerivativeJob.Kind.PDF], list(DerivativeJob.objects.filter(jobs.get_stale())
+                                                        .values_list('kind', flat=True)))
+        self.assertTrue(jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.PDF))
+        self.assertFalse(jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.TRANSCODE))
+
+    def test_redelivered_message_reclaims_job(self):
+        jobs.queue_job(self.record_file.pk, DerivativeJob.Kind.OCR)
+        self.assertTrue(jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.OCR, 'message-1'))
+        self.assertFalse(jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.OCR, 'message-2'))
+        self.assertTrue(jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.OCR, 'message-1'))
+        self.assertEqual(2, self.get_job(DerivativeJob.Kind.OCR).attempts)
+
+    def test_lost_worker_is_retried(self):
+        jobs.queue_job(self.record_file.pk, DerivativeJob.Kind.TRANSCODE)
+        jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.TRANSCODE)
+        # reported by the parent process of the pool
+        with patch('archive.tasks.send') as send, self.assertLogs('archive.tasks', 'ERROR'):
+            task_failure.send(sender=tasks.transcode_video, task_id='message-1', args=[self.record_file.pk, True],
+                              kwargs={}, exception=WorkerLostError('Worker exited prematurely: signal 9 (SIGKILL)'))
+        send.assert_called_once_with(tasks.transcode_video, self.record_file.pk, True,
+                                     countdown=settings.DERIVATIVE_JOB_RETRY_DELAY)
+        job = self.get_job(DerivativeJob.Kind.TRANSCODE)
+        self.assertEqual(DerivativeJob.State.QUEUED, job.state)
+        self.assertIn('WorkerLostError', job.error)
+
+        # other tasks are ignored
+        task_failure.send(sender=tasks.generate_preview, task_id='message-2', args=[self.record_file.pk],
+                          kwargs={}, exception=WorkerLostError())
+
+    @override_settings(OCR_PAGES_PER_TASK=2)
+    def test_ocr_continues_in_next_run(self):
+        with patch('archive.ocr.ocr_record_file', side_effect=[3, 1, 0]) as ocr_record_file, \
+                patch('archive.tasks.send') as send:
+            for run in range(3):
+                tasks.ocr_record_file(self.record_file.pk)
+        self.assertEqual(3, ocr_record_file.call_count)
+        self.assertEqual(2, send.call_count)
+        job = self.get_job(DerivativeJob.Kind.OCR)
+        self.assertEqual(DerivativeJob.State.DONE, job.state)
+        self.assertEqual(1, job.attempts)
+
+    def test_status(self):
+        jobs.queue_job(self.record_file.pk, DerivativeJob.Kind.PDF)
+        jobs.queue_job(self.record_file.pk, DerivativeJob.Kind.TEXT)
+        jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.TEXT)
+        jobs.fail_job(self.record_file.pk, DerivativeJob.Kind.TEXT, 'OSError: /srv/media/letter.pdf')
+        url = reverse('api-record-derivatives', kwargs={'collection_id': self.collection.pk, 'pk': self.record.pk})
+
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertIn('no-cache', response['Cache-Control'])
+        data = response.json()
+        self.assertTrue(data['pending'])
+        self.assertEqual(self.record_file.pk, data['files'][0]['id'])
+        self.assertEqual([('pdf', 'queued'), ('text', 'failed')],
+                         [(job['kind'], job['state']) for job in data['files'][0]['jobs']])
+        self.assertNotIn('error', data['files'][0]['jobs'][1])
+
+        self.client.force_login(User.objects.create_user('editor'))
+        data = self.client.get(url).json()
+        self.assertEqual('OSError: /srv/media/letter.pdf', data['files'][0]['jobs'][1]['error'])
+
+        # a lost job isn't waited for
+        DerivativeJob.objects.filter(kind=DerivativeJob.Kind.PDF).update(queued_at=timezone.now() - timedelta(
+            seconds=settings.DERIVATIVE_JOB_STALE_AFTER + 1))
+        self.assertFalse(self.client.get(url).json()['pending'])
+
+    def test_status_of_transcode(self):
+        jobs.queue_job(self.record_file.pk, DerivativeJob.Kind.TRANSCODE)
+        jobs.claim_job(self.record_file.pk, DerivativeJob.Kind.TRANSCODE)
+        DerivativeJob.objects.update(progress=42)
+        url = reverse('api-record-derivatives', kwargs={'collection_id': self.collection.pk, 'pk': self.record.pk})
+        self.assertEqual(42, self.client.get(url).json()['files'][0]['jobs'][0]['progress'])
+        jobs.finish_job(self.record_file.pk, DerivativeJob.Kind.TRANSCODE)
+        self.assertNotIn('progress', self.client.get(url).json()['files'][0]['jobs'][0])
+
+    def test_status_of_private_record(self):
+        self.record.public = False
+        self.record.save()
+        url = reverse('api-record-derivatives', kwargs={'collection_id': self.collection.pk, 'pk': self.record.pk})
+        self.assertEqual(404, self.client.get(url).status_code)
+
+    def test_record_page_polls_pending_jobs(self):
+        url = reverse('record-detail', kwargs={'collection_id': self.collection.pk, 'pk': self.record.pk})
+        jobs.queue_job(self.record_file.pk, DerivativeJob.Kind.PDF)
+        self.assertContains(self.client.get(url), 'data-status-url')
+        jobs.finish_job(self.record_file.pk, DerivativeJob.Kind.PDF)
+        self.assertNotContains(self.client.get(url), 'data-status-url')
@@ -0,0 +1,87 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from archive.models import Collection, Record, RecordCategory, RecordFile, RecordFilePage
+from archive.search import get_backend
+from archive.text_extraction import split_pages, extract_text, TextExtractionError
+
+
+class SplitPagesTestCase(TestCase):
+    def test_split_pages(self):
+        chunks = ['First pa', 'ge\fSecond page\f', '\fFourth', ' page\f']
+        self.assertEqual(['First page', 'Second page', '', 'Fourth page'], list(split_pages(chunks)))
+
+    def test_split_pages_without_trailing_form_feed(self):
+        self.assertEqual(['One', 'Two'], list(split_pages(['One\fTwo'])))
+
+
+class ExtractTextTestCase(TestCase):
+    def setUp(self):
+        collection = Collection.objects.create(name='Test Collection')
+        category = RecordCategory.objects.create(name='Letters')
+        self.record = Record.objects.create(title='Minutes', collection=collection, category=category)
+        self.record_file = RecordFile.objects.create(record=self.record, file='record_files/minutes.pdf',
+                                                     content_type='application/pdf')
+
+    @patch('archive.text_extraction.iter_pdf_pages')
+    def test_extract_text(self, iter_pdf_pages):
+        iter_pdf_pages.return_value = iter(['Opening of the assembly', '', 'Election of the board'])
+
+        self.assertTrue(extract_text(self.record_file))
+        pages = self.record_file.pages.all()
+        self.assertEqual([1, 2, 3], [page.number for page in pages])
+        self.assertEqual('Election of the board', pages[2].text)
+        self.assertTrue(all(page.source == RecordFilePage.Source.TEXT_LAYER for page in pages))
+        self.record_file.refresh_from_db()
+        self.assertIsNotNone(self.record_file.text_extracted_at)
+
+        results = list(get_backend().search('assembly')[:10])
+        self.assertEqual([self.record], results)
+        self.assertIn('<mark>assembly</mark>', results[0].search_snippet)
+
+    @patch('archive.text_extraction.iter_pdf_pages')
+    def test_extract_text_replaces_pages(self, iter_pdf_pages):
+        iter_pdf_pages.return_value = iter(['Opening of the assembly'])
+        extract_text(self.record_file)
+        iter_pdf_pages.return_value = iter(['Corrected'])
+        extract_text(self.record_file)
+
+        self.assertEqual(['Corrected'], [page.text for page in self.record_file.pages.all()])
+        self.assertEqual(0, get_backend().search('assembly').count())
+
+    @patch('archive.text_extraction.PAGE_BATCH_SIZE', 2)
+    @patch('archive.text_extraction.iter_pdf_pages')
+    def test_extract_text_in_batches(self, iter_pdf_pages):
+        iter_pdf_pages.return_value = iter([f'Page {number}' for number in range(5)])
+        with patch.object(RecordFilePage.objects, 'bulk_create', wraps=RecordFilePage.objects.bulk_create) as create:
+            extract_text(self.record_file)
+        self.assertEqual([2, 2, 1], [len(call.args[0]) for call in create.call_args_list])
+        self.assertEqual(5, self.record_file.pages.count())
+
+    @patch('archive.text_extraction.iter_pdf_pages')
+    def test_failed_extraction_keeps_pages(self, iter_pdf_pages):
+        iter_pdf_pages.return_value = iter(['Opening of the assembly'])
+        extract_text(self.record_file)
+
+        def fail():
+            yield 'Partial'
+            raise TextExtractionError('pdftotext failed')
+        iter_pdf_pages.return_value = fail()
+        with self.assertRaises(TextExtractionError):
+            extract_text(self.record_file)
+        self.assertEqual(['Opening of the assembly'], [page.text for page in self.record_file.pages.all()])
+
+    @patch('archive.text_extraction.iter_pdf_pages')
+    def test_delete_file_removes_text(self, iter_pdf_pages):
+        iter_pdf_pages.return_value = iter(['Opening of the assembly'])
+        extract_text(self.record_file)
+        self.record_file.delete()
+
+        self.assertEqual(0, get_backend().search('assembly').count())
+        self.assertEqual(1, get_backend().search('minutes').count())
+
+    def test_extract_text_skips_non_pdf(self):
+        record_file = RecordFile.objects.create(record=self.record, file='record_files/photo.jpg',
+                                                content_type='image/jpeg')
+        self.assertFalse(extract_text(record_file))
@@ -0,0 +1,255 @@
+import os
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from archive.tasks import render_page_preview
+from archive.models import Collection, Record, RecordCategory, RecordFile
+from archive.templatetags.archive_images import srcset, picture_sources
+from archive.thumbnails import get_page_size, get_render_size, generate_thumbnail, generate_page_preview, \
+    get_page_preview_name, get_image_formats, get_rendition_names
+
+PDF_INFO = {'Pages': 600, 'Page size': '595.276 x 841.89 pts (A4)', 'Page rot': '0'}
+
+
+def get_tiff(frames):
+    buffer = BytesIO()
+    images = [Image.new('RGB', (300, 400), color) for color in ['red', 'green', 'blue'][:frames]]
+    images[0].save(buffer, 'TIFF', save_all=True, append_images=images[1:])
+    return ContentFile(buffer.getvalue(), name='scan.tif')
+
+
+class RenderSizeTestCase(TestCase):
+    def test_page_size(self):
+        self.assertEqual((595.276, 841.89), get_page_size(PDF_INFO))
+        self.assertEqual((841.89, 595.276), get_page_size({**PDF_INFO, 'Page rot': '90'}))
+        self.assertIsNone(get_page_size({'Pages': 1}))
+
+    def test_render_size(self):
+        self.assertEqual((400, 566), get_render_size((595.276, 841.89), (400, 400), cover=True))
+        self.assertEqual((283, 400), get_render_size((595.276, 841.89), (400, 400)))
+
+    def test_render_size_pixel_cap(self):
+        with self.settings(PDF_MAX_PIXELS=10000):
+            width, height = get_render_size((100, 10000), (400, 400), cover=True)
+        self.assertLessEqual(width * height, 10000)
+
+
+class ThumbnailTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.collection = Collection.objects.create(name='Test Collection', public=True)
+        self.category = RecordCategory.objects.create(name='Test Category')
+        self.record = Record.objects.create(title='Test Record', collection=self.collection, category=self.category,
+                                            public=True)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @patch('archive.thumbnails.pdfinfo_from_path', lambda path, timeout: PDF_INFO)
+    @patch('archive.thumbnails.convert_from_path')
+    def test_pdf_thumbnail_first_page(self, convert_from_path):
+        convert_from_path.return_value = [Image.new('RGB', (400, 566))]
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            with open(os.path.join('test_assets', 'sample.pdf'), 'rb') as file:
+                record_file = RecordFile.objects.create(record=self.record, content_type='application/pdf',
+                                                        file=ContentFile(file.read(), name='book.pdf'))
+            # text extraction runs in parallel and finishes first
+            RecordFile.objects.filter(pk=record_file.pk).update(text_extracted_at=timezone.now())
+            generate_thumbnail(record_file)
+
+        kwargs = convert_from_path.call_args.kwargs
+        self.assertEqual((1, 1, 566), (kwargs['first_page'], kwargs['last_page'], kwargs['size']))
+        record_file.refresh_from_db()
+        self.assertEqual(600, record_file.page_count)
+        self.assertTrue(record_file.thumbnail)
+        self.assertIsNotNone(record_file.text_extracted_at)
+
+    def test_tiff_page_previews(self):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            record_file = RecordFile.objects.create(record=self.record, content_type='image/tiff',
+                                                    file=get_tiff(3))
+            generate_thumbnail(record_file)
+            record_file.refresh_from_db()
+            self.assertEqual(3, record_file.page_count)
+            self.assertTrue(record_file.is_paged())
+
+            name = generate_page_preview(record_file, 2)
+            self.assertEqual(get_page_preview_name(record_file, 2), name)
+            with Image.open(os.path.join(self.tmp_dir.name, name)) as image:
+                self.assertEqual('JPEG', image.format)
+                red, green, blue = image.getpixel((10, 10))
+                self.assertGreater(green, red)
+
+            # existing previews are reused
+            with patch('archive.thumbnails.Image.open') as image_open:
+                self.assertEqual(name, generate_page_preview(record_file, 2))
+                image_open.assert_not_called()
+            self.assertIsNone(generate_page_preview(record_file, 4))
+
+    def test_page_view(self):
+        cache.clear()
+        c = Client()
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            record_file = RecordFile.objects.create(record=self.record, content_type='image/tiff',
+                                                    file=get_tiff(2))
+            generate_thumbnail(record_file)
+            kwargs = {'collection_id': self.collection.pk, 'record_id': self.record.pk, 'pk': record_file.pk}
+
+            # the page is rendered in a worker, concurrent requests queue it once
+            with patch('archive.tasks.render_page_preview.apply_async') as apply_async:
+                for i in range(2):
+                    response = c.get(reverse('record-files-page', kwargs={**kwargs, 'number': 2}))
+                    self.assertEqual(202, response.status_code)
+                    self.assertEqual('1', response['Retry-After'])
+            apply_async.assert_called_once_with((record_file.pk, 2), priority=settings.TASK_PRIORITY_INTERACTIVE)
+            render_page_preview(record_file.pk, 2)
+            self.assertEqual([os.path.basename(get_page_preview_name(record_file, 2))],
+                             [name for name in os.listdir(os.path.dirname(os.path.join(
+                                 self.tmp_dir.name, record_file.file.name))) if '_page' in name])
+
+            response = c.get(reverse('record-files-page', kwargs={**kwargs, 'number': 2}))
+            self.assertEqual(302, response.status_code)
+            self.assertTrue(response.url.endswith(get_page_preview_name(record_file, 2)))
+            for number in [0, 3]:
+                response = c.get(reverse('record-files-page', kwargs={**kwargs, 'number': number}))
+                self.assertEqual(404, response.status_code)
+            response = c.get(self.record.get_absolute_url())
+            self.assertContains(response, 'data-page-count="2"')
+
+            self.record.public = False
+            self.record.save()
+            response = c.get(reverse('record-files-page', kwargs={**kwargs, 'number': 1}))
+            self.assertEqual(404, response.status_code)
+            c.force_login(User.objects.create(username='user1', password='password'))
+            response = c.get(reverse('record-files-page', kwargs={**kwargs, 'number': 2}))
+            self.assertEqual(302, response.status_code)
+
+
+class DerivativesTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        collection = Collection.objects.create(name='Test Collection')
+        category = RecordCategory.objects.create(name='Test Category')
+        self.record = Record.objects.create(title='Test Record', collection=collection, category=category)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def create_file(self, name, content_type):
+        with open(os.path.join('test_assets', name), 'rb') as file:
+            return RecordFile.objects.create(record=self.record, content_type=content_type,
+                                             file=ContentFile(file.read(), name=name))
+
+    def test_ladder(self):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            record_file = self.create_file('sample.jpg', 'image/jpeg')
+            with patch('archive.thumbnails.Image.open', wraps=Image.open) as image_open:
+                generate_thumbnail(record_file)
+            self.assertEqual(1, image_open.call_count)
+
+            record_file.refresh_from_db()
+            self.assertEqual((2800, 1867), (record_file.width, record_file.height))
+            self.assertEqual([200, 400, 800, 1600, 2000], [rendition['width'] for rendition in record_file.renditions])
+            self.assertEqual(record_file.renditions[-1]['name'], record_file.preview.name)
+            for rendition in record_file.renditions:
+                with Image.open(os.path.join(self.tmp_dir.name, rendition['name'])) as image:
+                    self.assertEqual((rendition['width'], rendition['height']), image.size)
+            with Image.open(os.path.join(self.tmp_dir.name, record_file.thumbnail.name)) as image:
+                self.assertEqual((400, 400), image.size)
+            with Image.open(os.path.join(self.tmp_dir.name, record_file.renditions[0]['formats']['webp'])) as image:
+                self.assertEqual(('WEBP', 200), (image.format, image.width))
+
+    def test_small_jpeg_reused(self):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            record_file = self.create_file('sample_preview.jpg', 'image/jpeg')
+            generate_thumbnail(record_file)
+            record_file.refresh_from_db()
+            self.assertEqual([(200, False), (400, False), (800, False), (1000, True)],
+                             [(rendition['width'], rendition['name'] == record_file.file.name)
+                              for rendition in record_file.renditions])
+            self.assertEqual(record_file.file.name, record_file.preview.name)
+
+    def test_regenerate(self):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name, IMAGE_RENDITION_WIDTHS=[200, 400]):
+            record_file = self.create_file('sample_preview.jpg', 'image/jpeg')
+            generate_thumbnail(record_file)
+            old_names = [rendition['name'] for rendition in record_file.renditions]
+            generate_thumbnail(record_file)
+            for name in old_names:
+                self.assertFalse(os.path.exists(os.path.join(self.tmp_dir.name, name)))
+            self.assertEqual(2, len(record_file.renditions))
+
+    def test_clean_files_keeps_renditions(self):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name, IMAGE_RENDITION_FORMATS=['webp']):
+            record_file = self.create_file('sample.jpg', 'image/jpeg')
+            generate_thumbnail(record_file)
+            stray = os.path.join(self.tmp_dir.name, 'record_files', 'stray_200w.webp')
+            Image.new('RGB', (10, 10)).save(stray, 'WEBP')
+            call_command('clean_files', stdout=StringIO())
+
+            names = get_rendition_names(record_file.renditions)
+            self.assertEqual(10, len(names))
+            for name in names | {record_file.file.name, record_file.thumbnail.name}:
+                self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, name)), name)
+            self.assertFalse(os.path.exists(stray))
+
+    def test_srcset(self):
+        record_file = RecordFile(renditions=[{'width': 200, 'height': 100, 'name': 'a_200w.jpg'},
+                                             {'width': 800, 'height': 400, 'name': 'a_800w.jpg'}])
+        self.assertEqual('/media/a_200w.jpg 200w, /media/a_800w.jpg 800w', srcset(record_file))
+        self.assertEqual('/media/a_200w.jpg 200w', srcset(record_file, '400'))
+        self.assertEqual('', srcset(None))
+
+    def test_image_formats(self):
+        with self.settings(IMAGE_RENDITION_FORMATS=['webp', 'gif']):
+            self.assertEqual(['webp'], get_image_formats())
+        with self.settings(IMAGE_RENDITION_FORMATS=[]):
+            self.assertEqual([], get_image_formats())
+
+    def test_picture_sources(self):
+        record_file = RecordFile(renditions=[{'width': 200, 'height': 100, 'name': 'a_200w.jpg',
+                                              'formats': {'webp': 'a_200w.webp'}}])
+        self.assertEqual([{'format': 'webp', 'type': 'image/webp', 'srcset': '/media/a_200w.webp 200w'}],
+                         picture_sources(record_file))
+        self.assertEqual([], picture_sources(RecordFile(renditions=[])))
+
+    def test_backfill_formats(self):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name, IMAGE_RENDITION_WIDTHS=[200, 400]):
+            with self.settings(IMAGE_RENDITION_FORMATS=[]):
+                record_file = self.create_file('sample_preview.jpg', 'image/jpeg')
+                generate_thumbnail(record_file)
+            self.assertEqual([{}, {}], [rendition['formats'] for rendition in record_file.renditions])
+            # a file from before renditions existed
+            legacy_file = self.create_file('sample.jpg', 'image/jpeg')
+            with open(os.path.join('test_assets', 'sample_preview.jpg'), 'rb') as file:
+                legacy_file.preview.save('legacy_preview.jpg', file)
+
+            # the originals are not needed
+            os.remove(os.path.join(self.tmp_dir.name, record_file.file.name))
+            os.remove(os.path.join(self.tmp_dir.name, legacy_file.file.name))
+            out = StringIO()
+            call_command('gen_image_formats', workers=1, stdout=out, stderr=out)
+            self.assertIn('Converted 2/2 files', out.getvalue())
+
+            record_file.refresh_from_db()
+            for rendition in record_file.renditions:
+                self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, rendition['formats']['webp'])))
+            legacy_file.refresh_from_db()
+            self.assertEqual([200, 400, 1000], [rendition['width'] for rendition in legacy_file.renditions])
+            self.assertEqual(legacy_file.preview.name, legacy_file.renditions[-1]['name'])
+            # the card grid picks its sources from the small steps
+            for rendition in legacy_file.renditions:
+                self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, rendition['name'])))
+                self.assertTrue(os.path.exists(os.path.join(self.tmp_dir.name, rendition['formats']['webp'])))
+            self.assertIn('200w', picture_sources(legacy_file, 800)[-1]['srcset'])
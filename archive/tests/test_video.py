@@ -0,0 +1,321 @@
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from PIL import Image
+
+from archive import video
+from archive.checks import check_hls_heights
+from archive.models import Collection, DerivativeJob, Record, RecordCategory, RecordFile
+from archive.tasks import transcode_video, generate_storyboard
+from archive.thumbnails import generate_thumbnail
+
+PROBE = {
+    'format': {'format_name': 'mov,mp4,m4a,3gp,3g2,mj2', 'duration': '120.0', 'bit_rate': '6000000',
+               'tags': {'major_brand': 'isom'}},
+    'streams': [
+        {'codec_type': 'video', 'codec_name': 'h264', 'profile': 'High', 'pix_fmt': 'yuv420p', 'width': 1920,
+         'height': 1080, 'field_order': 'progressive'},
+        {'codec_type': 'audio', 'codec_name': 'aac'},
+    ],
+}
+
+
+def get_probe(format_name=None, bit_rate='6000000', **video):
+    probe = {'format': {**PROBE['format'], 'bit_rate': bit_rate}, 'streams': [{**PROBE['streams'][0], **video}]}
+    if format_name:
+        probe['format']['format_name'] = format_name
+    return probe
+
+
+def get_mp4(*box_types):
+    return b''.join((16).to_bytes(4, 'big') + box_type.encode() + bytes(8) for box_type in box_types)
+
+
+def fake_ffmpeg(script):
+    # runs a python script instead of ffmpeg, with the same pipes
+    popen = subprocess.Popen
+    return lambda command, **kwargs: popen([sys.executable, '-c', script], **kwargs)
+
+
+def write_hls(arguments, duration=None, progress=None):
+    # stands in for ffmpeg and writes the files the arguments ask for
+    output = arguments[-1]
+    if output.endswith('.mp4'):
+        open(output, 'wb').close()
+        return
+    if output.endswith('sprite%03d.jpg'):
+        # two sheets for 120 seconds with a frame every second
+        for number in [1, 2]:
+            Image.new('RGB', (1600, 900), 'blue').save(output % number)
+        return
+    if output.endswith('.jpg'):
+        Image.new('RGB', (1280, 720), 'blue').save(output)
+        return
+    stream_map = arguments[arguments.index('-var_stream_map') + 1]
+    for stream in stream_map.split():
+        variant_dir = os.path.join(os.path.dirname(os.path.dirname(output)), stream.split('name:')[1])
+        os.makedirs(variant_dir)
+        open(os.path.join(variant_dir, 'index.m3u8'), 'w').close()
+    open(os.path.join(os.path.dirname(os.path.dirname(output)), video.HLS_MASTER_PLAYLIST), 'w').close()
+    if progress:
+        progress(0.5)
+
+
+class LadderTestCase(TestCase):
+    def test_ladder(self):
+        self.assertEqual([360, 720, 1080], video.get_ladder(2160))
+        self.assertEqual([360, 720], video.get_ladder(1000))
+        self.assertEqual([240], video.get_ladder(241))
+        with self.settings(VIDEO_HLS_HEIGHTS=[240, 480]):
+            self.assertEqual([240, 480], video.get_ladder(720))
+        with self.settings(VIDEO_HLS_HEIGHTS=[500]):
+            self.assertEqual([720], video.get_ladder(721))
+
+    def test_heights_without_bitrate(self):
+        self.assertEqual([], check_hls_heights(None))
+        with self.settings(VIDEO_HLS_HEIGHTS=[360, 500]):
+            self.assertEqual(['archive.W001'], [error.id for error in check_hls_heights(None)])
+        with self.settings(VIDEO_HLS_HEIGHTS=[500]):
+            self.assertEqual(['archive.E002'], [error.id for error in check_hls_heights(None)])
+
+    def test_hls_arguments(self):
+        arguments = video.get_hls_arguments('in.mp4', 'out', [360, 720], has_audio=True)
+        self.assertIn('[0:v:0]split=2[v0][v1];[v0]scale=-2:360[v0out];[v1]scale=-2:720[v1out]', arguments)
+        self.assertEqual('v:0,a:0,name:360p v:1,a:1,name:720p', arguments[arguments.index('-var_stream_map') + 1])
+        self.assertEqual('2800k', arguments[arguments.index('-b:v:1') + 1])
+        self.assertEqual(os.path.join('out', '%v', 'index.m3u8'), arguments[-1])
+
+        arguments = video.get_hls_arguments('in.mp4', 'out', [360], has_audio=False)
+        self.assertNotIn('0:a:0', arguments)
+        self.assertEqual('v:0,name:360p', arguments[arguments.index('-var_stream_map') + 1])
+
+
+class StrategyTestCase(TestCase):
+    def test_strategy(self):
+        self.assertEqual(video.TRANSCODE, video.get_strategy(get_probe()))
+        self.assertEqual(video.REMUX, video.get_strategy(get_probe(height=720)))
+        self.assertEqual(video.TRANSCODE, video.get_strategy(get_probe(height=576, codec_name='mpeg2video')))
+        self.assertEqual(video.TRANSCODE, video.get_strategy(get_probe(height=576, field_order='tt')))
+        self.assertEqual(video.TRANSCODE, video.get_strategy(get_probe(height=720, pix_fmt='yuv422p')))
+        self.assertEqual(video.TRANSCODE, video.get_strategy(get_probe(format_name='avi', height=480)))
+        self.assertEqual(video.TRANSCODE, video.get_strategy(get_probe(height=720, bit_rate='20000000')))
+        self.assertEqual(video.TRANSCODE, video.get_strategy({'format': {}, 'streams': []}))
+
+        info = get_probe(height=480)
+        info['streams'].append({'codec_type': 'audio', 'codec_name': 'pcm_s16le'})
+        self.assertEqual(video.AUDIO, video.get_strategy(info))
+        info['streams'] = info['streams'][:1]
+        self.assertEqual(video.REMUX, video.get_strategy(info))
+
+    def test_copy_arguments(self):
+        arguments = video.get_copy_arguments('in.mov', 'out.mp4', video.REMUX)
+        self.assertEqual(['-i', 'in.mov', '-map', '0:v:0', '-map', '0:a:0?', '-c:v', 'copy', '-c:a', 'copy',
+                          '-movflags', '+faststart', 'out.mp4'], arguments)
+        arguments = video.get_copy_arguments('in.mov', 'out.mp4', video.AUDIO)
+        self.assertEqual('aac', arguments[arguments.index('-c:a') + 1])
+
+    def test_faststart(self):
+        with TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'video.mp4')
+            for boxes, faststart in [(['ftyp', 'moov', 'mdat'], True), (['ftyp', 'free', 'mdat', 'moov'], False),
+                                     (['ftyp'], False)]:
+                with open(path, 'wb') as file:
+                    file.write(get_mp4(*boxes))
+                self.assertEqual(faststart, video.is_faststart(path))
+
+
+class StoryboardTestCase(TestCase):
+    def test_frame_size(self):
+        self.assertEqual((160, 90), video.get_frame_size({'width': 1920, 'height': 1080}))
+        # PAL tape with non-square pixels is shown at 4:3
+        pal = {'width': 720, 'height': 576}
+        self.assertEqual((160, 120), video.get_frame_size({**pal, 'sample_aspect_ratio': '16:15'}))
+        self.assertEqual((160, 128), video.get_frame_size({**pal, 'sample_aspect_ratio': '0:1'}))
+
+    def test_track(self):
+        self.assertEqual('01:02:03.450', video.format_timestamp(3723.45))
+        track = video.get_storyboard_track(102, 1015, 10, (160, 90)).split('\n')
+        self.assertEqual('WEBVTT', track[0])
+        self.assertEqual(['00:00:00.000 --> 00:00:10.000', 'sprite001.jpg#xywh=0,0,160,90'], track[2:4])
+        # the eleventh frame starts the second row, the hundred and first the second sheet
+        self.assertEqual(['00:01:40.000 --> 00:01:50.000', 'sprite001.jpg#xywh=0,90,160,90'], track[32:34])
+        self.assertEqual(['00:16:40.000 --> 00:16:50.000', 'sprite002.jpg#xywh=0,0,160,90'], track[302:304])
+        self.assertEqual(['00:16:50.000 --> 00:16:55.000', 'sprite002.jpg#xywh=160,0,160,90'], track[305:307])
+
+    def test_arguments(self):
+        arguments = video.get_storyboard_arguments('in.mp4', 'out', 10, (160, 90))
+        self.assertEqual(['-skip_frame', 'nokey', '-i', 'in.mp4'], arguments[:4])
+        self.assertIn('fps=1/10,scale=160:90,tile=10x10', arguments)
+
+
+class FFmpegTestCase(TestCase):
+    def test_progress(self):
+        progress = []
+        script = 'print("frame=1\\nout_time_us=30000000\\nout_time_us=60000000\\nprogress=end")'
+        with patch('archive.video.subprocess.Popen', fake_ffmpeg(script)):
+            video.run_ffmpeg(['-i', 'in.mp4', 'out.mp4'], duration=120, progress=progress.append)
+        self.assertEqual([0.25, 0.5, 1.0], progress)
+
+    def test_error(self):
+        script = 'import sys; sys.stderr.write("in.mp4: Invalid data found"); sys.exit(1)'
+        with patch('archive.video.subprocess.Popen', fake_ffmpeg(script)):
+            with self.assertRaisesRegex(video.VideoError, 'exit code 1: in.mp4: Invalid data found'):
+                video.run_ffmpeg(['-i', 'in.mp4', 'out.mp4'])
+
+    def test_timeout(self):
+        with self.settings(VIDEO_TIMEOUT=0.1):
+            with patch('archive.video.subprocess.Popen', fake_ffmpeg('import time; time.sleep(10)')):
+                with self.assertRaises(video.VideoError):
+                    video.run_ffmpeg(['-i', 'in.mp4', 'out.mp4'])
+
+    def test_progress_reporter(self):
+        collection = Collection.objects.create(name='Test Collection')
+        category = RecordCategory.objects.create(name='Test Category')
+        record = Record.objects.create(title='Test Record', collection=collection, category=category)
+        record_file = RecordFile.objects.create(record=record, file='record_files/interview.mp4',
+                                                content_type='video/mp4')
+        job = DerivativeJob.objects.create(record_file=record_file, kind=DerivativeJob.Kind.TRANSCODE)
+        reporter = video.ProgressReporter(record_file.pk)
+        with patch('archive.video.time.monotonic', side_effect=[100, 101, 106]):
+            reporter(0.421)
+            # throttled
+            reporter(0.5)
+            job.refresh_from_db()
+            self.assertEqual(42, job.progress)
+            reporter(0.6)
+        job.refresh_from_db()
+        self.assertEqual(60, job.progress)
+
+
+@patch('archive.video.probe', lambda path: PROBE)
+@patch('archive.video.run_ffmpeg', side_effect=write_hls)
+class TranscodeTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp_dir.name, 'record_files'))
+        open(os.path.join(self.tmp_dir.name, 'record_files', 'interview.mp4'), 'wb').close()
+        collection = Collection.objects.create(name='Test Collection', public=True)
+        category = RecordCategory.objects.create(name='Oral history')
+        self.record = Record.objects.create(title='Interview', collection=collection, category=category, public=True)
+        self.record_file = RecordFile.objects.create(record=self.record, file='record_files/interview.mp4',
+                                                     content_type='video/mp4')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_transcode(self, run_ffmpeg):
+        progress = []
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            video.generate_video_preview(self.record_file, progress.append)
+        self.assertEqual([0.5], progress)
+
+        self.record_file.refresh_from_db()
+        self.assertEqual('record_files/interview_hls/master.m3u8', self.record_file.hls_playlist)
+        self.assertEqual('record_files/interview_preview.mp4', self.record_file.preview.name)
+        self.assertEqual(['interview.mp4', 'interview_hls', 'interview_preview.mp4'],
+                         sorted(os.listdir(os.path.join(self.tmp_dir.name, 'record_files'))))
+        self.assertEqual(['1080p', '360p', '720p', 'master.m3u8'],
+                         sorted(os.listdir(os.path.join(self.tmp_dir.name, 'record_files', 'interview_hls'))))
+        # the preview is copied from the 720p step
+        remux = run_ffmpeg.call_args_list[-1][0][0]
+        self.assertEqual(os.path.join(self.tmp_dir.name, 'record_files/interview_hls/720p/index.m3u8'), remux[1])
+        self.assertIn('copy', remux)
+
+    def test_inspect(self, run_ffmpeg):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            video.inspect(self.record_file)
+        self.record_file.refresh_from_db()
+        self.assertEqual((1920, 1080, 'h264', 'aac'), (self.record_file.width, self.record_file.height,
+                                                     self.record_file.video_codec, self.record_file.audio_codec))
+        self.assertEqual((120.0, 6000000), (self.record_file.duration, self.record_file.bitrate))
+
+    def test_remux(self, run_ffmpeg):
+        with patch('archive.video.probe', lambda path: get_probe(height=720)):
+            with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+                self.assertEqual(video.REMUX, video.generate_video_preview(self.record_file))
+        self.assertEqual('copy', run_ffmpeg.call_args[0][0][run_ffmpeg.call_args[0][0].index('-c:v') + 1])
+        self.record_file.refresh_from_db()
+        self.assertEqual('record_files/interview_preview.mp4', self.record_file.preview.name)
+        self.assertEqual('', self.record_file.hls_playlist)
+
+    def test_faststart_original(self, run_ffmpeg):
+        with open(os.path.join(self.tmp_dir.name, 'record_files', 'interview.mp4'), 'wb') as file:
+            file.write(get_mp4('ftyp', 'moov', 'mdat'))
+        with patch('archive.video.probe', lambda path: get_probe(height=720)):
+            with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+                video.generate_video_preview(self.record_file)
+        run_ffmpeg.assert_not_called()
+        self.assertEqual('record_files/interview.mp4', self.record_file.preview.name)
+
+    def test_faststart_quicktime(self, run_ffmpeg):
+        # QuickTime files with web streams are copied into an MP4 instead of being served as the preview
+        with open(os.path.join(self.tmp_dir.name, 'record_files', 'interview.mp4'), 'wb') as file:
+            file.write(get_mp4('ftyp', 'moov', 'mdat'))
+        info = get_probe(height=720)
+        info['format']['tags'] = {'major_brand': 'qt  '}
+        with patch('archive.video.probe', lambda path: info):
+            with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+                self.assertEqual(video.REMUX, video.generate_video_preview(self.record_file))
+        self.assertEqual('record_files/interview_preview.mp4', self.record_file.preview.name)
+
+    def test_poster(self, run_ffmpeg):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            generate_thumbnail(self.record_file)
+        # seeks to a tenth of the duration
+        self.assertEqual(['-ss', '12.000'], run_ffmpeg.call_args[0][0][:2])
+        self.record_file.refresh_from_db()
+        self.assertEqual('record_files/interview_poster.jpg', self.record_file.poster.name)
+        with Image.open(os.path.join(self.tmp_dir.name, self.record_file.thumbnail.name)) as thumbnail:
+            self.assertEqual((400, 400), thumbnail.size)
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            call_command('clean_files')
+        self.assertIn('interview_poster.jpg', os.listdir(os.path.join(self.tmp_dir.name, 'record_files')))
+
+    def test_storyboard(self, run_ffmpeg):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name, VIDEO_STORYBOARD_INTERVAL=1):
+            generate_storyboard(self.record_file.pk)
+            call_command('clean_files')
+        self.record_file.refresh_from_db()
+        self.assertEqual('record_files/interview_storyboard/thumbnails.vtt', self.record_file.storyboard)
+        storyboard_dir = os.path.join(self.tmp_dir.name, 'record_files', 'interview_storyboard')
+        self.assertEqual(['sprite001.jpg', 'sprite002.jpg', 'thumbnails.vtt'], sorted(os.listdir(storyboard_dir)))
+        with open(os.path.join(storyboard_dir, 'thumbnails.vtt')) as file:
+            track = file.read().split('\n')
+        self.assertEqual(['00:01:59.000 --> 00:02:00.000', 'sprite002.jpg#xywh=1440,90,160,90'], track[-3:-1])
+
+        response = Client().get(reverse('record-detail', kwargs={'collection_id': self.record.collection_id,
+                                                                 'pk': self.record.pk}))
+        self.assertContains(response, 'data-storyboard="/media/record_files/interview_storyboard/thumbnails.vtt"')
+
+        self.record_file.storyboard = ''
+        self.record_file.save()
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            call_command('clean_files')
+        self.assertFalse(os.path.exists(storyboard_dir))
+
+    def test_failed_transcode(self, run_ffmpeg):
+        run_ffmpeg.side_effect = video.VideoError('ffmpeg failed')
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name), patch('archive.tasks.send'), \
+                self.assertLogs('archive.tasks', 'ERROR'):
+            transcode_video(self.record_file.pk)
+        job = self.record_file.jobs.get(kind=DerivativeJob.Kind.TRANSCODE)
+        self.assertEqual('VideoError: ffmpeg failed', job.error)
+        self.assertEqual(['interview.mp4'], os.listdir(os.path.join(self.tmp_dir.name, 'record_files')))
+        self.assertIsNone(job.progress)
+
+    def test_player(self, run_ffmpeg):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            generate_thumbnail(self.record_file)
+            transcode_video(self.record_file.pk)
+        response = Client().get(reverse('record-detail', kwargs={'collection_id': self.record.collection_id,
+                                                                 'pk': self.record.pk}))
+        self.assertContains(response, '<source src="/media/record_files/interview_hls/master.m3u8"')
+        self.assertContains(response, '<source src="/media/record_files/interview_preview.mp4" type="video/mp4">')
+        self.assertContains(response, 'data-hls-url="/media/record_files/interview_hls/master.m3u8"')
+        self.assertContains(response, 'poster="/media/record_files/interview_poster.jpg"')
@@ -1,12 +1,19 @@
+import csv
+import io
 import os
+import zipfile
 from tempfile import TemporaryDirectory
 
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.core.files import File
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth.models import User, Permission
 from django.urls import reverse
-from archive.models import Collection, Record, RecordCategory, RecordFile
+from archive.models import Collection, Record, RecordCategory, RecordFile, RecordTag
 
 TEST_ASSETS_DIR = 'test_assets'
 
@@ -68,6 +75,108 @@ class CollectionViewTestCase(TestCase):
         self.assertIn(public_record, response.context['record_filter'].qs)
         self.assertIn(private_record, response.context['record_filter'].qs)
 
+    def test_get_collection_constant_queries(self):
+        category = RecordCategory.objects.create(name='Test Category')
+
+        def create_records(count):
+            for i in range(count):
+                record = Record.objects.create(title=f'Record {i}', collection=self.public_collection,
+                                               category=category, public=True)
+                RecordFile.objects.create(record=record, file=f'record_files/{i}.jpg', content_type='image/jpeg',
+                                          thumbnail=f'record_files/{i}_thumb.jpg')
+                RecordFile.objects.create(record=record, file=f'record_files/{i}.mp4', content_type='video/mp4')
+
+        url = reverse('collection-detail', kwargs={'pk': self.public_collection.pk})
+        create_records(2)
+        with CaptureQueriesContext(connection) as few_records:
+            self.c.get(url)
+        create_records(10)
+        with CaptureQueriesContext(connection) as many_records:
+            response = self.c.get(url)
+        self.assertEqual(len(few_records), len(many_records))
+        self.assertContains(response, 'record_files/9_thumb.jpg')
+
+    def test_get_collection_card_fragments(self):
+        category = RecordCategory.objects.create(name='Test Category')
+        record = Record.objects.create(title='Card Record', collection=self.public_collection, category=category,
+                                       public=True)
+        record_file = RecordFile.objects.create(record=record, file='record_files/card.jpg', content_type='image/jpeg')
+        url = reverse('collection-detail', kwargs={'pk': self.public_collection.pk})
+        self.assertNotContains(self.c.get(url), 'record_files/card_thumb.jpg')
+
+        record_file.thumbnail = 'record_files/card_thumb.jpg'
+        record_file.save()
+        self.assertContains(self.c.get(url), 'record_files/card_thumb.jpg')
+
+        record.title = 'Renamed Record'
+        record.save()
+        self.assertContains(self.c.get(url), 'Renamed Record')
+
+    def test_get_collection_not_modified(self):
+        category = RecordCategory.objects.create(name='Test Category')
+        record = Record.objects.create(title='Record', collection=self.public_collection, category=category,
+                                       public=True)
+        url = reverse('collection-detail', kwargs={'pk': self.public_collection.pk})
+        response = self.c.get(url)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.c.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(304, response.status_code)
+        self.assertNotEqual(304, self.c.get(url, data={'sort': 'title'}, HTTP_IF_NONE_MATCH=response['ETag'])
+                            .status_code)
+
+        record.title = 'Renamed Record'
+        record.save()
+        self.assertEqual(200, self.c.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+
+    def test_get_collection_not_modified_per_user(self):
+        url = reverse('collection-detail', kwargs={'pk': self.public_collection.pk})
+        etag = self.c.get(url)['ETag']
+        self.c.force_login(self.user1)
+        self.assertEqual(200, self.c.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_get_collection_list_not_modified(self):
+        url = reverse('collection-list')
+        response = self.c.get(url)
+        self.assertEqual(304, self.c.get(url, HTTP_IF_NONE_MATCH=response['ETag'],
+                                         HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code)
+        # Last-Modified doesn't advance when a collection is deleted or hidden, so it isn't validated on its own
+        self.assertEqual(200, self.c.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code)
+
+        self.public_collection.name = 'Renamed Collection'
+        self.public_collection.save()
+        response = self.c.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(200, response.status_code)
+
+        self.public_collection.public = False
+        self.public_collection.save()
+        self.assertEqual(200, self.c.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+
+    def test_get_collection_paginated(self):
+        category = RecordCategory.objects.create(name='Test Category')
+        records = [Record.objects.create(title=f'Record {i}', collection=self.public_collection, category=category,
+                                         public=True) for i in range(5)]
+        url = reverse('collection-detail', kwargs={'pk': self.public_collection.pk})
+
+        with self.settings(RECORDS_PER_PAGE=2):
+            response = self.c.get(url, data={'sort': '-title'})
+            self.assertEqual(records[4:2:-1], list(response.context['page']))
+            self.assertIn('next_query', response.context)
+
+            response = self.c.get(reverse('collection-records', kwargs={'pk': self.public_collection.pk}) +
+                                  '?' + response.context['next_query'])
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(records[2:0:-1], list(response.context['page']))
+            self.assertContains(response, 'Record 2')
+            self.assertNotContains(response, 'Test Collection')
+            self.assertIn('X-Next-Query', response)
+
+    def test_get_collection_invalid_cursor(self):
+        response = self.c.get(reverse('collection-detail', kwargs={'pk': self.public_collection.pk}),
+                              data={'cursor': '!!'})
+        self.assertEqual(400, response.status_code)
+
     def test_get_private_collection(self):
         self.c.force_login(self.user1)
         response = self.c.get(reverse('collection-detail', kwargs={'pk': self.private_collection.pk}))
@@ -320,6 +429,46 @@ class RecordViewTestCase(TestCase):
         self.assertEqual(200, response.status_code)
         self.assertEqual(self.record, response.context['record'])
 
+    def test_get_record_cached_fragments(self):
+        RecordFile.objects.create(record=self.record, file='record_files/letter.pdf', content_type='application/pdf')
+        self.record.tags.add(RecordTag.objects.create(name='Letter'))
+        url = reverse('record-detail', kwargs={'collection_id': self.collection.id, 'pk': self.record.id})
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as uncached:
+            first = self.c.get(url)
+        with CaptureQueriesContext(connection) as cached:
+            second = self.c.get(url)
+        self.assertLess(len(cached), len(uncached))
+        self.assertEqual(first.content, second.content)
+
+    def test_get_record_not_modified(self):
+        url = reverse('record-detail', kwargs={'collection_id': self.collection.id, 'pk': self.record.id})
+        etag = self.c.get(url)['ETag']
+        self.assertEqual(304, self.c.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        RecordFile.objects.create(record=self.record, file='record_files/letter.pdf', content_type='application/pdf')
+        self.assertEqual(200, self.c.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_get_record_fragments_after_add_tag(self):
+        url = reverse('record-detail', kwargs={'collection_id': self.collection.id, 'pk': self.record.id})
+        self.c.force_login(self.user1)
+        self.c.get(url)
+
+        self.c.post(reverse('record-add-tag', kwargs={'collection_id': self.collection.id, 'pk': self.record.id}),
+                    {'tag': 'Fresh Tag'})
+        self.assertContains(self.c.get(url), '<span>fresh tag</span>')
+
+    def test_get_record_fragments_after_file_change(self):
+        url = reverse('record-detail', kwargs={'collection_id': self.collection.id, 'pk': self.record.id})
+        self.c.get(url)
+
+        record_file = RecordFile.objects.create(record=self.record, file='record_files/letter.pdf',
+                                                content_type='application/pdf')
+        self.assertContains(self.c.get(url), 'letter.pdf')
+        record_file.delete()
+        self.assertNotContains(self.c.get(url), 'letter.pdf')
+
     def test_get_not_existing_record(self):
         response = self.c.get(reverse('record-detail', kwargs={'collection_id': self.collection.id,
                                                                'pk': 42}))
@@ -552,6 +701,24 @@ class RecordFileViewTestCase(TestCase):
 
         file.close()
 
+    def test_create_file_quota(self):
+        file = open(os.path.join(TEST_ASSETS_DIR, 'sample.jpg'), 'rb')
+        content = file.read()
+        file.close()
+        url = reverse('record-files-add', kwargs={'collection_id': self.collection.id, 'record_id': self.record.id})
+        self.collection.storage_quota_bytes = self.collection.bytes_total + len(content) + 10
+        self.collection.save()
+
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            self.c.force_login(self.user1)
+            response = self.c.post(url, {'file': SimpleUploadedFile('first.jpg', content, content_type='image/jpeg')})
+            self.assertEqual(302, response.status_code)
+            self.assertEqual(len(content), RecordFile.objects.last().size_bytes)
+
+            response = self.c.post(url, {'file': SimpleUploadedFile('second.jpg', content, content_type='image/jpeg')})
+            self.assertEqual(413, response.status_code)
+            self.assertFalse(RecordFile.objects.filter(file__endswith='second.jpg').exists())
+
     def test_create_file_no_permission(self):
         file = open(os.path.join(TEST_ASSETS_DIR, 'sample.jpg'), 'rb')
         upload_file = SimpleUploadedFile('upload_test.jpg', file.read(), content_type='image/jpeg')
@@ -613,7 +780,7 @@ class SearchViewTestCase(TestCase):
     def setUp(self):
         self.public_collection = Collection.objects.create(name='Public Collection', public=True)
         self.private_collection = Collection.objects.create(name='Private Collection', public=False)
-        self.category = RecordCategory.objects.create(name='Test Category')
+        self.category = RecordCategory.objects.create(name='Letters')
         self.record1 = Record.objects.create(title='Test Record 1', category=self.category,
                                              collection=self.public_collection, public=True)
         self.record2 = Record.objects.create(title='Test Record 2', category=self.category,
@@ -653,3 +820,131 @@ class SearchViewTestCase(TestCase):
         response = self.c.get(reverse('search'), data={'q': q})
         self.assertIn('error', response.context)
         self.assertNotIn('records', response.context)
+
+    def test_search_metadata(self):
+        tag = RecordTag.objects.create(name='harbour')
+        self.record5.tags.add(tag)
+        self.record5.physical_signature = 'XB-1234'
+        self.record5.save()
+
+        response = self.c.get(reverse('search'), data={'q': 'harb'})
+        self.assertEqual([self.record5], list(response.context['records']))
+        response = self.c.get(reverse('search'), data={'q': 'xb 1234'})
+        self.assertEqual([self.record5], list(response.context['records']))
+        response = self.c.get(reverse('search'), data={'q': 'letters'})
+        self.assertEqual(3, len(response.context['records']))
+
+    def test_search_ranking_and_snippet(self):
+        response = self.c.get(reverse('search'), data={'q': 'test'})
+        records = list(response.context['records'])
+        self.assertEqual(self.record1, records[0])
+        self.assertIn('<mark>Test</mark>', records[-1].search_snippet)
+
+    def test_search_paginated(self):
+        with self.settings(SEARCH_RESULTS_PER_PAGE=1):
+            response = self.c.get(reverse('search'), data={'q': 'test', 'page': 2})
+        self.assertEqual(2, response.context['records'].number)
+        self.assertEqual(1, len(response.context['records']))
+        self.assertEqual(2, response.context['records'].paginator.count)
+
+    def test_search_index_updated(self):
+        self.record5.title = 'Renamed Record'
+        self.record5.save()
+        response = self.c.get(reverse('search'), data={'q': 'renamed'})
+        self.assertIn(self.record5, response.context['records'])
+
+        self.record5.delete()
+        response = self.c.get(reverse('search'), data={'q': 'renamed'})
+        self.assertEqual(0, len(response.context['records']))
+
+    def test_search_not_modified(self):
+        url = reverse('search')
+        etag = self.c.get(url, data={'q': 'test'})['ETag']
+        self.assertEqual(304, self.c.get(url, data={'q': 'test'}, HTTP_IF_NONE_MATCH=etag).status_code)
+        self.assertEqual(200, self.c.get(url, data={'q': 'example'}, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        self.record1.tags.add(RecordTag.objects.create(name='Tag'))
+        self.assertEqual(200, self.c.get(url, data={'q': 'test'}, HTTP_IF_NONE_MATCH=etag).status_code)
+
+
+class DownloadViewTestCase(TestCase):
+    def setUp(self):
+        self.collection = Collection.objects.create(name='Test Collection', public=True)
+        self.category = RecordCategory.objects.create(name='Test Category')
+        self.user = User.objects.create(username='user1', password='password')
+        self.public_record = Record.objects.create(title='Public Record', collection=self.collection,
+                                                   category=self.category, public=True)
+        self.private_record = Record.objects.create(title='Private Record', collection=self.collection,
+                                                    category=self.category)
+        self.tmp_dir = TemporaryDirectory()
+
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            with open(os.path.join(TEST_ASSETS_DIR, 'sample.jpg'), 'rb') as file:
+                self.image = file.read()
+            RecordFile.objects.create(record=self.public_record, file=ContentFile(self.image, name='sample.jpg'),
+                                      content_type='image/jpeg')
+            RecordFile.objects.create(record=self.public_record, file=ContentFile(b'note ' * 100, name='note.txt'),
+                                      content_type='text/plain')
+            RecordFile.objects.create(record=self.private_record, file=ContentFile(b'secret', name='secret.txt'),
+                                      content_type='text/plain')
+
+        self.c = Client()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_zip(self, url):
+        with self.settings(MEDIA_ROOT=self.tmp_dir.name):
+            response = self.c.get(url)
+            self.assertEqual(200, response.status_code)
+            self.assertTrue(response.streaming)
+            self.assertEqual('application/zip', response['Content-Type'])
+            return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_download_collection(self):
+        self.c.force_login(self.user)
+        archive = self.get_zip(reverse('collection-download', kwargs={'pk': self.collection.pk}))
+
+        names = archive.namelist()
+        self.assertEqual('metadata.csv', names[0])
+        self.assertEqual(4, len(names))
+        image = archive.getinfo(f'{self.public_record.pk}-public-record/sample.jpg')
+        self.assertEqual(zipfile.ZIP_STORED, image.compress_type)
+        self.assertEqual(self.image, archive.read(image))
+        note = archive.getinfo(f'{self.public_record.pk}-public-record/note.txt')
+        self.assertEqual(zipfile.ZIP_DEFLATED, note.compress_type)
+        self.assertEqual(b'note ' * 100, archive.read(note))
+
+        rows = list(csv.DictReader(io.StringIO(archive.read('metadata.csv').decode())))
+        self.assertEqual(['Public Record', 'Private Record'], [row['title'] for row in rows])
+        self.assertEqual(f'{self.public_record.pk}-public-record/sample.jpg;'
+                         f'{self.public_record.pk}-public-record/note.txt', rows[0]['files'])
+
+    def test_download_collection_anonymous(self):
+        archive = self.get_zip(reverse('collection-download', kwargs={'pk': self.collection.pk}))
+
+        self.assertEqual(3, len(archive.namelist()))
+        self.assertNotIn(f'{self.private_record.pk}-private-record/secret.txt', archive.namelist())
+
+        self.collection.public = False
+        self.collection.save()
+        response = self.c.get(reverse('collection-download', kwargs={'pk': self.collection.pk}))
+        self.assertEqual(404, response.status_code)
+
+    def test_download_record(self):
+        url = reverse('record-download', kwargs={'collection_id': self.collection.pk, 'pk': self.private_record.pk})
+        response = self.c.get(url)
+        self.assertEqual(404, response.status_code)
+
+        self.c.force_login(self.user)
+        archive = self.get_zip(url)
+        self.assertEqual(['metadata.csv', f'{self.private_record.pk}-private-record/secret.txt'], archive.namelist())
+        self.assertEqual(b'secret', archive.read(f'{self.private_record.pk}-private-record/secret.txt'))
+
+    def test_download_missing_file(self):
+        self.c.force_login(self.user)
+        os.remove(os.path.join(self.tmp_dir.name, RecordFile.objects.get(record=self.private_record).file.name))
+        with self.assertLogs('archive.downloads', 'WARNING'):
+            archive = self.get_zip(reverse('collection-download', kwargs={'pk': self.collection.pk}))
+        self.assertEqual(3, len(archive.namelist()))
+        self.assertIsNone(archive.testzip())
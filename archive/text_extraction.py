@@ -0,0 +1,74 @@
+import io
+import os
+import subprocess
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from archive.models import RecordFilePage
+from archive import search
+
+READ_SIZE = 64 * 1024
+PAGE_BATCH_SIZE = 100
+
+
+class TextExtractionError(Exception):
+    pass
+
+
+def split_pages(chunks):
+    # pdftotext terminates every page with a form feed
+    page = []
+    for chunk in chunks:
+        parts = chunk.split('\f')
+        for part in parts[:-1]:
+            page.append(part)
+            yield ''.join(page).strip()
+            page = []
+        page.append(parts[-1])
+    rest = ''.join(page).strip()
+    if rest:
+        yield rest
+
+
+def iter_pdf_pages(path, timeout=None):
+    process = subprocess.Popen(['pdftotext', '-enc', 'UTF-8', path, '-'], stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    timer = threading.Timer(timeout or settings.TEXT_EXTRACTION_TIMEOUT, process.kill)
+    timer.start()
+    try:
+        reader = io.TextIOWrapper(process.stdout, encoding='utf-8', errors='replace')
+        yield from split_pages(iter(lambda: reader.read(READ_SIZE), ''))
+    finally:
+        timer.cancel()
+        process.stdout.close()
+        return_code = process.wait()
+
+    if return_code != 0:
+        raise TextExtractionError(f'pdftotext failed for {path} with exit code {return_code}')
+
+
+def extract_text(record_file):
+    if not record_file.is_pdf():
+        return False
+
+    path = os.path.join(settings.MEDIA_ROOT, record_file.file.name)
+    # pages are written in batches as pdftotext produces them, so memory is bounded by one batch; a failed
+    # extraction rolls back and keeps the previous pages
+    with transaction.atomic():
+        record_file.pages.filter(source=RecordFilePage.Source.TEXT_LAYER).delete()
+        batch = []
+        for number, text in enumerate(iter_pdf_pages(path), start=1):
+            batch.append(RecordFilePage(record_file=record_file, number=number, text=text,
+                                        source=RecordFilePage.Source.TEXT_LAYER))
+            if len(batch) >= PAGE_BATCH_SIZE:
+                RecordFilePage.objects.bulk_create(batch)
+                batch = []
+        RecordFilePage.objects.bulk_create(batch)
+        record_file.text_extracted_at = timezone.now()
+        record_file.save(update_fields=['text_extracted_at'])
+
+    search.index_records([record_file.record])
+    return True
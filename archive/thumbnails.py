@@ -1,15 +1,26 @@
+import logging
+import math
 import os
-import subprocess
+import re
 from io import BytesIO
 from django.conf import settings
 from django.core.files import File
+from django.core.files.storage import default_storage
 
 from PIL import Image
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from archive import video
+from archive.signatures import get_signature
 
 IMAGE_EXTS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff']
 THUMB_SIZE = (400, 400)
 PREVIEW_SIZE = (2000, 2000)
+PAGE_PREVIEW_PATTERN = re.compile(r'_page(\d+)\.jpg$')
+# formats which can be emitted next to the JPEG renditions, in order of preference
+IMAGE_FORMAT_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+logger = logging.getLogger(__name__)
 
 
 def crop_image(image):
@@ -24,6 +35,188 @@ def crop_image(image):
     return image
 
 
+def get_pdf_info(path):
+    return pdfinfo_from_path(path, timeout=settings.PDF_RENDER_TIMEOUT)
+
+
+def get_page_size(info):
+    # size of the first page in points, e.g. 'Page size: 595.276 x 841.89 pts (A4)'
+    match = re.match(r'([\d.]+) x ([\d.]+) pts', info.get('Page size', ''))
+    if not match:
+        return None
+    width, height = float(match[1]), float(match[2])
+    if info.get('Page rot', '0') in ['90', '270']:
+        width, height = height, width
+    return width, height
+
+
+def get_render_size(page_size, target_size, cover=False):
+    # just enough pixels to fit (or, for cropped thumbnails, cover) the target size, and never more than
+    # PDF_MAX_PIXELS, instead of a fixed DPI that rasterizes a poster page into hundreds of megabytes
+    width, height = page_size
+    scale = (max if cover else min)(target_size[0] / width, target_size[1] / height)
+    scale = min(scale, math.sqrt(settings.PDF_MAX_PIXELS / (width * height)))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def render_pdf_page(path, number, target_size, cover=False, info=None):
+    info = info or get_pdf_info(path)
+    page_size = get_page_size(info)
+    render_size = get_render_size(page_size, target_size, cover) if page_size else target_size
+    # only the requested page is rendered; the longer side is scaled to the computed size, so pages with another
+    # size than the first one keep their aspect ratio
+    images = convert_from_path(path, first_page=number, last_page=number, size=max(render_size),
+                               timeout=settings.PDF_RENDER_TIMEOUT)
+    return images[0] if images else None
+
+
+def get_page_preview_name(record_file, number):
+    name, ext = os.path.splitext(record_file.file.name)
+    return f'{name}_page{number}.jpg'
+
+
+def generate_page_preview(record_file, number):
+    # page previews are rendered in the background on first request and kept next to the original
+    preview_name = get_page_preview_name(record_file, number)
+    if default_storage.exists(preview_name):
+        return preview_name
+
+    path = os.path.join(settings.MEDIA_ROOT, record_file.file.name)
+    if record_file.is_pdf():
+        image = render_pdf_page(path, number, PREVIEW_SIZE)
+        if image is None:
+            return None
+    else:
+        with Image.open(path) as source:
+            try:
+                source.seek(number - 1)
+            except EOFError:
+                return None
+            image = source.convert('RGB')
+    image.thumbnail(PREVIEW_SIZE)
+
+    # written under its fixed name, a concurrent render of the same page replaces it instead of adding a copy
+    preview_path = os.path.join(settings.MEDIA_ROOT, preview_name)
+    partial = f'{preview_path}.{os.getpid()}.part'
+    image.save(partial, 'JPEG')
+    os.replace(partial, preview_path)
+    return preview_name
+
+
+def fit_image(image, size):
+    # thumbnail() reduces in integer steps before resampling, which is much faster than a plain resize
+    scaled = image.copy()
+    scaled.thumbnail((size, size))
+    return scaled
+
+
+def get_image_formats():
+    # the configured formats the installed Pillow can write, AVIF needs Pillow 11.2 or newer
+    Image.init()
+    return [image_format for image_format in IMAGE_FORMAT_TYPES
+            if image_format in settings.IMAGE_RENDITION_FORMATS and image_format.upper() in Image.SAVE]
+
+
+def save_image(image, name, image_format='jpeg'):
+    out_buffer = BytesIO()
+    image.save(out_buffer, image_format.upper())
+    return default_storage.save(name, File(out_buffer))
+
+
+def save_formats(image, name, image_formats):
+    return {image_format: save_image(image, f'{name}.{image_format}', image_format) for image_format in image_formats}
+
+
+def get_rendition_names(renditions):
+    return {name for rendition in renditions for name in [rendition['name'], *rendition.get('formats', {}).values()]}
+
+
+def get_thumbnail_signature():
+    return get_signature(THUMB_SIZE)
+
+
+def get_image_preview_signature():
+    # formats are added to existing renditions by gen_image_formats without decoding the originals again
+    return get_signature(sorted(set(settings.IMAGE_RENDITION_WIDTHS)))
+
+
+def generate_derivatives(model):
+    # thumbnail, preview and the rendition ladder of an image, all from a single decode of the original
+    file = model.file
+    name, ext = os.path.splitext(file.name)
+    widths = sorted(set(settings.IMAGE_RENDITION_WIDTHS), reverse=True)
+    image_formats = get_image_formats()
+
+    with Image.open(os.path.join(settings.MEDIA_ROOT, file.name)) as source:
+        model.width, model.height = source.size
+        model.page_count = getattr(source, 'n_frames', 1)
+        # JPEGs are decoded at the smallest DCT scale that still covers the largest rendition
+        source.draft('RGB', (widths[0], widths[0]))
+        # small JPEGs that browsers can show are served as they are instead of being encoded again
+        reusable = source.format == 'JPEG' and source.mode in ['RGB', 'L']
+        image = source.convert('RGB')
+
+    renditions = []
+    thumbnail_source = image
+    for width in widths:
+        if max(image.size) > width:
+            image = fit_image(image, width)
+        elif renditions:
+            # smaller than this step already, the full size rendition exists
+            continue
+        if reusable and image.size == (model.width, model.height):
+            rendition_name = file.name
+        else:
+            rendition_name = save_image(image, f'{name}_{image.width}w.jpg')
+        renditions.append({'width': image.width, 'height': image.height, 'name': rendition_name,
+                           'formats': save_formats(image, f'{name}_{image.width}w', image_formats)})
+        if min(image.size) >= THUMB_SIZE[0]:
+            thumbnail_source = image
+
+    old_names = get_rendition_names(model.renditions) - {file.name}
+    model.renditions = sorted(renditions, key=lambda rendition: rendition['width'])
+    model.preview = renditions[0]['name']
+    out_buffer = BytesIO()
+    fit_image(crop_image(thumbnail_source), THUMB_SIZE[0]).save(out_buffer, 'JPEG')
+    model.thumbnail = File(out_buffer, name=f'{name}_thumb.jpg')
+    model.thumbnail_signature = get_thumbnail_signature()
+    model.preview_signature = get_image_preview_signature()
+    model.save(update_fields=['width', 'height', 'page_count', 'renditions', 'preview', 'thumbnail',
+                              'thumbnail_signature', 'preview_signature', 'updated_at'])
+
+    for old_name in old_names - get_rendition_names(renditions):
+        default_storage.delete(old_name)
+
+
+def add_image_formats(renditions, preview_name=None):
+    # encodes the missing formats from the JPEG renditions, the originals are not decoded again; files from before
+    # renditions existed get their preview and the smaller steps of the ladder scaled down from it
+    image_formats = get_image_formats()
+    if not renditions and preview_name:
+        with Image.open(os.path.join(settings.MEDIA_ROOT, preview_name)) as source:
+            image = source.convert('RGB')
+        renditions = [{'width': image.width, 'height': image.height, 'name': preview_name}]
+        name, ext = os.path.splitext(preview_name)
+        for width in sorted(set(settings.IMAGE_RENDITION_WIDTHS), reverse=True):
+            if max(image.size) > width:
+                image = fit_image(image, width)
+                renditions.append({'width': image.width, 'height': image.height,
+                                   'name': save_image(image, f'{name}_{image.width}w.jpg'),
+                                   'formats': save_formats(image, f'{name}_{image.width}w', image_formats)})
+        renditions.sort(key=lambda rendition: rendition['width'])
+
+    updated = []
+    for rendition in renditions:
+        formats = dict(rendition.get('formats', {}))
+        missing = [image_format for image_format in image_formats if image_format not in formats]
+        if missing:
+            name, ext = os.path.splitext(rendition['name'])
+            with Image.open(os.path.join(settings.MEDIA_ROOT, rendition['name'])) as image:
+                formats.update(save_formats(image.convert('RGB'), name, missing))
+        updated.append({**rendition, 'formats': formats})
+    return updated
+
+
 def generate_thumbnail(model):
     if not hasattr(model, 'file') or not hasattr(model, 'thumbnail'):
         raise AttributeError('Model must have file and thumbnail file attributes.')
@@ -31,14 +224,23 @@ def generate_thumbnail(model):
     file = model.file
     name, ext = os.path.splitext(file.name)
 
-    if ext == '.pdf':
-        images = convert_from_path(os.path.join(settings.MEDIA_ROOT, file.name))
-        if images:
-            image = images[0]
-        else:
+    # the other derivative tasks of the file run in parallel and save their own fields
+    update_fields = ['thumbnail', 'thumbnail_signature', 'updated_at']
+    if model.is_video():
+        with Image.open(video.generate_poster(model)) as poster:
+            image = poster.convert('RGB')
+        update_fields.append('poster')
+    elif ext == '.pdf':
+        path = os.path.join(settings.MEDIA_ROOT, file.name)
+        info = get_pdf_info(path)
+        model.page_count = info['Pages']
+        update_fields.append('page_count')
+        image = render_pdf_page(path, 1, THUMB_SIZE, cover=True, info=info)
+        if image is None:
             return
-    elif ext in IMAGE_EXTS:
-        image = Image.open(os.path.join(settings.MEDIA_ROOT, file.name))
+    elif ext.lower() in IMAGE_EXTS:
+        generate_derivatives(model)
+        return
     else:
         return
 
@@ -47,43 +249,31 @@ def generate_thumbnail(model):
     image.thumbnail(THUMB_SIZE)
     image.save(out_buffer, 'JPEG')
     model.thumbnail = File(out_buffer, name=f'{name}_thumb.jpg')
-    model.save()
+    model.thumbnail_signature = get_thumbnail_signature()
+    model.save(update_fields=update_fields)
 
 
 def generate_preview(model):
     if not hasattr(model, 'file') or not hasattr(model, 'preview'):
         raise AttributeError('Model must have file and preview attributes')
 
-    # generate video preview
+    # errors are raised after logging, so that gen_previews reports the file as failed and counts it
     if model.is_video():
-        preview_path = generate_video_preview(model.file.name)
-        model.preview = preview_path
-        model.save()
+        try:
+            video.generate_video_preview(model)
+        except (OSError, video.VideoError) as error:
+            logger.error('Creating preview for %s failed: %s', model.file.name, error)
+            raise
     elif model.is_image():
         file = model.file
         name, ext = os.path.splitext(file.name)
 
-        if ext not in IMAGE_EXTS:
+        if ext.lower() not in IMAGE_EXTS:
             return
 
         try:
-            with Image.open(os.path.join(settings.MEDIA_ROOT, file.name)) as image:
-                out_buffer = BytesIO()
-                image.thumbnail(PREVIEW_SIZE)
-                image.save(out_buffer, 'JPEG')
-                model.preview = File(out_buffer, name=f'{name}_preview.jpg')
-                model.save()
-        except OSError:
-            print(f'Creating preview for {file.name} failed')
-
-
-def generate_video_preview(db_input_path):
-    input_name, ext = os.path.splitext(db_input_path)
-    db_output_path = input_name + '_preview.mp4'
-    input_path = os.path.join(settings.MEDIA_ROOT, db_input_path)
-    output_path = os.path.join(settings.MEDIA_ROOT, db_output_path)
-
-    ffmpeg_command = ['ffmpeg', '-i', input_path, '-vf', 'scale=-1:720', '-vcodec', 'libx264',
-                      '-profile:v', 'baseline', '-level', '3', output_path]
-    subprocess.run(ffmpeg_command, cwd=settings.BASE_DIR)
-    return db_output_path
+            generate_derivatives(model)
+        except OSError as error:
+            logger.error('Creating preview for %s failed: %s', file.name, error)
+            raise
+
@@ -1,11 +1,19 @@
+import hashlib
 import os
 import mimetypes
 
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
 
 def get_content_type(file):
-    _, ext = os.path.splitext(file.name)
+    return get_content_type_for_name(file.name)
+
 
-    mimetypes.init()
+def get_content_type_for_name(name):
+    _, ext = os.path.splitext(name)
+
+    if not mimetypes.inited:
+        mimetypes.init()
     ext = ext.lower()
 
     if ext in mimetypes.types_map:
@@ -15,3 +23,15 @@ def get_content_type(file):
         return 'application/wacz'
 
     return 'application/octet-stream'
+
+
+def get_checksum(chunks):
+    checksum = hashlib.sha256()
+    for chunk in chunks:
+        checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def read_chunks(path):
+    with open(path, 'rb') as file:
+        yield from iter(lambda: file.read(CHECKSUM_BLOCK_SIZE), b'')
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.shortcuts import redirect
 
-from archive import views, api
+from archive import views, api, oai, iiif
 
 urlpatterns = [
     path('', lambda req: redirect('/collections/')),
@@ -12,11 +12,15 @@ urlpatterns = [
     path('categories/<int:pk>/delete/', views.CategoryDeleteView.as_view(), name='category-delete'),
     path('collections/', views.CollectionListView.as_view(), name='collection-list'),
     path('collections/<int:pk>/', views.CollectionDetailView.as_view(), name='collection-detail'),
+    path('collections/<int:pk>/download/', views.download_collection, name='collection-download'),
+    path('collections/<int:pk>/records/', views.CollectionRecordsView.as_view(), name='collection-records'),
     path('collections/add/', views.CollectionCreateView.as_view(), name='collection-create'),
     path('collections/<int:pk>/edit/', views.CollectionUpdateView.as_view(), name='collection-update'),
     path('collections/<int:pk>/delete/', views.CollectionDeleteView.as_view(), name='collection-delete'),
     path('collections/<int:collection_id>/records/add/', views.RecordCreateView.as_view(), name='record-create'),
     path('collections/<int:collection_id>/records/<int:pk>/', views.RecordDetailView.as_view(), name='record-detail'),
+    path('collections/<int:collection_id>/records/<int:pk>/download/', views.download_record,
+         name='record-download'),
     path('collections/<int:collection_id>/records/<int:pk>/add-tag/', views.add_tag_view, name='record-add-tag'),
     path('collections/<int:collection_id>/records/<int:pk>/edit/', views.RecordUpdateView.as_view(),
          name='record-update'),
@@ -26,7 +30,23 @@ urlpatterns = [
          name='record-files-add'),
     path('collections/<int:collection_id>/records/<int:record_id>/files/<int:pk>/delete/',
          views.RecordFileDeleteView.as_view(), name='record-files-delete'),
+    path('collections/<int:collection_id>/records/<int:record_id>/files/<int:pk>/pages/<int:number>/',
+         views.record_file_page, name='record-files-page'),
     path('search/', views.search_view, name='search'),
     path('tags/add/', views.RecordTagCreateView.as_view(), name='tag-create'),
     path('tags/autocomplete/', api.tag_autocomplete, name='tag-autocomplete'),
+    path('api/collections/', api.collection_list, name='api-collection-list'),
+    path('api/collections/<int:pk>/', api.collection_detail, name='api-collection-detail'),
+    path('api/collections/<int:collection_id>/records/', api.record_list, name='api-record-list'),
+    path('api/collections/<int:collection_id>/records/<int:pk>/', api.record_detail, name='api-record-detail'),
+    path('api/collections/<int:collection_id>/records/<int:record_id>/files/', api.file_list,
+         name='api-file-list'),
+    path('api/collections/<int:collection_id>/records/<int:pk>/derivatives/', api.record_derivatives,
+         name='api-record-derivatives'),
+    path('api/tags/', api.tag_list, name='api-tag-list'),
+    path('oai/', oai.oai_view, name='oai'),
+    path('iiif/<int:pk>', iiif.base_view, name='iiif-base'),
+    path('iiif/<int:pk>/info.json', iiif.info_view, name='iiif-info'),
+    path('iiif/<int:pk>/<str:region>/<str:size>/<str:rotation>/<str:quality>.<str:image_format>', iiif.image_view,
+         name='iiif-image'),
 ]
@@ -0,0 +1,407 @@
+import json
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from archive.models import DerivativeJob
+from archive.signatures import get_signature
+
+# video and audio bitrate of every step of the HLS ladder by its height
+HLS_BITRATES = {
+    240: ('400k', '64k'),
+    360: ('800k', '96k'),
+    480: ('1400k', '128k'),
+    720: ('2800k', '128k'),
+    1080: ('5000k', '192k'),
+    1440: ('8000k', '192k'),
+    2160: ('14000k', '192k'),
+}
+HLS_SEGMENT_DURATION = 6
+HLS_DIR_SUFFIX = '_hls'
+HLS_MASTER_PLAYLIST = 'master.m3u8'
+PROGRESS_INTERVAL = 5
+# streams that every browser plays from an MP4 container
+WEB_VIDEO_PROFILES = {'Constrained Baseline', 'Baseline', 'Main', 'High'}
+WEB_AUDIO_CODECS = {'aac'}
+# what the preview of a video needs, from cheapest to most expensive
+REMUX = 'remux'
+AUDIO = 'audio'
+TRANSCODE = 'transcode'
+# the poster frame is taken a tenth into the video, to skip leaders and black frames at the start
+POSTER_POSITION = 0.1
+POSTER_MAX_OFFSET = 60
+STORYBOARD_DIR_SUFFIX = '_storyboard'
+STORYBOARD_TRACK = 'thumbnails.vtt'
+# frames per sprite sheet
+STORYBOARD_COLUMNS = 10
+STORYBOARD_ROWS = 10
+
+
+class VideoError(Exception):
+    pass
+
+
+def probe(path):
+    try:
+        result = subprocess.run(['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams',
+                                 path], capture_output=True, timeout=settings.VIDEO_PROBE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise VideoError(f'ffprobe timed out for {path}')
+    if result.returncode != 0:
+        raise VideoError(f'ffprobe failed for {path} with exit code {result.returncode}')
+    return json.loads(result.stdout)
+
+
+def get_stream(info, codec_type):
+    return next((stream for stream in info.get('streams', []) if stream.get('codec_type') == codec_type), None)
+
+
+def get_number(values, key, cast=float):
+    try:
+        return cast(values[key])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_duration(info):
+    return get_number(info.get('format', {}), 'duration')
+
+
+def inspect(record_file):
+    # stores the properties of the streams on the file and returns the complete ffprobe output
+    info = probe(os.path.join(settings.MEDIA_ROOT, record_file.file.name))
+    video_stream = get_stream(info, 'video') or {}
+    audio_stream = get_stream(info, 'audio') or {}
+    record_file.width = get_number(video_stream, 'width', int)
+    record_file.height = get_number(video_stream, 'height', int)
+    record_file.video_codec = video_stream.get('codec_name', '')
+    record_file.audio_codec = audio_stream.get('codec_name', '')
+    record_file.duration = get_duration(info)
+    record_file.bitrate = get_number(info.get('format', {}), 'bit_rate', int)
+    record_file.save(update_fields=['width', 'height', 'video_codec', 'audio_codec', 'duration', 'bitrate'])
+    return info
+
+
+def is_mp4(info):
+    # ffprobe names the same demuxer for MP4 and QuickTime files, the major brand of an MP4 is never QuickTime's
+    format_info = info.get('format', {})
+    major_brand = format_info.get('tags', {}).get('major_brand', '').strip()
+    return 'mp4' in format_info.get('format_name', '').split(',') and major_brand not in ['', 'qt']
+
+
+def is_web_video(info):
+    # streams every browser plays, in an MP4 or a QuickTime container; QuickTime files are included on purpose,
+    # their streams are copied into an MP4 preview without encoding them again
+    video_stream = get_stream(info, 'video')
+    if video_stream is None:
+        return False
+    return 'mp4' in info.get('format', {}).get('format_name', '').split(',') \
+        and video_stream.get('codec_name') == 'h264' and video_stream.get('profile') in WEB_VIDEO_PROFILES \
+        and video_stream.get('pix_fmt') == 'yuv420p' \
+        and video_stream.get('field_order', 'progressive') in ['progressive', 'unknown']
+
+
+def get_strategy(info):
+    # a web compatible MP4 that is small enough for the preview is only copied into a faststart file, if need be with
+    # the audio encoded again; everything else is transcoded to the HLS ladder
+    video_stream = get_stream(info, 'video')
+    bitrate = get_number(info.get('format', {}), 'bit_rate', int)
+    if not is_web_video(info) or (get_number(video_stream, 'height', int) or 0) > settings.VIDEO_PREVIEW_HEIGHT \
+            or (bitrate and bitrate > settings.VIDEO_REMUX_MAX_BITRATE):
+        return TRANSCODE
+    audio_stream = get_stream(info, 'audio')
+    if audio_stream is not None and audio_stream.get('codec_name') not in WEB_AUDIO_CODECS:
+        return AUDIO
+    return REMUX
+
+
+def parse_progress(lines, duration, callback):
+    # ffmpeg -progress writes key=value lines, out_time_us is the position in the output
+    for line in lines:
+        key, _, value = line.strip().partition('=')
+        if key == 'out_time_us' and value.isdigit() and duration:
+            callback(min(int(value) / 1_000_000 / duration, 1.0))
+        elif key == 'progress' and value == 'end':
+            callback(1.0)
+
+
+def run_ffmpeg(arguments, duration=None, progress=None):
+    command = ['ffmpeg', '-hide_banner', '-nostdin', '-loglevel', 'error', '-y', '-progress', 'pipe:1',
+               *arguments]
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, text=True,
+                                   cwd=settings.BASE_DIR)
+        timer = threading.Timer(settings.VIDEO_TIMEOUT, process.kill)
+        timer.start()
+        try:
+            parse_progress(process.stdout, duration, progress or (lambda fraction: None))
+        finally:
+            timer.cancel()
+            process.stdout.close()
+            return_code = process.wait()
+        if return_code != 0:
+            errors.seek(0)
+            message = errors.read()[-1000:].decode('utf-8', errors='replace').strip()
+            raise VideoError(f'ffmpeg failed with exit code {return_code}: {message}')
+
+
+class ProgressReporter:
+    # writes the progress of a transcode to its job, at most once per percent and PROGRESS_INTERVAL seconds
+
+    def __init__(self, record_file_id):
+        self.jobs = DerivativeJob.objects.filter(record_file_id=record_file_id, kind=DerivativeJob.Kind.TRANSCODE)
+        self.percent = -1
+        self.written_at = None
+
+    def __call__(self, fraction):
+        percent = int(fraction * 100)
+        now = time.monotonic()
+        if percent > self.percent and (self.written_at is None or now - self.written_at >= PROGRESS_INTERVAL):
+            self.percent = percent
+            self.written_at = now
+            self.jobs.update(progress=percent)
+
+
+def get_encoder_arguments():
+    # the worker pool provides the parallelism, so every ffmpeg call only gets a few threads
+    return ['-threads', str(settings.VIDEO_THREADS), '-c:v', 'libx264', '-preset', settings.VIDEO_PRESET,
+            '-profile:v', 'main', '-pix_fmt', 'yuv420p']
+
+
+def get_ladder(source_height):
+    # no upscaling, a source smaller than the lowest step is only packaged at its own height, as is every source if
+    # no configured height has a bitrate (see archive.E002)
+    heights = sorted(height for height in settings.VIDEO_HLS_HEIGHTS if height in HLS_BITRATES)
+    ladder = [height for height in heights if height <= source_height]
+    return ladder or [min(heights[:1] + [source_height - source_height % 2])]
+
+
+def get_hls_arguments(input_path, output_dir, ladder, has_audio):
+    # a single decode is split into all steps, the key frames are aligned with the segments so players can switch
+    # between the steps at every segment boundary
+    splits = ''.join(f'[v{index}]' for index in range(len(ladder)))
+    scales = ';'.join(f'[v{index}]scale=-2:{height}[v{index}out]' for index, height in enumerate(ladder))
+    arguments = ['-i', input_path, '-filter_complex', f'[0:v:0]split={len(ladder)}{splits};{scales}']
+    stream_map = []
+    for index, height in enumerate(ladder):
+        video_bitrate, audio_bitrate = HLS_BITRATES.get(height, HLS_BITRATES[min(HLS_BITRATES)])
+        arguments += ['-map', f'[v{index}out]', f'-b:v:{index}', video_bitrate, f'-maxrate:v:{index}', video_bitrate,
+                      f'-bufsize:v:{index}', f'{int(video_bitrate[:-1]) * 2}k']
+        if has_audio:
+            arguments += ['-map', '0:a:0', f'-b:a:{index}', audio_bitrate]
+        stream_map.append(f'v:{index},a:{index},name:{height}p' if has_audio else f'v:{index},name:{height}p')
+    arguments += [*get_encoder_arguments(), '-sc_threshold', '0',
+                  '-force_key_frames', f'expr:gte(t,n_forced*{HLS_SEGMENT_DURATION})']
+    if has_audio:
+        arguments += ['-c:a', 'aac', '-ac', '2']
+    arguments += ['-f', 'hls', '-hls_time', str(HLS_SEGMENT_DURATION), '-hls_playlist_type', 'vod',
+                  '-hls_flags', 'independent_segments', '-hls_segment_filename',
+                  os.path.join(output_dir, '%v', 'segment%04d.ts'), '-master_pl_name', HLS_MASTER_PLAYLIST,
+                  '-var_stream_map', ' '.join(stream_map), os.path.join(output_dir, '%v', 'index.m3u8')]
+    return arguments
+
+
+@contextmanager
+def build_directory(output_dir):
+    # files are written next to the final directory, which is only replaced once they are complete
+    build_dir = tempfile.mkdtemp(dir=os.path.dirname(output_dir))
+    try:
+        yield build_dir
+        os.chmod(build_dir, 0o755)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.rename(build_dir, output_dir)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+
+def get_hls_dir(record_file):
+    name, ext = os.path.splitext(record_file.file.name)
+    return f'{name}{HLS_DIR_SUFFIX}'
+
+
+def generate_hls(record_file, info, progress=None):
+    input_path = os.path.join(settings.MEDIA_ROOT, record_file.file.name)
+    video_stream = get_stream(info, 'video')
+    if video_stream is None:
+        raise VideoError(f'{record_file.file.name} has no video stream')
+
+    hls_dir = get_hls_dir(record_file)
+    # players never see a partial ladder
+    with build_directory(os.path.join(settings.MEDIA_ROOT, hls_dir)) as build_dir:
+        ladder = get_ladder(int(video_stream['height']))
+        run_ffmpeg(get_hls_arguments(input_path, build_dir, ladder, get_stream(info, 'audio') is not None),
+                   get_duration(info), progress)
+
+    record_file.hls_playlist = f'{hls_dir}/{HLS_MASTER_PLAYLIST}'
+    return ladder
+
+
+def get_variant_playlist(record_file, height):
+    return f'{os.path.dirname(record_file.hls_playlist)}/{height}p/index.m3u8'
+
+
+def is_faststart(path):
+    # walks the top level boxes of an MP4 until the first of moov (metadata) and mdat (media data)
+    with open(path, 'rb') as file:
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                return False
+            size, box_type = int.from_bytes(header[:4], 'big'), header[4:]
+            if box_type in [b'moov', b'mdat']:
+                return box_type == b'moov'
+            if size == 1:
+                size = int.from_bytes(file.read(8), 'big') - 8
+            elif size < 8:
+                return False
+            file.seek(size - 8, os.SEEK_CUR)
+
+
+def get_copy_arguments(input_path, output_path, strategy):
+    # the moov atom goes to the start, so that playback starts before the whole file is loaded
+    arguments = ['-i', input_path, '-map', '0:v:0', '-map', '0:a:0?', '-c:v', 'copy']
+    if strategy == AUDIO:
+        arguments += ['-threads', str(settings.VIDEO_THREADS), '-c:a', 'aac', '-b:a', '128k', '-ac', '2']
+    else:
+        arguments += ['-c:a', 'copy']
+    return arguments + ['-movflags', '+faststart', output_path]
+
+
+def get_preview_signature():
+    return get_signature(sorted(settings.VIDEO_HLS_HEIGHTS), settings.VIDEO_PREVIEW_HEIGHT, settings.VIDEO_PRESET,
+                         settings.VIDEO_REMUX_MAX_BITRATE, HLS_BITRATES, HLS_SEGMENT_DURATION)
+
+
+def generate_video_preview(record_file, progress=None):
+    info = inspect(record_file)
+    input_path = os.path.join(settings.MEDIA_ROOT, record_file.file.name)
+    name, ext = os.path.splitext(record_file.file.name)
+    preview_name = f'{name}_preview.mp4'
+    output_path = os.path.join(settings.MEDIA_ROOT, preview_name)
+
+    strategy = get_strategy(info)
+    if strategy == TRANSCODE:
+        # the video is encoded once for the HLS ladder, the MP4 preview for browsers without HLS support is a copy
+        # of one of its steps
+        ladder = generate_hls(record_file, info, progress)
+        height = max([height for height in ladder if height <= settings.VIDEO_PREVIEW_HEIGHT], default=ladder[0])
+        run_ffmpeg(['-i', os.path.join(settings.MEDIA_ROOT, get_variant_playlist(record_file, height)), '-c', 'copy',
+                    '-movflags', '+faststart', output_path])
+    elif strategy == REMUX and is_mp4(info) and is_faststart(input_path):
+        # small enough that a single progressive stream starts as fast as the ladder would, and already playable
+        preview_name = record_file.file.name
+        record_file.hls_playlist = ''
+    else:
+        run_ffmpeg(get_copy_arguments(input_path, output_path, strategy), get_duration(info), progress)
+        record_file.hls_playlist = ''
+
+    record_file.preview = preview_name
+    record_file.preview_signature = get_preview_signature()
+    record_file.save(update_fields=['preview', 'hls_playlist', 'preview_signature'])
+    return strategy
+
+
+def generate_poster(record_file):
+    # a full frame at the height of the preview, for the player and as the source of the thumbnail
+    info = inspect(record_file)
+    if get_stream(info, 'video') is None:
+        raise VideoError(f'{record_file.file.name} has no video stream')
+    duration = get_duration(info) or 0
+    name, ext = os.path.splitext(record_file.file.name)
+    poster_name = f'{name}_poster.jpg'
+    # the seek before the input jumps to the nearest key frame instead of decoding everything up to the position;
+    # interlaced frames, as from digitized tapes, are deinterlaced
+    run_ffmpeg(['-ss', f'{min(duration * POSTER_POSITION, POSTER_MAX_OFFSET):.3f}',
+                '-i', os.path.join(settings.MEDIA_ROOT, record_file.file.name), '-frames:v', '1',
+                '-vf', f'bwdif=deint=interlaced,scale=-2:min({settings.VIDEO_PREVIEW_HEIGHT}\\,ih)', '-q:v', '3',
+                '-threads', str(settings.VIDEO_THREADS), os.path.join(settings.MEDIA_ROOT, poster_name)])
+    record_file.poster = poster_name
+    return os.path.join(settings.MEDIA_ROOT, poster_name)
+
+
+def get_display_size(video_stream):
+    # digitized tapes often have non-square pixels, e.g. 720x576 with a sample aspect ratio of 16:15
+    width, height = int(video_stream['width']), int(video_stream['height'])
+    numerator, _, denominator = video_stream.get('sample_aspect_ratio', '1:1').partition(':')
+    if numerator.isdigit() and denominator.isdigit() and int(numerator) and int(denominator):
+        width = width * int(numerator) / int(denominator)
+    return width, height
+
+
+def get_frame_size(video_stream):
+    width, height = get_display_size(video_stream)
+    frame_width = settings.VIDEO_STORYBOARD_WIDTH
+    return frame_width, max(2, round(frame_width * height / width / 2) * 2)
+
+
+def format_timestamp(seconds):
+    milliseconds = round(seconds * 1000)
+    return f'{milliseconds // 3_600_000:02}:{milliseconds // 60_000 % 60:02}:{milliseconds // 1000 % 60:02}.' \
+           f'{milliseconds % 1000:03}'
+
+
+def get_sprite_name(number):
+    return f'sprite{number:03}.jpg'
+
+
+def get_storyboard_track(frame_count, duration, interval, frame_size):
+    # a WebVTT cue per frame that points to its area of a sprite sheet with a media fragment
+    frames_per_sheet = STORYBOARD_COLUMNS * STORYBOARD_ROWS
+    width, height = frame_size
+    lines = ['WEBVTT', '']
+    for index in range(frame_count):
+        position, sheet = index % frames_per_sheet, index // frames_per_sheet + 1
+        x, y = position % STORYBOARD_COLUMNS * width, position // STORYBOARD_COLUMNS * height
+        lines += [f'{format_timestamp(index * interval)} --> {format_timestamp(min((index + 1) * interval, duration))}',
+                  f'{get_sprite_name(sheet)}#xywh={x},{y},{width},{height}', '']
+    return '\n'.join(lines)
+
+
+def get_storyboard_arguments(input_path, output_dir, interval, frame_size):
+    # only key frames are decoded, which is a fraction of the work of decoding every frame and close enough for
+    # skimming; the tile filter starts a new sheet whenever one is full
+    return ['-skip_frame', 'nokey', '-i', input_path, '-an', '-sn', '-threads', str(settings.VIDEO_THREADS),
+            '-vf', f'fps=1/{interval},scale={frame_size[0]}:{frame_size[1]},'
+                   f'tile={STORYBOARD_COLUMNS}x{STORYBOARD_ROWS}',
+            '-q:v', '4', os.path.join(output_dir, 'sprite%03d.jpg')]
+
+
+def get_storyboard_dir(record_file):
+    name, ext = os.path.splitext(record_file.file.name)
+    return f'{name}{STORYBOARD_DIR_SUFFIX}'
+
+
+def generate_storyboard(record_file):
+    # sprite sheets with a frame every VIDEO_STORYBOARD_INTERVAL seconds and a WebVTT track that maps the time of
+    # the video to the frames, all from a single ffmpeg pass
+    info = probe(os.path.join(settings.MEDIA_ROOT, record_file.file.name))
+    video_stream = get_stream(info, 'video')
+    duration = get_duration(info)
+    if video_stream is None or not duration:
+        raise VideoError(f'{record_file.file.name} has no video stream or duration')
+
+    interval = settings.VIDEO_STORYBOARD_INTERVAL
+    frame_size = get_frame_size(video_stream)
+    storyboard_dir = get_storyboard_dir(record_file)
+    with build_directory(os.path.join(settings.MEDIA_ROOT, storyboard_dir)) as build_dir:
+        run_ffmpeg(get_storyboard_arguments(os.path.join(settings.MEDIA_ROOT, record_file.file.name), build_dir,
+                                            interval, frame_size), duration)
+        sheet_count = len([name for name in os.listdir(build_dir) if name.startswith('sprite')])
+        if not sheet_count:
+            raise VideoError(f'ffmpeg wrote no sprite sheets for {record_file.file.name}')
+        # the cues never point past the last sheet, even if ffmpeg emitted fewer frames than the duration suggests
+        frame_count = min(math.ceil(duration / interval), sheet_count * STORYBOARD_COLUMNS * STORYBOARD_ROWS)
+        with open(os.path.join(build_dir, STORYBOARD_TRACK), 'w') as file:
+            file.write(get_storyboard_track(frame_count, duration, interval, frame_size))
+
+    record_file.storyboard = f'{storyboard_dir}/{STORYBOARD_TRACK}'
+    record_file.save(update_fields=['storyboard'])
+    return record_file.storyboard
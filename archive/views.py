@@ -1,19 +1,32 @@
+from django.conf import settings
 from django.urls import reverse_lazy
 from django.shortcuts import render
 from django.views.generic import ListView, DetailView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.shortcuts import get_object_or_404
+from django.core.files.storage import default_storage
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.utils.translation import gettext as _
-from django.http import HttpResponseRedirect, HttpResponseNotAllowed, HttpResponseBadRequest
-from django.db.models import Q
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect, HttpResponseNotAllowed, \
+    HttpResponseBadRequest, StreamingHttpResponse
+from django.core.paginator import Paginator
 from django.contrib.auth.decorators import permission_required, login_required
+from django.utils.decorators import method_decorator
 
-from archive.models import RecordCategory, Collection, Record, RecordFile, RecordTag
+from archive import search
+from archive.models import RecordCategory, Collection, DerivativeJob, Record, RecordFile, RecordTag
 from archive.forms import RecordFileForm, RecordTagForm
-from archive.upload_helper import get_content_type
+from archive.upload_helper import get_content_type, get_checksum
+from archive.cache import FacetCache, get_tag_generation
+from archive.conditional import conditional_page, collection_list_state, collection_detail_state, \
+    record_detail_state, search_state
 from archive.filters import RecordFilter
-from archive.tasks import generate_preview
+from archive.pagination import KeysetPaginator
+from archive.tasks import queue_derivatives, queue_page_preview
+from archive.jobs import get_pending
+from archive.downloads import stream_zip, get_archive_name
+from archive.thumbnails import get_page_preview_name
 
 
 class CategoryListView(LoginRequiredMixin, ListView):
@@ -64,6 +77,7 @@ class CategoryDeleteView(PermissionRequiredMixin, DeleteView):
         return context
 
 
+@method_decorator(conditional_page(collection_list_state), name='dispatch')
 class CollectionListView(ListView):
     model = Collection
 
@@ -73,6 +87,19 @@ class CollectionListView(ListView):
         return Collection.objects.all()
 
 
+RECORD_SORT_OPTIONS = {
+    'origin_date': _('Date of origin'),
+    '-origin_date': _('Date of origin (newest first)'),
+    'title': _('Title'),
+    '-title': _('Title (descending)'),
+    'created_at': _('Created at'),
+    '-created_at': _('Created at (newest first)'),
+    'updated_at': _('Updated at'),
+    '-updated_at': _('Updated at (newest first)'),
+}
+
+
+@method_decorator(conditional_page(collection_detail_state), name='dispatch')
 class CollectionDetailView(DetailView):
     model = Collection
 
@@ -81,11 +108,29 @@ class CollectionDetailView(DetailView):
 
         if self.request.user.is_authenticated:
             queryset = Record.objects.filter(collection=context['collection'])
+            visibility = 'authenticated'
         else:
             queryset = Record.objects.filter(collection=context['collection'], public=True)
-
-        context['record_filter'] = RecordFilter(self.request.GET,
-                                                queryset=queryset)
+            visibility = 'public'
+        queryset = queryset.select_related('cover_file')
+
+        facet_cache = FacetCache(context['collection'].pk, visibility)
+        record_filter = RecordFilter(self.request.GET, queryset=queryset, facet_cache=facet_cache)
+
+        sort = self.request.GET.get('sort')
+        if sort not in RECORD_SORT_OPTIONS:
+            sort = Record._meta.ordering[0]
+        paginator = KeysetPaginator(record_filter.qs, sort, settings.RECORDS_PER_PAGE)
+        page = paginator.get_page(self.request.GET.get('cursor'))
+
+        context['record_filter'] = record_filter
+        context['sort'] = sort
+        context['sort_options'] = RECORD_SORT_OPTIONS.items()
+        context['page'] = page
+        if page.has_next():
+            query = self.request.GET.copy()
+            query['cursor'] = page.next_cursor
+            context['next_query'] = query.urlencode()
         return context
 
     def get_queryset(self):
@@ -94,6 +139,16 @@ class CollectionDetailView(DetailView):
         return Collection.objects.all()
 
 
+class CollectionRecordsView(CollectionDetailView):
+    template_name = 'archive/record_cards.html'
+
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        if 'next_query' in context:
+            response['X-Next-Query'] = context['next_query']
+        return response
+
+
 class CollectionCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
     model = Collection
     fields = ['name', 'description', 'public']
@@ -108,7 +163,7 @@ class CollectionCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateVi
 
 class CollectionUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     model = Collection
-    fields = ['name', 'description', 'public']
+    fields = ['name', 'description', 'public', 'storage_quota_bytes']
     template_name = 'generic_form.html'
     permission_required = 'archive.change_collection'
 
@@ -130,6 +185,7 @@ class CollectionDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteVi
         return context
 
 
+@method_decorator(conditional_page(record_detail_state), name='dispatch')
 class RecordDetailView(DetailView):
     model = Record
 
@@ -137,13 +193,21 @@ class RecordDetailView(DetailView):
         context = super().get_context_data(**kwargs)
         context['file_form'] = RecordFileForm()
         context['tag_form'] = RecordTagForm()
+        # renamed or deleted tags change the cached record details
+        context['tag_generation'] = get_tag_generation()
+        # the page polls the state of derivatives that are still generated and reloads once they are done
+        context['derivatives_pending'] = DerivativeJob.objects.filter(get_pending(),
+                                                                      record_file__record=self.object).exists()
+        context['derivative_status_poll_interval'] = settings.DERIVATIVE_STATUS_POLL_INTERVAL
         return context
 
     def get_queryset(self):
         if not self.request.user or not self.request.user.is_authenticated:
-            return Record.objects.filter(collection_id=self.kwargs['collection_id'], collection__public=True,
-                                         public=True)
-        return Record.objects.filter(collection_id=self.kwargs['collection_id'])
+            queryset = Record.objects.filter(collection_id=self.kwargs['collection_id'], collection__public=True,
+                                             public=True)
+        else:
+            queryset = Record.objects.filter(collection_id=self.kwargs['collection_id'])
+        return queryset.select_related('category', 'collection')
 
 
 class RecordCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
@@ -215,18 +279,62 @@ class RecordTagCreateView(LoginRequiredMixin, CreateView):
         return context
 
 
+@conditional_page(search_state)
 def search_view(request):
     q = request.GET.get('q')
 
     if not q:
         return render(request, 'archive/search.html', {'error': _('Search query is required')})
 
-    queryset = Record.objects.filter(Q(title__icontains=q) | Q(description__icontains=q))
+    public_only = not request.user or not request.user.is_authenticated
+    results = search.get_backend().search(q, public_only=public_only)
+    page = Paginator(results, settings.SEARCH_RESULTS_PER_PAGE).get_page(request.GET.get('page'))
+
+    return render(request, 'archive/search.html', {'records': page, 'q': q})
+
+
+def zip_response(records, name):
+    response = StreamingHttpResponse(stream_zip(records), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{get_archive_name(name)}"'
+    return response
+
+
+def download_collection(request, pk):
+    # same visibility as CollectionDetailView
+    if request.user.is_authenticated:
+        collection = get_object_or_404(Collection, pk=pk)
+        records = Record.objects.filter(collection=collection)
+    else:
+        collection = get_object_or_404(Collection, pk=pk, public=True)
+        records = Record.objects.filter(collection=collection, public=True)
+    return zip_response(records, collection.name)
+
+
+def download_record(request, collection_id, pk):
+    records = Record.objects.filter(collection_id=collection_id, pk=pk)
+    if not request.user.is_authenticated:
+        records = records.filter(collection__public=True, public=True)
+    record = get_object_or_404(records)
+    return zip_response(records, record.title)
+
 
-    if not request.user or not request.user.is_authenticated:
-        queryset = queryset.filter(public=True, collection__public=True)
+def record_file_page(request, collection_id, record_id, pk, number):
+    # same visibility as RecordDetailView
+    record_files = RecordFile.objects.filter(pk=pk, record_id=record_id, record__collection_id=collection_id)
+    if not request.user.is_authenticated:
+        record_files = record_files.filter(record__public=True, record__collection__public=True)
+    record_file = get_object_or_404(record_files)
+    if not record_file.is_paged() or not 1 <= number <= record_file.page_count:
+        raise Http404()
 
-    return render(request, 'archive/search.html', {'records': queryset, 'q': q})
+    preview_name = get_page_preview_name(record_file, number)
+    if default_storage.exists(preview_name):
+        return HttpResponseRedirect(default_storage.url(preview_name))
+    # rendering a page takes up to PDF_RENDER_TIMEOUT, so it happens in a worker while the page viewer retries
+    queue_page_preview(record_file.pk, number)
+    response = HttpResponse(status=202)
+    response['Retry-After'] = '1'
+    return response
 
 
 def add_tag_view(request, collection_id, pk):
@@ -252,6 +360,14 @@ def upload_record_file(request, collection_id, record_id):
             file = form.cleaned_data['file']
             form.instance.content_type = get_content_type(file)
             form.instance.record = record
-            form.save()
-            generate_preview.delay(form.instance.pk)
+            form.instance.size_bytes = file.size
+            form.instance.checksum = get_checksum(file.chunks())
+            with transaction.atomic():
+                # the collection row is locked, so concurrent uploads can't exceed the quota together
+                collection = Collection.objects.select_for_update().get(pk=record.collection_id)
+                if collection.storage_quota_bytes is not None and \
+                        collection.bytes_total + file.size > collection.storage_quota_bytes:
+                    return HttpResponse(_('The storage quota of this collection is exceeded.'), status=413)
+                form.save()
+            queue_derivatives(form.instance)
             return HttpResponseRedirect(record.get_absolute_url())
@@ -71,6 +71,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.media',
+                'archive.context_processors.fragment_cache',
             ],
         },
     },
@@ -87,6 +88,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# Shared by the web and Celery processes, e.g. redis://localhost:6379/1; locmem only works for development
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+
+FACET_CACHE_TIMEOUT = env.int('FACET_CACHE_TIMEOUT', default=60 * 60)
+# Template fragments are keyed on modification times, the timeout only bounds how long stale entries are kept
+FRAGMENT_CACHE_TIMEOUT = env.int('FRAGMENT_CACHE_TIMEOUT', default=24 * 60 * 60)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -144,10 +158,116 @@ LOCALE_PATHS = ['locale/']
 MEDIA_ROOT = env('MEDIA_ROOT')
 MEDIA_URL = env('MEDIA_URL')
 
+RECORDS_PER_PAGE = env.int('RECORDS_PER_PAGE', default=48)
+
+# Full text search backend, chosen by database vendor if empty
+SEARCH_BACKEND = env('SEARCH_BACKEND', default='')
+# Text search configuration used by the PostgreSQL backend
+SEARCH_CONFIG = env('SEARCH_CONFIG', default='simple')
+SEARCH_RESULTS_PER_PAGE = env.int('SEARCH_RESULTS_PER_PAGE', default=25)
+# Maximum number of characters of extracted file text indexed per record
+SEARCH_MAX_CONTENT_LENGTH = env.int('SEARCH_MAX_CONTENT_LENGTH', default=1000000)
+
+# Maximum number of tags returned by the autocomplete endpoint and how long clients may cache them
+TAG_AUTOCOMPLETE_LIMIT = env.int('TAG_AUTOCOMPLETE_LIMIT', default=10)
+TAG_AUTOCOMPLETE_MAX_AGE = env.int('TAG_AUTOCOMPLETE_MAX_AGE', default=60)
+
+# Default and maximum page size of the JSON API and the number of objects per query when a list is streamed as NDJSON
+API_PAGE_SIZE = env.int('API_PAGE_SIZE', default=50)
+API_MAX_PAGE_SIZE = env.int('API_MAX_PAGE_SIZE', default=500)
+API_STREAM_CHUNK_SIZE = env.int('API_STREAM_CHUNK_SIZE', default=500)
+
+# OAI-PMH repository description, identifiers are oai:<OAI_REPOSITORY_IDENTIFIER>:record/<id>
+OAI_REPOSITORY_NAME = env('OAI_REPOSITORY_NAME', default='Community Archive')
+OAI_REPOSITORY_IDENTIFIER = env('OAI_REPOSITORY_IDENTIFIER', default='localhost')
+OAI_ADMIN_EMAIL = env('OAI_ADMIN_EMAIL', default='admin@localhost')
+# Records per ListRecords or ListIdentifiers response
+OAI_PAGE_SIZE = env.int('OAI_PAGE_SIZE', default=100)
+
+# Longest side in pixels of the scaled copies generated for every image, the largest one is the preview
+IMAGE_RENDITION_WIDTHS = env.list('IMAGE_RENDITION_WIDTHS', cast=int, default=[200, 400, 800, 1600, 2000])
+# Formats written next to every JPEG rendition if Pillow supports them (webp, avif)
+IMAGE_RENDITION_FORMATS = env.list('IMAGE_RENDITION_FORMATS', default=['avif', 'webp'])
+
+# IIIF Image API: tile pyramids and rendered images are kept outside of MEDIA_ROOT, so that they are only served with
+# the visibility checks of the views; images with a longer side than IIIF_TILE_MIN_SIZE get a pyramid
+IIIF_ROOT = env('IIIF_ROOT', default=os.path.join(BASE_DIR, 'iiif'))
+IIIF_TILE_SIZE = env.int('IIIF_TILE_SIZE', default=256)
+IIIF_TILE_MIN_SIZE = env.int('IIIF_TILE_MIN_SIZE', default=2000)
+IIIF_MAX_AREA = env.int('IIIF_MAX_AREA', default=16_000_000)
+IIIF_CACHE_MAX_BYTES = env.int('IIIF_CACHE_MAX_BYTES', default=5 * 1024 ** 3)
+IIIF_MAX_AGE = env.int('IIIF_MAX_AGE', default=24 * 60 * 60)
+
+# Time limit in seconds and maximum size in pixels of a rendered PDF page
+PDF_RENDER_TIMEOUT = env.int('PDF_RENDER_TIMEOUT', default=60)
+PDF_MAX_PIXELS = env.int('PDF_MAX_PIXELS', default=16_000_000)
+
+# Video transcoding: time limit in seconds of a single ffmpeg call, encoder threads per call and x264 preset
+VIDEO_TIMEOUT = env.int('VIDEO_TIMEOUT', default=4 * 60 * 60)
+VIDEO_PROBE_TIMEOUT = env.int('VIDEO_PROBE_TIMEOUT', default=60)
+VIDEO_THREADS = env.int('VIDEO_THREADS', default=2)
+VIDEO_PRESET = env('VIDEO_PRESET', default='veryfast')
+# Heights of the HLS ladder, a video is only packaged at the heights up to its own
+VIDEO_HLS_HEIGHTS = env.list('VIDEO_HLS_HEIGHTS', cast=int, default=[360, 720, 1080])
+# Height of the MP4 preview for browsers without HLS support, copied from the nearest step of the ladder; H.264 MP4s up
+# to this height and VIDEO_REMUX_MAX_BITRATE (bits per second) are not transcoded, only copied
+VIDEO_PREVIEW_HEIGHT = env.int('VIDEO_PREVIEW_HEIGHT', default=720)
+VIDEO_REMUX_MAX_BITRATE = env.int('VIDEO_REMUX_MAX_BITRATE', default=8_000_000)
+# Seconds between the frames of the storyboard sprite sheets and their width in pixels
+VIDEO_STORYBOARD_INTERVAL = env.int('VIDEO_STORYBOARD_INTERVAL', default=10)
+VIDEO_STORYBOARD_WIDTH = env.int('VIDEO_STORYBOARD_WIDTH', default=160)
+
+TEXT_EXTRACTION_TIMEOUT = env.int('TEXT_EXTRACTION_TIMEOUT', default=10 * 60)
+
+# Tesseract language codes joined by '+'
+OCR_LANGUAGES = env('OCR_LANGUAGES', default='deu+eng')
+OCR_DPI = env.int('OCR_DPI', default=300)
+# Timeout in seconds for rendering and recognizing a single page
+OCR_TIMEOUT = env.int('OCR_TIMEOUT', default=5 * 60)
+OCR_PAGES_PER_TASK = env.int('OCR_PAGES_PER_TASK', default=20)
+
 CELERY_TIMEZONE = env('TIME_ZONE')
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_BROKER_URL = env('CELERY_BROKER_URL')
+# Derivative work is split by kind of file, every queue gets its own worker node with its own concurrency in
+# celery.service, so a long video never delays image thumbnails
+DERIVATIVE_QUEUES = {
+    'image': env('CELERY_IMAGE_QUEUE', default='image'),
+    'pdf': env('CELERY_PDF_QUEUE', default='pdf'),
+    'video': env('CELERY_VIDEO_QUEUE', default='video'),
+    'text': env('CELERY_TEXT_QUEUE', default='text'),
+    'ocr': env('CELERY_OCR_QUEUE', default='ocr'),
+}
+CELERY_TASK_ROUTES = {
+    'archive.tasks.generate_preview': {'queue': DERIVATIVE_QUEUES['image']},
+    'archive.tasks.generate_image_derivatives': {'queue': DERIVATIVE_QUEUES['image']},
+    'archive.tasks.build_tiles': {'queue': DERIVATIVE_QUEUES['image']},
+    'archive.tasks.generate_pdf_derivatives': {'queue': DERIVATIVE_QUEUES['pdf']},
+    'archive.tasks.render_page_preview': {'queue': DERIVATIVE_QUEUES['pdf']},
+    'archive.tasks.generate_video_thumbnail': {'queue': DERIVATIVE_QUEUES['video']},
+    'archive.tasks.transcode_video': {'queue': DERIVATIVE_QUEUES['video']},
+    'archive.tasks.generate_storyboard': {'queue': DERIVATIVE_QUEUES['video']},
+    'archive.tasks.extract_text': {'queue': DERIVATIVE_QUEUES['text']},
+    'archive.tasks.ocr_record_file': {'queue': DERIVATIVE_QUEUES['ocr']},
+}
+# Message priorities of uploads and of backfills by management commands; with Redis 0 is the highest priority, with
+# RabbitMQ the queues need x-max-priority and the larger number wins
+TASK_PRIORITY_INTERACTIVE = env.int('TASK_PRIORITY_INTERACTIVE', default=0)
+TASK_PRIORITY_BACKFILL = env.int('TASK_PRIORITY_BACKFILL', default=9)
+CELERY_BROKER_TRANSPORT_OPTIONS = {'priority_steps': list(range(10))}
+# Derivative tasks run for minutes, so every worker process reserves only the task it works on, and processes are
+# replaced regularly to return the memory of large decodes
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_WORKER_MAX_TASKS_PER_CHILD = env.int('CELERY_WORKER_MAX_TASKS_PER_CHILD', default=50)
+# Failed derivative jobs are retried after DERIVATIVE_JOB_RETRY_DELAY seconds, doubled with every attempt; jobs queued
+# for longer than DERIVATIVE_JOB_STALE_AFTER seconds, or running for longer than the time limit of their task, are
+# considered lost and may be queued again
+DERIVATIVE_JOB_MAX_ATTEMPTS = env.int('DERIVATIVE_JOB_MAX_ATTEMPTS', default=3)
+DERIVATIVE_JOB_RETRY_DELAY = env.int('DERIVATIVE_JOB_RETRY_DELAY', default=60)
+DERIVATIVE_JOB_STALE_AFTER = env.int('DERIVATIVE_JOB_STALE_AFTER', default=24 * 60 * 60)
+# Seconds between two requests of the record page for the state of derivative jobs
+DERIVATIVE_STATUS_POLL_INTERVAL = env.int('DERIVATIVE_STATUS_POLL_INTERVAL', default=3)
 
 LOGGING = {
     'version': 1,